@@ -13,26 +13,36 @@ app.py — 单文件云盘示例，含分享链接（30 天有效）
 
 import os
 import re
-import shutil
+import bisect
 from datetime import datetime
 from flask import (
-    Flask, request, redirect, url_for, send_from_directory,
-    abort, jsonify, render_template_string, flash, safe_join
+    Flask, request, redirect, url_for,
+    abort, jsonify, render_template, flash, safe_join
 )
+from jinja2 import DictLoader
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import (
     LoginManager, UserMixin, login_user,
     login_required, logout_user, current_user
 )
-from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as TimedSerializer, \
     BadSignature, SignatureExpired
 
+import cache
+import jobs
+import listing
+import passwords
+import pathindex
+import resumable
+import serving
+
 # ----------------------------
 # 配置
 # ----------------------------
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_ROOT = os.path.join(BASE_DIR, 'uploads')
+CACHE_DB = os.path.join(BASE_DIR, 'cache.db')  # 多 worker 共享缓存
+USER_CACHE_TTL = 300                           # 登录用户身份缓存（秒）
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
 
 app = Flask(__name__)
@@ -53,6 +63,7 @@ share_serializer = TimedSerializer(app.config['SECRET_KEY'], expires_in=2592000)
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+hasher = passwords.PasswordHasher.from_config(app.config)  # PASSWORD_SCHEME / PASSWORD_COST
 
 # ----------------------------
 # 简单文件名过滤（保留中英文、数字、点、下划线、连字符、空格）
@@ -69,15 +80,38 @@ def sanitize_filename(filename: str) -> str:
 class User(UserMixin, db.Model):
     id       = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
 
 @app.before_first_request
 def init_db():
     db.create_all()
 
+# ----------------------------
+# 用户身份缓存：每个已登录请求都会 load_user，命中时不查库
+# ----------------------------
+user_cache = cache.from_env(CACHE_DB, ttl=USER_CACHE_TTL)
+
+def forget_user(user_id):
+    """修改密码 / 删除用户后调用，所有 worker 立即丢弃该用户的缓存身份"""
+    user_cache.invalidate(_user_key(user_id))
+
+def _user_key(user_id):
+    # v2：旧格式的缓存项里带着密码哈希，换个键让它们直接作废
+    return 'fm.user.v2:%s' % user_id
+
+def _fetch_user(user_id):
+    # 只缓存身份，不缓存密码哈希；登录 / 升级哈希时直接查库
+    user = User.query.get(user_id)
+    return (user.id, user.username) if user else None
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    row = user_cache.get_or_load(_user_key(user_id), lambda: _fetch_user(user_id))
+    if row is None:
+        return None
+    # 不挂到 session 上的普通对象，只用于 current_user 的属性读取
+    return User(id=row[0], username=row[1])
 
 # ----------------------------
 # 当前用户根目录帮助
@@ -87,6 +121,19 @@ def user_base():
     os.makedirs(path, exist_ok=True)
     return path
 
+# ----------------------------
+# 文件名查找：每个用户一个索引（uploads/<用户 id> 整棵树），接口 /api/find?q=
+# ----------------------------
+path_index = pathindex.PathIndex(os.path.join(BASE_DIR, '.pathindex'), UPLOAD_ROOT,
+                                 partitioned=True)
+app.register_blueprint(pathindex.create_blueprint(
+    path_index, partition=lambda: current_user.id, guard=login_required))
+
+def touched(*paths):
+    """文件 / 目录改动之后：目录缓存失效，文件名索引刷新"""
+    listing.cache.touch(*paths)
+    path_index.touch(*paths)
+
 # ----------------------------
 # 注册 / 登录 / 登出
 # ----------------------------
@@ -100,12 +147,12 @@ def register():
         elif User.query.filter_by(username=u).first():
             flash('用户名已存在', 'danger')
         else:
-            user = User(username=u, password=generate_password_hash(p))
+            user = User(username=u, password=hasher.generate(p))
             db.session.add(user)
             db.session.commit()
             flash('注册成功，请登录', 'success')
             return redirect(url_for('login'))
-    return render_template_string(TPL_BASE, body=TPL_REGISTER)
+    return render_template('register.html')
 
 @app.route('/login', methods=['GET','POST'])
 def login():
@@ -113,11 +160,17 @@ def login():
         u = request.form['username'].strip()
         p = request.form['password']
         user = User.query.filter_by(username=u).first()
-        if user and check_password_hash(user.password, p):
+        ok, new_hash = hasher.check(user.password, p) if user else (False, None)
+        if ok:
+            if new_hash:
+                # 哈希方案 / 强度变了：登录成功时顺便升级
+                user.password = new_hash
+                db.session.commit()
+                forget_user(user.id)
             login_user(user)
             return redirect(url_for('index'))
         flash('用户名或密码错误', 'danger')
-    return render_template_string(TPL_BASE, body=TPL_LOGIN)
+    return render_template('login.html')
 
 @app.route('/logout')
 @login_required
@@ -131,34 +184,82 @@ def logout():
 @app.route('/')
 @login_required
 def index():
-    return render_template_string(TPL_BASE, body=TPL_INDEX)
+    return render_template('index.html')
 
 # ----------------------------
-# API：目录树（返回整棵树，前端按需渲染）
+# API：目录树（按层懒加载，支持游标分页与深度限制）
 # ----------------------------
+TREE_PAGE_SIZE = 200    # 每页默认条目数
+TREE_MAX_PAGE  = 1000   # 单页上限
+TREE_MAX_DEPTH = 3      # 一次最多展开的层数
+
+def _count_children(dirpath):
+    # 只数目录项、不 stat，也不进目录缓存：一页上千个子目录时，
+    # 不为了一个数字缓存上千份列表、挂上千个 inotify watch
+    try:
+        with os.scandir(dirpath) as it:
+            return sum(1 for _ in it)
+    except OSError:
+        return 0
+
+def _tree_level(dirpath, rel, cursor='', limit=TREE_PAGE_SIZE, depth=1):
+    # 整层只读目录项（走目录缓存，文件夹在前、各自按名称，整理好的列表直接切片），只对当前页的条目 stat
+    # 游标为 "d/名称" 或 "f/名称"：上一页最后一条是文件夹还是文件，分页跨过两段时顺序不变
+    entries, names, n_dirs = listing.cache.dirs_first(dirpath, stat=False)
+    start = 0
+    if cursor:
+        kind, _, name = cursor.partition('/')
+        if kind == 'd':
+            start = bisect.bisect_right(names, name, 0, n_dirs)
+        else:
+            start = bisect.bisect_right(names, name, n_dirs, len(names))
+    page = entries[start:start + limit]
+    nodes = []
+    for e in page:
+        full = os.path.join(dirpath, e.name)
+        try:
+            e = listing.with_stat(dirpath, e)
+        except OSError:
+            continue
+        node = {
+            'id':      os.path.join(rel, e.name).replace('\\','/'),
+            'text':    e.name,
+            'is_dir':  e.is_dir,
+            'size':    e.size,
+            'mtime':   datetime.fromtimestamp(e.mtime).strftime('%Y-%m-%d %H:%M'),
+        }
+        if e.is_dir:
+            count = _count_children(full)
+            node['child_count'] = count
+            node['has_children'] = count > 0
+            if depth > 1 and count:
+                node['children'], node['next'] = _tree_level(
+                    full, node['id'], limit=limit, depth=depth - 1)
+        nodes.append(node)
+    if start + limit >= len(entries) or not page:
+        return nodes, None
+    last = page[-1]
+    return nodes, ('d/' if last.is_dir else 'f/') + last.name
+
 @app.route('/api/tree')
 @login_required
 def api_tree():
-    base = user_base()
-    def walk(dirpath, rel=''):
-        items = []
-        for name in sorted(os.listdir(dirpath)):
-            full = os.path.join(dirpath, name)
-            stat = os.stat(full)
-            node = {
-                'id':      os.path.join(rel, name).replace('\\','/'),
-                'text':    name,
-                'size':    stat.st_size,
-                'mtime':   datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M'),
-                'children': []
-            }
-            if os.path.isdir(full):
-                node['children'] = walk(full, node['id'])
-            items.append(node)
-        return items
-
-    tree = [{'id':'', 'text':'根', 'children': walk(base)}]
-    return jsonify(tree)
+    """
+    返回某一层目录的内容（而不是整棵树）：
+      path   — 相对用户根目录的路径，默认根
+      cursor — 上一页返回的 next（不透明），按先文件夹后文件、各自按名称续传
+      limit  — 每页条目数（<= TREE_MAX_PAGE）
+      depth  — 向下展开的层数（<= TREE_MAX_DEPTH），子目录只带首页
+    """
+    rel    = request.args.get('path', '').strip('/')
+    cursor = request.args.get('cursor', '')
+    limit  = max(1, min(request.args.get('limit', TREE_PAGE_SIZE, type=int), TREE_MAX_PAGE))
+    depth  = max(1, min(request.args.get('depth', 1, type=int), TREE_MAX_DEPTH))
+    full = safe_join(user_base(), rel)
+    if not full or not os.path.isdir(full):
+        abort(404)
+    nodes, nxt = _tree_level(full, rel, cursor, limit, depth)
+    return jsonify({'id': rel, 'children': nodes, 'next': nxt})
 
 # ----------------------------
 # API：上传 / 下载
@@ -176,17 +277,39 @@ def api_upload():
         abort(400, '目标目录不存在')
     dest = os.path.join(base, filename)
     f.save(dest)
+    touched(dest)
     return 'OK', 200
 
+# 大文件走分片断点续传（/resumable/...），不受 MAX_CONTENT_LENGTH 限制
+def resumable_target(rel, filename):
+    base = safe_join(user_base(), rel.lstrip('/'))
+    if not base or not os.path.isdir(base):
+        raise ValueError('目标目录不存在')
+    return os.path.join(base, sanitize_filename(filename))
+
+app.register_blueprint(resumable.create_blueprint(
+    resumable.ResumableStore(os.path.join(BASE_DIR, '.resumable')), resumable_target,
+    guard=login_required, owner=lambda: current_user.id,
+    on_complete=touched))
+
+# 删除 / 复制 / 打包大目录放到后台任务里执行，接口立即返回任务 id（进度见 /jobs/<id>）
+job_queue = jobs.JobQueue(os.path.join(BASE_DIR, 'jobs.db'), name='fm',
+                          on_change=touched)
+app.register_blueprint(jobs.create_blueprint(
+    job_queue, guard=login_required, owner=lambda: current_user.id))
+
+def _job_started(kind, **params):
+    job_id = job_queue.submit(current_user.id, kind, **params)
+    return jsonify({'ok': True, 'job': job_id}), 202
+
 @app.route('/api/download')
 @login_required
 def api_download():
     rel = request.args.get('path','').lstrip('/')
     full = safe_join(user_base(), rel)
-    if not os.path.isfile(full):
+    if not full:
         abort(404)
-    d, fn = os.path.split(full)
-    return send_from_directory(d, fn, as_attachment=True)
+    return serving.send_path(full, as_attachment=True)
 
 # ----------------------------
 # API：分享链接（30 天有效）
@@ -213,10 +336,9 @@ def download_shared(token):
 
     rel = data.get('path','').lstrip('/')
     full = safe_join(app.config['UPLOAD_FOLDER'], rel)
-    if not os.path.isfile(full):
+    if not full:
         abort(404)
-    d, fn = os.path.split(full)
-    return send_from_directory(d, fn, as_attachment=True)
+    return serving.send_path(full, as_attachment=True, private=False)
 
 # ----------------------------
 # API：文件/目录操作（新建/删除/重命名/移动/复制）
@@ -233,6 +355,7 @@ def api_mkdir():
     if os.path.exists(d):
         return '已存在同名项目', 400
     os.makedirs(d)
+    touched(d)
     return 'OK', 200
 
 @app.route('/api/delete', methods=['POST'])
@@ -245,11 +368,7 @@ def api_delete():
         return '不允许删除根目录', 400
     if not os.path.exists(target):
         return '不存在', 404
-    if os.path.isdir(target):
-        shutil.rmtree(target)
-    else:
-        os.remove(target)
-    return 'OK', 200
+    return _job_started('delete', target=target)
 
 @app.route('/api/rename', methods=['POST'])
 @login_required
@@ -265,6 +384,7 @@ def api_rename():
     if os.path.exists(dst):
         return '目标已存在', 400
     os.rename(src, dst)
+    touched(src, dst)
     return 'OK', 200
 
 @app.route('/api/move', methods=['POST'])
@@ -276,6 +396,7 @@ def api_move():
     dst = safe_join(user_base(), dst_rel)
     os.makedirs(os.path.dirname(dst), exist_ok=True)
     os.rename(src, dst)
+    touched(src, os.path.dirname(dst), dst)
     return 'OK', 200
 
 @app.route('/api/copy', methods=['POST'])
@@ -285,12 +406,31 @@ def api_copy():
     dst_rel = request.form.get('dst','').lstrip('/')
     src = safe_join(user_base(), src_rel)
     dst = safe_join(user_base(), dst_rel)
-    if os.path.isdir(src):
-        shutil.copytree(src, dst)
-    else:
-        os.makedirs(os.path.dirname(dst), exist_ok=True)
-        shutil.copy2(src, dst)
-    return 'OK', 200
+    if not src or not os.path.exists(src):
+        return '源不存在', 404
+    if not dst or os.path.exists(dst):
+        return '目标已存在', 400
+    return _job_started('copy', src=src, dst=dst)
+
+@app.route('/api/archive', methods=['POST'])
+@login_required
+def api_archive():
+    # 把文件 / 目录打包为同目录下的 <名称>.zip
+    src_rel = request.form.get('src','').lstrip('/')
+    src = safe_join(user_base(), src_rel)
+    if not src_rel or not src or not os.path.exists(src):
+        return '源不存在', 404
+    dst = src.rstrip(os.sep) + '.zip'
+    if os.path.exists(dst):
+        return '目标已存在', 400
+    return _job_started('archive', src=src, dst=dst)
+
+@app.route('/api/cache/stats')
+@login_required
+def api_cache_stats():
+    # 目录缓存与用户身份缓存的命中 / 未命中计数
+    return jsonify(listing=listing.cache.stats(), users=user_cache.stats(),
+                   find=path_index.stats())
 
 # ----------------------------
 # HTML + JS 模板：美化后的界面
@@ -333,12 +473,23 @@ TPL_BASE = """
       <div class="alert alert-{{cat}}">{{msg}}</div>
     {% endfor %}
   {% endwith %}
-  {{ body|safe }}
+  {% block body %}{% endblock %}
 </div>
 <!-- jQuery + Bootstrap JS -->
 <script src="https://cdn.jsdelivr.net/npm/jquery@3.5.1/dist/jquery.slim.min.js"></script>
 <script src="https://cdn.jsdelivr.net/npm/bootstrap@4.6.2/dist/js/bootstrap.bundle.min.js"></script>
+<script src="/resumable/client.js"></script>
+<script src="/jobs/client.js"></script>
 <script>
+// 超过该大小的文件走分片断点续传
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+// 提交后台任务并等待完成，期间在 #job-status 显示进度
+function runJob(label, u, d){
+  let status = $('#job-status');
+  return postForm(u, d)
+    .then(r => waitJob(JSON.parse(r).job, j => status.text(label + '：' + jobProgressText(j))))
+    .finally(() => status.text(''));
+}
 // 通用 POST 函数
 function postForm(u, d){
   return fetch(u, {
@@ -348,25 +499,34 @@ function postForm(u, d){
   }).then(r=>r.text().then(t=>{ if(!r.ok) throw t; return t; }));
 }
 
-let treeData = {};      // 缓存整棵目录树
+let dirCache = {};      // 已加载的目录层：path -> {children, next}
 let currentPath = '';   // 当前相对路径
 
-// 加载整棵目录树
-function loadTree(){
-  return fetch('/api/tree')
-    .then(r=>r.json())
-    .then(arr=>{
-      treeData = {};
-      function flatten(nodes){
-        nodes.forEach(n=>{
-          treeData[n.id] = n;
-          if(n.children && n.children.length>0) flatten(n.children);
-        });
+// 按需加载一层目录（带游标分页）
+function loadDir(path, more){
+  let cached = dirCache[path];
+  if(cached && !more) return Promise.resolve(cached);
+  let q = new URLSearchParams({path: path});
+  if(more && cached && cached.next) q.set('cursor', cached.next);
+  return fetch('/api/tree?' + q)
+    .then(r=>{ if(!r.ok) throw '加载目录失败'; return r.json(); })
+    .then(o=>{
+      if(more && cached){
+        cached.children = cached.children.concat(o.children);
+        cached.next = o.next;
+      } else {
+        dirCache[path] = cached = {children: o.children, next: o.next};
       }
-      flatten(arr[0].children);
+      return cached;
     });
 }
 
+// 目录内容变化后丢弃缓存并重新加载当前层
+function reloadDir(path){
+  delete dirCache[path];
+  return loadDir(path).then(_=> goPath(currentPath));
+}
+
 // 渲染面包屑
 function renderBreadcrumb(){
   let container = $('#breadcrumb').empty();
@@ -390,20 +550,16 @@ function renderBreadcrumb(){
 // 渲染当前目录列表
 function renderList(){
   let list = $('#file-list').empty();
-  let children = treeData[currentPath]? treeData[currentPath].children : [];
-  // 先文件夹后文件，并按名称排序
-  children.sort((a,b)=>{
-    let fa = !!a.children, fb = !!b.children;
-    if(fa !== fb) return fa? -1:1;
-    return a.text.localeCompare(b.text);
-  });
-  children.forEach(item=>{
-    let isFolder = Array.isArray(item.children);
+  let level = dirCache[currentPath] || {children: [], next: null};
+  // 服务端已按先文件夹后文件排好，各页依次拼接即可
+  level.children.forEach(item=>{
+    let isFolder = item.is_dir;
     let icon = isFolder? 'fa-folder': 'fa-file';
+    let count = isFolder? `<small class="text-muted ml-1">(${item.child_count})</small>` : '';
     let li = $(`
       <li class="list-group-item file-item" data-id="${item.id}">
         <i class="fas ${icon} mr-2"></i>
-        <span class="file-name">${item.text}</span>
+        <span class="file-name">${item.text}</span>${count}
         <div class="item-actions">
           ${isFolder
             ? `<button class="btn btn-sm btn-outline-primary btn-open-folder" title="打开">
@@ -421,18 +577,24 @@ function renderList(){
       </li>`);
     list.append(li);
   });
+  if(level.next){
+    list.append(`<li class="list-group-item text-center">
+      <button class="btn btn-sm btn-link btn-more">加载更多</button></li>`);
+  }
 }
 
-// 切换到某个路径
+// 切换到某个路径（首次进入时才向服务器请求该层）
 function goPath(path){
-  currentPath = path;
-  renderBreadcrumb();
-  renderList();
+  return loadDir(path).then(_=>{
+    currentPath = path;
+    renderBreadcrumb();
+    renderList();
+  }).catch(alert);
 }
 
 $(function(){
   // 初次加载
-  loadTree().then(_=> goPath(''));
+  goPath('');
 
   // 面包屑点击跳转
   $('#breadcrumb').on('click','li[data-path]', function(){
@@ -445,6 +607,11 @@ $(function(){
     goPath(id);
   });
 
+  // 分页：加载当前目录的下一页
+  $('#file-list').on('click','.btn-more', function(){
+    loadDir(currentPath, true).then(renderList).catch(alert);
+  });
+
   // 下载文件
   $('#file-list').on('click','.btn-download', function(){
     let id = $(this).closest('li').data('id');
@@ -466,7 +633,7 @@ $(function(){
     let newname = prompt('新名称', li.find('.file-name').text());
     if(!newname) return;
     postForm('/api/rename',{src:id,name:newname})
-      .then(_=> loadTree().then(_=> goPath(currentPath)))
+      .then(_=> reloadDir(currentPath))
       .catch(alert);
   });
 
@@ -474,18 +641,49 @@ $(function(){
   $('#file-list').on('click','.btn-delete', function(){
     if(!confirm('确认删除？')) return;
     let id = $(this).closest('li').data('id');
-    postForm('/api/delete',{path:id})
-      .then(_=> loadTree().then(_=> goPath(currentPath)))
+    runJob('正在删除', '/api/delete', {path:id})
+      .then(_=> reloadDir(currentPath))
       .catch(alert);
   });
 
+  // 文件名查找：结果按修改时间从新到旧，点击打开所在目录
+  $('#find-form').on('submit', function(e){
+    e.preventDefault();
+    let q = $('#find-input').val().trim(), ul = $('#find-results').empty();
+    if(!q) return;
+    fetch('/api/find?' + new URLSearchParams({q: q}))
+      .then(r=>r.json().then(o=>{ if(!r.ok) throw o.error; return o; }))
+      .then(o=>{
+        if(!o.items.length) ul.append('<li class="list-group-item text-muted">没有找到</li>');
+        o.items.forEach(it=>{
+          let dir = it.is_dir? it.path : it.path.split('/').slice(0, -1).join('/');
+          ul.append($('<li class="list-group-item file-item find-hit">').attr('data-dir', dir)
+            .append(`<i class="fas ${it.is_dir? 'fa-folder': 'fa-file'} mr-2"></i>`,
+                    $('<span>').text(it.path)));
+        });
+        if(o.more) ul.append($('<li class="list-group-item small text-muted">')
+          .text('只显示最近修改的 ' + o.items.length + ' 条'));
+      })
+      .catch(alert);
+  });
+  $('#find-results').on('click','.find-hit', function(){
+    goPath($(this).attr('data-dir'));
+  });
+
   // 顶层上传
   $('#uploader').on('change', function(){
     let f=this.files[0]; if(!f) return;
-    let fd=new FormData(); fd.append('file',f); fd.append('path','');
-    fetch('/api/upload',{method:'POST',body:fd})
-      .then(r=>r.text().then(t=>{ if(!r.ok) throw t; alert('上传成功'); }))
-      .then(_=> loadTree().then(_=> goPath(currentPath)))
+    let done;
+    if(f.size > RESUMABLE_THRESHOLD){
+      // 大文件：并行分片上传，断线后重新选择同一文件即可续传
+      done = resumableUpload(f, '', {parallel:4});
+    } else {
+      let fd=new FormData(); fd.append('file',f); fd.append('path','');
+      done = fetch('/api/upload',{method:'POST',body:fd})
+        .then(r=>r.text().then(t=>{ if(!r.ok) throw t; }));
+    }
+    done.then(_=> alert('上传成功'))
+      .then(_=> reloadDir(''))
       .catch(alert);
   });
 });
@@ -494,6 +692,8 @@ $(function(){
 """
 
 TPL_REGISTER = """
+{% extends "base.html" %}
+{% block body %}
 <h3>注册</h3>
 <form method="post">
   <div class="form-group">
@@ -507,9 +707,12 @@ TPL_REGISTER = """
   <button class="btn btn-primary">注册</button>
   <a href="{{url_for('login')}}" class="btn btn-link">已有账号？登录</a>
 </form>
+{% endblock %}
 """
 
 TPL_LOGIN = """
+{% extends "base.html" %}
+{% block body %}
 <h3>登录</h3>
 <form method="post">
   <div class="form-group">
@@ -523,12 +726,23 @@ TPL_LOGIN = """
   <button class="btn btn-primary">登录</button>
   <a href="{{url_for('register')}}" class="btn btn-link">没有账号？注册</a>
 </form>
+{% endblock %}
 """
 
 TPL_INDEX = """
+{% extends "base.html" %}
+{% block body %}
 <div class="mb-2">
   <input type="file" id="uploader" class="form-control-file">
+  <div id="job-status" class="small text-muted"></div>
 </div>
+<!-- 文件名查找（整个目录树） -->
+<form id="find-form" class="form-inline mb-2">
+  <input id="find-input" class="form-control form-control-sm mr-2"
+         placeholder="按文件名查找（支持 * ? 通配符）">
+  <button class="btn btn-sm btn-outline-secondary">查找</button>
+</form>
+<ul class="list-group mb-2" id="find-results"></ul>
 <!-- 文件浏览器容器 -->
 <div id="file-browser">
   <nav aria-label="breadcrumb">
@@ -536,8 +750,17 @@ TPL_INDEX = """
   </nav>
   <ul class="list-group" id="file-list"></ul>
 </div>
+{% endblock %}
 """
 
+# 页面注册为具名模板：首次渲染时编译一次，之后直接取 jinja 环境里缓存的模板对象
+app.jinja_loader = DictLoader({
+    'base.html': TPL_BASE,
+    'register.html': TPL_REGISTER,
+    'login.html': TPL_LOGIN,
+    'index.html': TPL_INDEX,
+})
+
 # ----------------------------
 # 启动
 # ----------------------------
@@ -552,14 +775,25 @@ if __name__ == '__main__':
 
 # app.py
 import os
+import json
+import base64
 import shutil
 from flask import (
-    Flask, request, jsonify, send_from_directory, abort,
-    render_template_string
+    Flask, request, jsonify, abort,
+    render_template
 )
+from jinja2 import DictLoader
 from werkzeug.utils import secure_filename
 
+import listing
+import resumable
+import serving
+import jobs
+import streaming
+import textsearch
+
 app = Flask(__name__)
+app.register_blueprint(streaming.create_blueprint())
 ROOT_DIR = os.path.join(os.path.dirname(__file__), "storage")
 os.makedirs(ROOT_DIR, exist_ok=True)
 
@@ -583,6 +817,31 @@ def is_text_file(filename: str) -> bool:
     ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
     return ext in TEXT_EXTENSIONS
 
+# 文本文件全文检索（/api/search）：修改路由同步更新索引，后台线程定期核对磁盘。
+# 这个应用没有账号，整个 storage 目录是一个分区
+search_index = textsearch.TextIndex(
+    os.path.join(os.path.dirname(__file__), ".search"),
+    root_of=lambda partition: ROOT_DIR, partitions=lambda: [''],
+    extensions=TEXT_EXTENSIONS)
+app.register_blueprint(textsearch.create_blueprint(search_index))
+
+def rel_path(abs_path: str) -> str:
+    # 索引里的路径相对 ROOT_DIR，用 / 分隔
+    return os.path.relpath(abs_path, ROOT_DIR).replace(os.sep, '/')
+
+def removed(*paths):
+    """删除任务结束后：目录缓存失效；已经不在的路径移出全文索引（取消后剩下的留给定期核对）"""
+    listing.cache.touch(*paths)
+    for p in paths:
+        if not os.path.lexists(p):
+            search_index.remove('', rel_path(p), recursive=True)
+
+# 删除大目录放到后台任务里执行，接口立即返回任务 id（进度见 /jobs/<id>）；
+# 这个应用没有账号，所有任务属于同一个 owner
+job_queue = jobs.JobQueue(os.path.join(os.path.dirname(__file__), "jobs.db"), name='storage',
+                          on_change=removed)
+app.register_blueprint(jobs.create_blueprint(job_queue))
+
 def format_size(size: int) -> str:
     for unit in ['B','KB','MB','GB','TB']:
         if size < 1024:
@@ -595,25 +854,99 @@ def list_directory(path: str):
     if not os.path.isdir(abs_dir):
         raise Exception("目录不存在")
     folders, files = [], []
-    for entry in os.listdir(abs_dir):
-        entry_path = os.path.join(abs_dir, entry)
-        stat = os.stat(entry_path)
-        item = {'name': entry, 'mtime': int(stat.st_mtime), 'size': stat.st_size}
-        if os.path.isdir(entry_path):
-            folders.append(item)
-        else:
-            files.append(item)
-    folders.sort(key=lambda x: x['name'].lower())
-    files.sort(key=lambda x: x['name'].lower())
+    for e in listing.cache.list_dir(abs_dir, key=lambda e: e.name.lower()):
+        item = {'name': e.name, 'mtime': int(e.mtime), 'size': e.size}
+        (folders if e.is_dir else files).append(item)
     return folders, files
 
 @app.route('/')
 def route_index():
-    return render_template_string(MAIN_PAGE_TEMPLATE)
+    return render_template('main.html')
+
+def iter_directory(abs_dir):
+    """逐项产出目录条目（/api/list?stream=1 使用）：不排序、不经过目录缓存。"""
+    for e in listing.scan_dir(abs_dir):
+        yield {'type': 'folder' if e.is_dir else 'file',
+               'name': e.name, 'mtime': int(e.mtime), 'size': e.size}
+
+LIST_PAGE_SIZE = 200   # 分页模式每页默认条目数
+LIST_MAX_PAGE  = 1000  # 单页上限
+
+def encode_cursor(sort, order, key):
+    """把排序方式和上一页最后一条的排序键编码成不透明的游标字符串。"""
+    raw = json.dumps([sort, order, key], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort, order):
+    """返回排序键元组；游标无效或与当前排序方式不符时抛 ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        c_sort, c_order, key = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        raise ValueError('无效的游标')
+    if (c_sort, c_order) != (sort, order) or not isinstance(key, list) or len(key) != 4:
+        raise ValueError('游标与当前排序方式不符')
+    return tuple(key)
+
+def list_page(path, args):
+    """
+    /api/list 的分页模式：按 args 中的排序 / 过滤条件取一页，返回响应字典。
+    条目来自目录缓存（不复制），只用堆选出本页，不对整个目录排序。
+    """
+    abs_dir = safe_path(path)
+    if not os.path.isdir(abs_dir):
+        raise ValueError('目录不存在')
+    sort = args.get('sort', 'name')
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order 只能是 asc 或 desc')
+    reverse = order == 'desc'
+    key = listing.sort_key(sort, reverse)
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor, sort, order) if cursor else None
+    exts = [x for x in args.get('ext', '').split(',') if x.strip()]
+    match = listing.entry_filter(
+        pattern=args.get('q', '').strip() or None,
+        exts=[x.strip() for x in exts],
+        min_size=args.get('min_size', type=int),
+        max_size=args.get('max_size', type=int),
+        kind=args.get('type'))
+    limit = max(1, min(args.get('limit', LIST_PAGE_SIZE, type=int), LIST_MAX_PAGE))
+    try:
+        page, total, more = listing.select_page(listing.cache.entries(abs_dir), key,
+                                                reverse, match, after, limit)
+    except TypeError:  # 游标里的键与条目类型对不上（伪造的游标）
+        raise ValueError('无效的游标')
+    items = [{'type': 'folder' if e.is_dir else 'file',
+              'name': e.name, 'mtime': int(e.mtime), 'size': e.size} for e in page]
+    nxt = encode_cursor(sort, order, key(page[-1])) if more else None
+    return {'ok': True, 'path': path, 'items': items, 'total': total, 'next': nxt}
 
 @app.route('/api/list', methods=['GET'])
 def api_list():
+    """
+    列出目录内容，三种模式：
+      默认          {folders, files}，整个目录按名称排序
+      ?stream=1     NDJSON，每行一个条目，按磁盘读取顺序
+      ?limit=N      分页：{items, total, next}，下一页带上 cursor=next
+                    sort=name|size|mtime|extension，order=asc|desc，
+                    q=名称通配符，ext=mp4,mkv，min_size / max_size（字节），type=file|folder
+    """
     path = request.args.get('path', '')
+    if 'limit' in request.args or 'cursor' in request.args:
+        try:
+            return jsonify(list_page(path, request.args))
+        except Exception as e:
+            return jsonify({'ok': False, 'error': str(e)}), 400
+    if request.args.get('stream'):
+        # NDJSON 流：每行一个条目，边读目录边输出，内存占用与条目数无关
+        try:
+            abs_dir = safe_path(path)
+        except Exception as e:
+            return jsonify({'ok': False, 'error': str(e)}), 400
+        if not os.path.isdir(abs_dir):
+            return jsonify({'ok': False, 'error': '目录不存在'}), 400
+        return streaming.ndjson(iter_directory(abs_dir))
     try:
         folders, files = list_directory(path)
         return jsonify({'ok': True, 'path': path, 'folders': folders, 'files': files})
@@ -635,10 +968,22 @@ def api_mkdir():
         if os.path.exists(new_folder_path):
             return jsonify({'ok': False, 'error': '文件夹已存在'}), 400
         os.mkdir(new_folder_path)
+        listing.cache.touch(new_folder_path)
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 400
 
+def unique_path(abs_dir: str, filename: str) -> str:
+    # 重名时追加 (1)、(2)……
+    filepath = os.path.join(abs_dir, filename)
+    if os.path.exists(filepath):
+        name, ext = os.path.splitext(filename)
+        for i in range(1, 1000):
+            filepath = os.path.join(abs_dir, f"{name}({i}){ext}")
+            if not os.path.exists(filepath):
+                break
+    return filepath
+
 @app.route('/api/upload', methods=['POST'])
 def api_upload():
     path = request.form.get('path', '')
@@ -647,26 +992,43 @@ def api_upload():
     files = request.files.getlist('file')
     try:
         abs_dir = safe_path(path)
-        count = 0
+        saved = []
         for f in files:
             filename = secure_filename(f.filename)
             if not filename or not allowed_file(filename):
                 return jsonify({'ok': False, 'error': f'文件类型不允许: {filename}'}), 400
-            filepath = os.path.join(abs_dir, filename)
-            if os.path.exists(filepath):
-                name, ext = os.path.splitext(filename)
-                for i in range(1, 1000):
-                    newname = f"{name}({i}){ext}"
-                    filepath = os.path.join(abs_dir, newname)
-                    if not os.path.exists(filepath):
-                        filename = newname
-                        break
+            filepath = unique_path(abs_dir, filename)
             f.save(filepath)
-            count += 1
-        return jsonify({'ok': True, 'count': count})
+            st = os.stat(filepath)
+            saved.append({'name': os.path.basename(filepath), 'mtime': int(st.st_mtime), 'size': st.st_size})
+            search_index.update('', rel_path(filepath))
+        listing.cache.invalidate(abs_dir)
+        # files 与 /api/list 的条目格式一致，前端直接合并进当前列表
+        return jsonify({'ok': True, 'count': len(saved), 'files': saved})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 400
 
+# 大文件分片断点续传：/resumable/...
+def resumable_target(path: str, filename: str) -> str:
+    filename = secure_filename(filename)
+    if not filename or not allowed_file(filename):
+        raise ValueError(f'文件类型不允许: {filename}')
+    try:
+        abs_dir = safe_path(path)
+    except Exception as e:
+        raise ValueError(str(e))
+    if not os.path.isdir(abs_dir):
+        raise ValueError('目录不存在')
+    return unique_path(abs_dir, filename)
+
+def resumable_done(dest: str):
+    listing.cache.touch(dest)
+    search_index.update('', rel_path(dest))
+
+app.register_blueprint(resumable.create_blueprint(
+    resumable.ResumableStore(os.path.join(os.path.dirname(__file__), ".resumable-storage")),
+    resumable_target, on_complete=resumable_done))
+
 @app.route('/api/delete', methods=['POST'])
 def api_delete():
     data = request.json or {}
@@ -679,10 +1041,11 @@ def api_delete():
         target_Path = os.path.join(abs_dir, name)
         if not os.path.exists(target_Path):
             return jsonify({'ok': False, 'error': '文件或文件夹不存在'}), 404
-        if os.path.isfile(target_Path):
-            os.remove(target_Path)
-        else:
-            shutil.rmtree(target_Path)
+        if os.path.isdir(target_Path) and not os.path.islink(target_Path):
+            return jsonify({'ok': True, 'job': job_queue.submit('', 'delete', target=target_Path)}), 202
+        os.remove(target_Path)
+        listing.cache.touch(target_Path)
+        search_index.remove('', rel_path(target_Path), recursive=True)
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 400
@@ -706,6 +1069,8 @@ def api_rename():
         if os.path.exists(new_path):
             return jsonify({'ok': False, 'error': '新名称已存在'}), 400
         os.rename(old_path, new_path)
+        listing.cache.touch(old_path, new_path)
+        search_index.rename('', rel_path(old_path), rel_path(new_path))
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 400
@@ -728,6 +1093,8 @@ def api_move():
         if os.path.exists(dst_file):
             return jsonify({'ok': False, 'error': '目标路径存在同名文件'}), 400
         shutil.move(src_file, dst_file)
+        listing.cache.touch(src_file, dst_file)
+        search_index.rename('', rel_path(src_file), rel_path(dst_file))
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 400
@@ -740,9 +1107,9 @@ def route_download():
         abort(404)
     try:
         abs_dir = safe_path(path)
-        return send_from_directory(abs_dir, name, as_attachment=True)
     except Exception:
         abort(404)
+    return serving.send_from(abs_dir, name, as_attachment=True)
 
 @app.route('/api/view/text', methods=['GET'])
 def api_view_text():
@@ -776,6 +1143,8 @@ def api_save_text():
         filepath = os.path.join(abs_dir, name)
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(content)
+        listing.cache.touch(filepath)
+        search_index.update('', rel_path(filepath))
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 400
@@ -784,11 +1153,13 @@ def api_save_text():
 def route_file(filepath):
     try:
         abs_fp = safe_path(filepath)
-        if not os.path.isfile(abs_fp):
-            abort(404)
-        return send_from_directory(ROOT_DIR, filepath)
     except Exception:
         abort(404)
+    return serving.send_path(abs_fp)
+
+@app.route('/api/cache/stats')
+def storage_cache_stats():
+    return jsonify(listing.cache.stats())
 
 MAIN_PAGE_TEMPLATE = r"""
 <!DOCTYPE html>
@@ -803,6 +1174,11 @@ MAIN_PAGE_TEMPLATE = r"""
   body {padding:10px; background:#f8f9fa;}
   .file-list li:hover {background:#e9ecef;}
   .file-list li.dragging {opacity:0.4;}
+  /* 虚拟滚动：固定行高，只渲染可见的行 */
+  #file-scroller {height:60vh; overflow-y:auto; position:relative; background:#fff;}
+  #file-spacer {position:relative;}
+  #file-list {position:absolute; left:0; right:0; top:0;}
+  #file-list li {height:44px; padding-top:0; padding-bottom:0; white-space:nowrap; overflow:hidden;}
   .context-menu {
     position: fixed;
     z-index: 1050;
@@ -860,9 +1236,47 @@ MAIN_PAGE_TEMPLATE = r"""
   <button id="btn-upload" class="btn btn-primary btn-sm"><i class="fas fa-upload"></i> 上传文件/文件夹</button>
   <button id="btn-newfolder" class="btn btn-success btn-sm"><i class="fas fa-folder-plus"></i> 新建文件夹</button>
   <button id="btn-refresh" class="btn btn-outline-secondary btn-sm"><i class="fas fa-sync-alt"></i> 刷新</button>
+  <form id="search-form" class="d-inline-flex ml-2">
+    <input id="search-q" class="form-control form-control-sm mr-1" placeholder="搜索文本文件内容" size="24">
+    <button class="btn btn-outline-primary btn-sm"><i class="fas fa-search"></i></button>
+  </form>
+</div>
+
+<div id="search-section" class="mb-3" style="display:none;">
+  <div class="d-flex justify-content-between align-items-center mb-1">
+    <strong>搜索结果</strong>
+    <button id="btn-close-search" class="btn btn-link btn-sm">关闭</button>
+  </div>
+  <ul class="list-group" id="search-results"></ul>
+  <button id="btn-search-more" class="btn btn-outline-secondary btn-sm mt-1" style="display:none;">更多结果</button>
+</div>
+
+<div id="upload-status" class="small text-muted mb-1"></div>
+<ul id="upload-queue" class="list-unstyled small mb-2"></ul>
+
+<div class="form-inline mb-2" id="list-controls">
+  <select id="sort-key" class="form-control form-control-sm mr-1">
+    <option value="name">名称</option>
+    <option value="mtime">修改时间</option>
+    <option value="size">大小</option>
+    <option value="extension">扩展名</option>
+    <option value="disk">读取顺序（流式）</option>
+  </select>
+  <select id="sort-order" class="form-control form-control-sm mr-1">
+    <option value="asc">升序</option>
+    <option value="desc">降序</option>
+  </select>
+  <input id="filter-q" class="form-control form-control-sm mr-1" placeholder="名称（支持 * ?）">
+  <input id="filter-ext" class="form-control form-control-sm mr-1" placeholder="扩展名，如 mp4,mkv" size="14">
+  <input id="filter-min" type="number" min="0" class="form-control form-control-sm mr-1" placeholder="最小 MB" style="width:7em">
+  <span id="list-count" class="small text-muted"></span>
 </div>
 
-<ul class="list-group file-list" id="file-list" style="user-select:none;"></ul>
+<div id="file-scroller">
+  <div id="file-spacer">
+    <ul class="list-group file-list" id="file-list" style="user-select:none;"></ul>
+  </div>
+</div>
 
 <hr/>
 
@@ -891,6 +1305,9 @@ MAIN_PAGE_TEMPLATE = r"""
 </div>
 
 <script src="https://cdn.jsdelivr.net/npm/jquery@3.6.1/dist/jquery.min.js"></script>
+<script src="/resumable/client.js"></script>
+<script src="/stream/client.js"></script>
+<script src="/jobs/client.js"></script>
 <script>
 const rootPath = "";
 let currentPath = "";
@@ -915,19 +1332,185 @@ function formatDate(ts){
   return d.toLocaleString();
 }
 
-function refreshList(path){
+// 列表分页加载（/api/list?limit=...），排序和过滤在服务端完成；
+// 虚拟滚动：只渲染可见的几十行，滚动到尚未加载的位置时按游标继续取下一页。
+// 排序选“读取顺序”且没有过滤条件时改用 NDJSON 流（/api/list?stream=1）边收边显示，
+// 收完后条目不多时再按名称排一次
+const ROW_HEIGHT = 44, LIST_PAGE = 200, OVERSCAN = 10, SORT_AFTER_LOAD = 5000;
+// 浏览器对元素高度有上限（Chrome 约 3350 万像素，Firefox 更低）；
+// 列表更长时占位高度截在这里，滚动位置按比例换算成行号
+const MAX_SPACER = 10000000;
+let view = null;   // 当前列表：{path, params, stream, items, total, next, done, loading}
+
+function listParams(){
+  let p = {sort: $('#sort-key').val(), order: $('#sort-order').val()};
+  let q = $('#filter-q').val().trim(), ext = $('#filter-ext').val().trim(), min = $('#filter-min').val();
+  if(q) p.q = q;
+  if(ext) p.ext = ext;
+  if(min) p.min_size = Math.round(parseFloat(min) * 1024 * 1024);
+  return p;
+}
+
+function isFiltered(p){ return !!(p.q || p.ext || p.min_size); }
+
+function refreshList(path, keepScroll){
   if(path === undefined) path = currentPath;
-  $.getJSON('/api/list', {path: path}, function(res){
-    if(!res.ok){alert(res.error);return;}
-    currentPath = res.path;
-    renderBreadcrumb(currentPath);
-    renderFileList(res.folders, res.files);
+  currentPath = path;
+  renderBreadcrumb(currentPath);
+  if(!keepScroll){
     selectedItem = null;
-  }).fail(xhr=>{
-    alert('加载失败:'+(xhr.responseJSON?.error || xhr.statusText));
+    $('#file-scroller').scrollTop(0);
+  }
+  if(view && view.ctrl) view.ctrl.abort();
+  let params = listParams(), stream = params.sort === 'disk' && !isFiltered(params);
+  if(params.sort === 'disk') params.sort = 'name';   // 流式列表收完后的排序 / 有过滤条件时的分页都按名称
+  view = {path: path, params: params, stream: stream, items: [], total: 0, next: null, done: false, loading: null};
+  if(stream) streamList(view);
+  renderVisible();
+}
+
+function streamList(v){
+  v.ctrl = new AbortController();
+  v.names = new Set();
+  v.loading = readNdjson('/api/list?' + new URLSearchParams({path: v.path, stream: 1}), rows => {
+    rows.forEach(f => { if(!v.names.has(f.name)){ v.names.add(f.name); v.items.push(f); } });
+    v.total = v.items.length;
+    if(v === view) scheduleRender();
+  }, {signal: v.ctrl.signal}).then(() => {
+    if(v.items.length <= SORT_AFTER_LOAD){
+      v.items.sort(compareItems(v.params));
+      v.sorted = true;
+    }
+  }, err => {
+    if(err && err.name === 'AbortError') return;
+    let msg = err;
+    try { msg = JSON.parse(err).error || err; } catch(e) {}
+    if(v === view) alert('加载失败:' + msg);
+  }).finally(() => {
+    v.done = true;
+    v.loading = null;
+    if(v === view) renderVisible();
+  });
+}
+
+function loadMore(v){
+  if(v.loading) return v.loading;
+  let q = new URLSearchParams(Object.assign({path: v.path, limit: LIST_PAGE}, v.params));
+  if(v.next) q.set('cursor', v.next);
+  v.loading = fetch('/api/list?' + q)
+    .then(r => r.json())
+    .then(res => {
+      if(!res.ok) throw res.error;
+      v.items = v.items.concat(res.items);
+      v.total = res.total;
+      v.next = res.next;
+      v.done = !res.next;
+    })
+    .finally(() => { v.loading = null; });
+  return v.loading;
+}
+
+// 与服务端 listing.sort_key 相同的排序键：目录总在前面，同值再按名称
+function splitExt(lower){
+  let i = lower.lastIndexOf('.'), s = lower.search(/[^.]/);
+  return s >= 0 && i > s ? lower.slice(i) : '';
+}
+
+function itemKey(f, sort, desc){
+  let dir = f.type === 'folder', lower = f.name.toLowerCase(), value;
+  if(sort === 'size') value = dir ? 0 : f.size;
+  else if(sort === 'mtime') value = f.mtime;
+  else if(sort === 'extension') value = dir ? '' : splitExt(lower);
+  else value = lower;
+  let group = dir ? (desc ? 1 : 0) : (desc ? 0 : 1);
+  return [group, value, lower, f.name];
+}
+
+function compareItems(params){
+  let desc = params.order === 'desc';
+  return (a, b) => {
+    let ka = itemKey(a, params.sort, desc), kb = itemKey(b, params.sort, desc);
+    for(let i = 0; i < ka.length; i++){
+      if(ka[i] < kb[i]) return desc ? 1 : -1;
+      if(ka[i] > kb[i]) return desc ? -1 : 1;
+    }
+    return 0;
+  };
+}
+
+// 上传完成后把新条目按当前排序插入已加载的列表，不重新列目录。
+// 位置在已加载部分之后的条目不插入：后面的分页（游标之后）会把它带回来。
+// 有过滤条件时客户端判断不了新文件是否符合条件，才重新加载（多个文件连续完成时合并为一次）
+let uploadRefresh = null;
+function patchList(v, entries){
+  if(isFiltered(v.params)){
+    clearTimeout(uploadRefresh);
+    uploadRefresh = setTimeout(() => { if(v === view) refreshList(v.path, true); }, 300);
+    return;
+  }
+  let cmp = compareItems(v.params);
+  entries.forEach(e => {
+    let f = {type: 'file', name: e.name, size: e.size, mtime: e.mtime};
+    let old = v.items.findIndex(x => x.name === f.name);
+    if(old >= 0){ v.items.splice(old, 1); v.total--; }
+    if(v.names) v.names.add(f.name);
+    let pos = v.items.length;
+    if(!v.stream || v.sorted){
+      let lo = 0, hi = v.items.length;
+      while(lo < hi){
+        let mid = (lo + hi) >> 1;
+        if(cmp(v.items[mid], f) < 0) lo = mid + 1; else hi = mid;
+      }
+      pos = lo;
+    }
+    if(pos < v.items.length || v.done || v.stream) v.items.splice(pos, 0, f);
+    v.total++;
+  });
+  renderVisible();
+}
+
+function renderVisible(){
+  let v = view;
+  if(!v) return;
+  let sc = $('#file-scroller'), top = sc.scrollTop(), height = sc.innerHeight();
+  let full = v.total * ROW_HEIGHT, spacer = Math.min(full, MAX_SPACER);
+  // 占位被截短时，scrollTop 按比例换算到完整列表中的位置
+  let virtTop = full > spacer && spacer > height ? top * (full - height) / (spacer - height) : top;
+  let first = Math.max(0, Math.floor(virtTop / ROW_HEIGHT) - OVERSCAN);
+  let last = Math.ceil((virtTop + height) / ROW_HEIGHT) + OVERSCAN;
+  if(last > v.items.length && !v.done && !v.stream){
+    // 可见范围还没加载到：取下一页后再渲染（切换目录 / 排序后旧的结果直接丢弃）
+    loadMore(v).then(() => { if(v === view) renderVisible(); },
+                     err => { if(v === view) alert('加载失败:' + err); });
+  }
+  $('#file-spacer').css('height', spacer);
+  let ul = $('#file-list').css('top', top + first * ROW_HEIGHT - virtTop).empty();
+  let selected = selectedItem && selectedItem.attr('data-name');
+  v.items.slice(first, Math.min(last, v.items.length)).forEach(f => {
+    let li = f.type === 'folder' ? folderItem(f) : fileItem(f);
+    if(f.name === selected){ li.addClass('active'); selectedItem = li; }
+    ul.append(li);
   });
+  $('#list-count').text(v.done || v.items.length ? `共 ${v.total} 项` : '加载中…');
 }
 
+let renderPending = false;
+function scheduleRender(){
+  if(renderPending) return;
+  renderPending = true;
+  requestAnimationFrame(() => { renderPending = false; renderVisible(); });
+}
+
+$('#file-scroller').on('scroll', scheduleRender);
+$(window).on('resize', () => renderVisible());
+
+let filterTimer = null;
+$('#sort-key, #sort-order').on('change', () => refreshList());
+$('#filter-q, #filter-ext, #filter-min').on('input', () => {
+  clearTimeout(filterTimer);
+  filterTimer = setTimeout(() => refreshList(), 300);
+});
+
 function renderBreadcrumb(path){
   let crumbs = path.split('/').filter(x => x.length > 0);
   let html = `<li class="breadcrumb-item"><a href="#" data-path="">根目录</a></li>`;
@@ -949,29 +1532,25 @@ $('#breadcrumb').on('click', 'a', function(e){
   refreshList(path);
 });
 
-function renderFileList(folders, files){
-  let ul = $('#file-list').empty();
-  folders.forEach(f=>{
-    let li = $(`
-      <li class="list-group-item d-flex justify-content-between align-items-center" draggable="true" data-type="folder" data-name="${escapeHtml(f.name)}">
-        <span><i class="fas fa-folder"></i> ${escapeHtml(f.name)}</span>
-        <small class="text-muted">${formatDate(f.mtime)}</small>
-      </li>`);
-    ul.append(li);
-  });
-  files.forEach(f=>{
-    let ext = f.name.split('.').pop().toLowerCase();
-    let icon = 'fa-file';
-    if(['png','jpg','jpeg','gif','bmp'].includes(ext)) icon='fa-file-image';
-    else if(['mp4','avi','mkv','webm','mov'].includes(ext)) icon='fa-file-video';
-    else if(['txt','md','json','xml','csv','log','py','html','js','css'].includes(ext)) icon = 'fa-file-alt';
-    let li = $(`
-      <li class="list-group-item d-flex justify-content-between align-items-center" draggable="true" data-type="file" data-name="${escapeHtml(f.name)}">
-        <span><i class="fas ${icon}"></i> ${escapeHtml(f.name)}</span>
-        <small class="text-muted">${formatDate(f.mtime)} / ${(f.size/1024).toFixed(1)} KB</small>
-      </li>`);
-    ul.append(li);
-  });
+function folderItem(f){
+  return $(`
+    <li class="list-group-item d-flex justify-content-between align-items-center" draggable="true" data-type="folder" data-name="${escapeHtml(f.name)}">
+      <span><i class="fas fa-folder"></i> ${escapeHtml(f.name)}</span>
+      <small class="text-muted">${formatDate(f.mtime)}</small>
+    </li>`);
+}
+
+function fileItem(f){
+  let ext = f.name.split('.').pop().toLowerCase();
+  let icon = 'fa-file';
+  if(['png','jpg','jpeg','gif','bmp'].includes(ext)) icon='fa-file-image';
+  else if(['mp4','avi','mkv','webm','mov'].includes(ext)) icon='fa-file-video';
+  else if(['txt','md','json','xml','csv','log','py','html','js','css'].includes(ext)) icon = 'fa-file-alt';
+  return $(`
+    <li class="list-group-item d-flex justify-content-between align-items-center" draggable="true" data-type="file" data-name="${escapeHtml(f.name)}">
+      <span><i class="fas ${icon}"></i> ${escapeHtml(f.name)}</span>
+      <small class="text-muted">${formatDate(f.mtime)} / ${(f.size/1024).toFixed(1)} KB</small>
+    </li>`);
 }
 
 $('#file-list').on('click', 'li', function(){
@@ -1073,27 +1652,39 @@ $('#file-upload').change(function(){
   $(this).val('');
 });
 
-function uploadFiles(files){
+// 同时上传的文件数；其余文件排队
+const UPLOAD_CONCURRENCY = 4;
+// 超过该大小的文件走分片断点续传（分片并行上传）
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+
+function uploadOne(f, path, onProgress){
+  if(f.size > RESUMABLE_THRESHOLD)
+    return resumableUpload(f, path, {parallel: 2, onProgress}).then(o => [o]);
   let formData = new FormData();
-  for(let f of files) formData.append('file', f);
-  formData.append('path', currentPath);
-  $.ajax({
-    url: '/api/upload',
-    type: 'POST',
-    processData: false,
-    contentType: false,
-    data: formData,
-    success(res){
-      if(res.ok){
-        alert(`${res.count} 个文件上传成功`);
-        refreshList();
-      } else {
-        alert('上传失败: ' + res.error);
-      }
-    },
-    error(xhr){
-      alert('上传失败: ' + (xhr.responseJSON?.error || xhr.statusText));
-    }
+  formData.append('file', f);
+  formData.append('path', path);
+  return postWithProgress('/api/upload', formData, onProgress).then(res => res.files);
+}
+
+function uploadFiles(files){
+  let path = currentPath, total = files.length, finished = 0, failed = 0;
+  const status = () => $('#upload-status').text(
+    `${finished < total ? '上传中' : '上传完成'} ${finished}/${total}` + (failed ? `，失败 ${failed}` : ''));
+  status();
+  uploadPool(files, UPLOAD_CONCURRENCY, f => {
+    let item = $(`<li>${escapeHtml(f.name)}<div class="progress" style="height:4px"><div class="progress-bar" style="width:0"></div></div></li>`)
+      .appendTo('#upload-queue');
+    let bar = item.find('.progress-bar');
+    return uploadOne(f, path, (done, all) => bar.css('width', (all ? done * 100 / all : 100) + '%'))
+      .then(entries => {
+        item.remove();
+        // 仍停留在上传目录时把新条目合并进列表
+        if(view && view.path === path) patchList(view, entries);
+      }, err => {
+        failed++;
+        item.find('.progress').replaceWith(`<span class="text-danger ml-2">${escapeHtml(String(err))}</span>`);
+      })
+      .then(() => { finished++; status(); });
   });
 }
 
@@ -1126,6 +1717,45 @@ $('#btn-newfolder').click(() => {
 
 $('#btn-refresh').click(() => refreshList());
 
+// 全文搜索：结果按相关度排序，每页 20 条，“更多结果”按页追加
+let searchState = null;
+function runSearch(page){
+  let s = searchState;
+  $.getJSON('/api/search', {q: s.q, page: page}, res => {
+    if(s !== searchState) return;
+    if(!res.ok){ alert(res.error); return; }
+    let ul = $('#search-results');
+    if(page === 1) ul.empty();
+    if(page === 1 && !res.items.length) ul.append('<li class="list-group-item text-muted">没有找到匹配的文件</li>');
+    res.items.forEach(it => {
+      $(`<li class="list-group-item search-hit" style="cursor:pointer">
+          <div><i class="fas fa-file-alt"></i> ${escapeHtml(it.path)}
+            <small class="text-muted ml-2">${formatDate(it.mtime)}</small></div>
+          <div class="small text-monospace"></div>
+        </li>`).data('path', it.path).appendTo(ul)
+        .find('.text-monospace').html(it.snippet);  // snippet 已由服务端转义
+    });
+    s.next = res.next_page;
+    $('#btn-search-more').toggle(!!res.next_page);
+    $('#search-section').show();
+  }).fail(xhr => alert('搜索失败: ' + (xhr.responseJSON?.error || xhr.statusText)));
+}
+$('#search-form').on('submit', e => {
+  e.preventDefault();
+  let q = $('#search-q').val().trim();
+  if(!q) return;
+  searchState = {q: q, next: null};
+  runSearch(1);
+});
+$('#btn-search-more').click(() => { if(searchState && searchState.next) runSearch(searchState.next); });
+$('#btn-close-search').click(() => { searchState = null; $('#search-section').hide(); });
+$('#search-results').on('click', '.search-hit', function(){
+  // 打开命中文件所在的目录，并在编辑器中打开该文件
+  let path = $(this).data('path'), i = path.lastIndexOf('/');
+  refreshList(i < 0 ? '' : path.slice(0, i));
+  openFileViewer(path.slice(i + 1));
+});
+
 let contextMenu = $('#context-menu');
 $('#file-list').on('contextmenu', 'li', function(e){
   e.preventDefault();
@@ -1135,8 +1765,8 @@ $('#file-list').on('contextmenu', 'li', function(e){
   showContextMenu(e.pageX, e.pageY);
 });
 
-$('#file-list').on('contextmenu', function(e){
-  if(e.target === this){
+$('#file-scroller').on('contextmenu', function(e){
+  if(!$(e.target).closest('li').length){
     selectedItem = null;
     $('.file-list li').removeClass('active');
     showContextMenu(e.pageX, e.pageY, true);
@@ -1220,7 +1850,11 @@ contextMenu.on('click', 'li', function(){
       type: 'POST',
       data: JSON.stringify({path: currentPath, name: delname}),
       success(res){
-        if(res.ok){
+        if(res.ok && res.job){
+          // 文件夹在后台删除，等任务结束再刷新
+          waitJob(res.job).then(() => { alert('删除成功'); refreshList(); },
+                                e => { alert('删除失败: ' + e); refreshList(); });
+        } else if(res.ok){
           alert('删除成功');
           refreshList();
         } else {
@@ -1286,6 +1920,8 @@ $(function(){
 </html>
 """
 
+app.jinja_loader = DictLoader({'main.html': MAIN_PAGE_TEMPLATE})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
 
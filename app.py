@@ -1,58 +1,84 @@
 import os
 import sqlite3
-import shutil
-from flask import (Flask, g, render_template, request, redirect,
-                   url_for, session, send_from_directory, jsonify, flash)
+from flask import (Flask, render_template, request, redirect,
+                   url_for, session, jsonify, flash)
 from flask_login import (LoginManager, login_user, logout_user,
                          login_required, current_user, UserMixin)
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
+import asgi
+import cache
+import dbpool
+import jobs
+import listing
+import passwords
+import pathindex
+import resumable
+import serving
+import streaming
+
 # --- 配置 ---
 BASE_DIR      = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 DB_PATH       = os.path.join(BASE_DIR, 'app.db')
+RESUMABLE_DIR = os.path.join(BASE_DIR, '.resumable')   # 分片上传暂存区，与 uploads 同盘
+CACHE_DB      = os.path.join(BASE_DIR, 'cache.db')     # 多 worker 共享缓存（可用 CACHE_DB / CACHE_REDIS_URL 覆盖）
+FIND_DIR      = os.path.join(BASE_DIR, '.pathindex')   # 文件名查找索引
 SECRET_KEY    = 'change-this-secret'
 ALLOWED_EXT    = set(['txt','md','py','html','mp4','webm','mp3','wav','jpg','png'])
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# 多个 gunicorn worker 之间共享目录列表，并互相广播失效
+shared_cache = cache.from_env(CACHE_DB)
+listing.cache.attach(shared_cache)
+
+# 登录用户身份缓存：每个已登录请求（含媒体 Range 请求）都要 load_user
+USER_CACHE_TTL = 300
+user_cache = cache.from_env(CACHE_DB, ttl=USER_CACHE_TTL)
+
 # --- Flask & 登录管理 ---
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 login_mgr = LoginManager(app)
 login_mgr.login_view = 'login'
+db_pool = dbpool.ConnectionPool(DB_PATH, app)   # WAL + 连接复用，见 dbpool.py
+hasher = passwords.PasswordHasher.from_config(app.config)  # PASSWORD_SCHEME / PASSWORD_COST
 
 # --- 用户模型（sqlite3 + flask-login） ---
 class User(UserMixin):
-    def __init__(self, id_, username, pwd_hash):
+    # 只带身份，不带密码哈希：User 会进共享缓存，哈希用到时再查库
+    def __init__(self, id_, username):
         self.id = id_
         self.username = username
-        self.pwd_hash = pwd_hash
 
     def check_password(self, password):
-        return check_password_hash(self.pwd_hash, password)
+        row = get_db().execute("SELECT password FROM users WHERE id=?", (self.id,)).fetchone()
+        return bool(row) and hasher.verify(row['password'], password)
+
+def _user_key(user_id):
+    # v2：旧格式的缓存项里带着密码哈希，换个键让它们直接作废
+    return 'users.v2:%s' % user_id
+
+def forget_user(user_id):
+    """修改密码 / 删除用户后调用，所有 worker 立即丢弃该用户的缓存身份。"""
+    user_cache.invalidate(_user_key(user_id))
+
+def _fetch_user(user_id):
+    row = get_db().execute("SELECT id, username FROM users WHERE id=?",
+                           (user_id,)).fetchone()
+    return tuple(row) if row else None
 
 @login_mgr.user_loader
 def load_user(user_id):
-    con = get_db()
-    row = con.execute("SELECT * FROM users WHERE id=?", (user_id,)).fetchone()
+    row = user_cache.get_or_load(_user_key(user_id), lambda: _fetch_user(user_id))
     if not row: return None
-    return User(row['id'], row['username'], row['password'])
+    return User(*row)
 
 # --- DB 辅助 ---
 def get_db():
-    db = getattr(g, '_db', None)
-    if db is None:
-        db = sqlite3.connect(DB_PATH)
-        db.row_factory = sqlite3.Row
-        g._db = db
-    return db
-
-@app.teardown_appcontext
-def close_db(exc):
-    db = getattr(g, '_db', None)
-    if db: db.close()
+    # 连接在请求结束时由 db_pool 归还
+    return db_pool.get()
 
 def init_db():
     db = get_db()
@@ -77,6 +103,32 @@ def allowed_file(fname):
     ext = fname.rsplit('.',1)[-1].lower()
     return '.' in fname and ext in ALLOWED_EXT
 
+# --- 文件名查找（/api/find?q=，uploads 整棵目录树一个索引） ---
+path_index = pathindex.PathIndex(FIND_DIR, UPLOAD_FOLDER)
+app.register_blueprint(pathindex.create_blueprint(path_index, guard=login_required))
+
+def touched(*paths):
+    """文件 / 目录改动之后：目录缓存失效，文件名索引刷新"""
+    listing.cache.touch(*paths)
+    path_index.touch(*paths)
+
+# --- 断点续传分片上传（/resumable/...，不受单请求大小限制） ---
+def resumable_target(sub, filename):
+    if not allowed_file(filename):
+        raise ValueError("不支持的文件类型")
+    return os.path.join(safe_path(sub), secure_filename(filename))
+
+app.register_blueprint(resumable.create_blueprint(
+    resumable.ResumableStore(RESUMABLE_DIR), resumable_target,
+    guard=login_required, owner=lambda: current_user.id,
+    on_complete=touched))
+
+# --- 后台任务（删除目录等耗时操作，进度见 /jobs/<id>） ---
+job_queue = jobs.JobQueue(os.path.join(BASE_DIR, 'jobs.db'), name='app',
+                          on_change=touched)
+app.register_blueprint(jobs.create_blueprint(
+    job_queue, guard=login_required, owner=lambda: current_user.id))
+
 # --- 启动前建表 ---
 with app.app_context():
     init_db()
@@ -93,7 +145,7 @@ def register():
             db = get_db()
             try:
                 db.execute("INSERT INTO users(username,password) VALUES(?,?)",
-                           (u, generate_password_hash(p)))
+                           (u, hasher.generate(p)))
                 db.commit()
                 flash("注册成功，请登录", "success")
                 return redirect(url_for('login'))
@@ -106,11 +158,18 @@ def login():
     if request.method=='POST':
         u = request.form['username'].strip()
         p = request.form['password']
-        row = get_db().execute(
+        db = get_db()
+        row = db.execute(
             "SELECT * FROM users WHERE username=?", (u,)
         ).fetchone()
-        if row and check_password_hash(row['password'], p):
-            user = User(row['id'], row['username'], row['password'])
+        ok, new_hash = hasher.check(row['password'], p) if row else (False, None)
+        if ok:
+            if new_hash:
+                # 哈希方案 / 强度变了：登录成功时顺便升级
+                db.execute("UPDATE users SET password=? WHERE id=?", (new_hash, row['id']))
+                db.commit()
+                forget_user(row['id'])
+            user = User(row['id'], row['username'])
             login_user(user)
             return redirect(url_for('index'))
         flash("用户名或密码错误", "danger")
@@ -131,13 +190,18 @@ def index(subpath):
         base = safe_path(subpath)
     except:
         return "路径非法", 400
-    items=[]
-    for name in sorted(os.listdir(base)):
-        path_full = os.path.join(base, name)
-        items.append({
-            'name': name,
-            'is_dir': os.path.isdir(path_full)
-        })
+    if request.args.get('stream'):
+        # 流式模式（?stream=1）：边读目录边输出，不排序、不经过目录缓存，
+        # 几十万条目的目录也能立即开始显示，内存占用与条目数无关
+        if not os.path.isdir(base):
+            return "目录不存在", 404
+        return streaming.stream_template('file_manager.html',
+                                         entries=listing.scan_dir(base, stat=False),
+                                         cur_path=subpath,
+                                         username=current_user.username,
+                                         streamed=True)
+    # 只需名称和类型，scandir 自带的 d_type 就够了，不逐条 stat；结果走目录缓存
+    items = listing.cache.list_dir(base, stat=False)
     return render_template('file_manager.html',
                            entries=items,
                            cur_path=subpath,
@@ -147,15 +211,24 @@ def index(subpath):
 @login_required
 def upload():
     sub = request.form.get('path','')
-    file = request.files.get('file')
-    if not file or file.filename=='':
+    files = [f for f in request.files.getlist('file') if f.filename]
+    if not files:
         return "没选文件", 400
-    if not allowed_file(file.filename):
+    if not all(allowed_file(f.filename) for f in files):
         return "不支持的文件类型", 400
-    fn = secure_filename(file.filename)
     dest = safe_path(sub)
-    file.save(os.path.join(dest, fn))
-    return "OK", 200
+    saved, paths = [], []
+    for file in files:
+        fn = secure_filename(file.filename)
+        path = os.path.join(dest, fn)
+        file.save(path)
+        st = os.stat(path)
+        saved.append({'name': fn, 'size': st.st_size, 'mtime': int(st.st_mtime)})
+        paths.append(path)
+    listing.cache.invalidate(dest)
+    path_index.touch(*paths)
+    # 返回新条目，前端据此直接更新列表，无需刷新整页
+    return jsonify({'ok': True, 'files': saved})
 
 @app.route('/mkdir', methods=['POST'])
 @login_required
@@ -167,6 +240,8 @@ def mkdir():
     dest = safe_path(j.get('path',''))
     try:
         os.makedirs(os.path.join(dest, name), exist_ok=False)
+        listing.cache.invalidate(dest)
+        path_index.touch(os.path.join(dest, name))
         return "OK", 200
     except FileExistsError:
         return "已存在同名文件/文件夹", 400
@@ -181,31 +256,44 @@ def rename():
     if not os.path.exists(old):
         return "不存在", 404
     os.rename(old, new)
+    touched(old, new)
     return "OK", 200
 
 @app.route('/delete', methods=['POST'])
 @login_required
 def delete():
     j = request.get_json()
-    base = safe_path(j.get('path',''))
-    target = os.path.join(base, j.get('name',''))
-    if j.get('isdir'):
-        shutil.rmtree(target)
-    else:
-        os.remove(target)
+    target = safe_path(os.path.join(j.get('path',''), j.get('name','')))
+    if not os.path.exists(target) or target == UPLOAD_FOLDER:
+        return "不存在", 404
+    # 以磁盘上的实际类型为准，不信任前端传来的 isdir（模板里是字符串 "True" / "False"）
+    if os.path.isdir(target) and not os.path.islink(target):
+        # 目录可能很大：交给后台任务，前端轮询进度
+        job_id = job_queue.submit(current_user.id, 'delete', target=target)
+        return jsonify({'ok': True, 'job': job_id}), 202
+    os.remove(target)
+    touched(target)
     return "OK", 200
 
+@app.route('/cache-stats')
+@login_required
+def cache_stats():
+    # 目录缓存（本进程）、共享缓存层与用户身份缓存的命中 / 未命中计数
+    # users.misses 即 load_user 实际查库次数，hits 为省下的查询
+    return jsonify(listing=listing.cache.stats(), shared=shared_cache.stats(),
+                   users=user_cache.stats(), find=path_index.stats())
+
 @app.route('/download/<path:subpath>/<path:filename>')
 @login_required
 def download(subpath, filename):
     d = safe_path(subpath)
-    return send_from_directory(d, filename, as_attachment=True)
+    return serving.send_from(d, filename, as_attachment=True)
 
 @app.route('/media/<path:subpath>/<path:filename>')
 @login_required
 def media(subpath, filename):
     d = safe_path(subpath)
-    return send_from_directory(d, filename)
+    return serving.send_from(d, filename)
 
 @app.route('/edit', methods=['GET','POST'])
 @login_required
@@ -222,9 +310,14 @@ def edit():
     f = data.get('file','')
     try:
         open(os.path.join(p,f), 'w', encoding='utf-8').write(data.get('content',''))
+        listing.cache.invalidate(p)
+        path_index.touch(os.path.join(p,f))
         return "OK", 200
     except:
         return "写入出错", 500
 
+# --- ASGI 入口：uvicorn app:asgi_app（慢速上传 / 下载不占线程，见 asgi.py） ---
+asgi_app = asgi.WsgiBridge(app, stream_prefixes=('/upload', '/download/', '/media/', '/resumable/'))
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,279 @@
+"""
+asgi.py — 把 Flask（WSGI）应用挂到 ASGI 服务器上，慢速传输不再占住 worker。
+
+    uvicorn app:asgi_app --workers 2
+
+同步部署时，一个下载 2GB 文件的慢客户端会占住一个线程直到传完。这里的做法：
+  - 请求体先由事件循环异步收完（小的留在内存，大的写临时文件），再交给 Flask
+  - Flask 视图在一个有限大小的线程池里运行，只负责认证、路径校验和构造响应
+  - 文件路由的响应体逐块在线程池里读取、在事件循环里发送；
+    等待客户端收数据期间不占用任何线程
+其它路由整体在线程池里执行完再一次性发送；
+没有 Content-Length 的流式响应（模板流、NDJSON）同样逐块发送。
+
+文件读写优先使用 aiofiles（可选依赖），没有时用线程池完成同样的工作。
+"""
+
+import io
+import os
+import sys
+import asyncio
+import tempfile
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiofiles
+except ImportError:  # aiofiles 为可选依赖
+    aiofiles = None
+
+# 执行 Flask 视图 / 读文件块的线程数
+THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+# 请求体在内存中保留的上限，超出后写入临时文件
+SPOOL_MEMORY = 1024 * 1024
+
+_END = object()
+
+
+class _ThreadFile:
+    """aiofiles 不可用时的替代：在线程池中执行文件操作。"""
+
+    def __init__(self, f, pool):
+        self._f = f
+        self._pool = pool
+
+    async def write(self, data):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self._f.write, data)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._pool, self._f.close)
+
+
+async def _aopen(path, mode, pool):
+    if aiofiles is not None:
+        return await aiofiles.open(path, mode)
+    f = await asyncio.get_running_loop().run_in_executor(pool, open, path, mode)
+    return _ThreadFile(f, pool)
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class _Disconnected(Exception):
+    pass
+
+
+class WsgiBridge:
+    """
+    ASGI 应用：把 HTTP 请求转交给 wsgi_app。
+    stream_prefixes 中的路径（上传 / 下载）请求体先落盘、响应体逐块发送；
+    max_body 为请求体上限（默认取 Flask 的 MAX_CONTENT_LENGTH）。
+    """
+
+    def __init__(self, wsgi_app, stream_prefixes=(), threads=THREADS, max_body=None):
+        self.wsgi_app = wsgi_app
+        self.stream_prefixes = tuple(stream_prefixes)
+        self.threads = threads
+        self.max_body = max_body
+        self._pool = None
+        self._pid = None
+
+    @property
+    def pool(self):
+        # 线程池在第一次请求时创建（服务器 fork 出 worker 之后）
+        if self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+            self._pid = os.getpid()
+        return self._pool
+
+    def _limit(self):
+        if self.max_body is not None:
+            return self.max_body
+        config = getattr(self.wsgi_app, 'config', None)
+        return config.get('MAX_CONTENT_LENGTH') if config is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            raise RuntimeError('不支持的 ASGI 连接类型：%s' % scope['type'])
+        try:
+            body, length, spool = await self._read_body(scope, receive)
+        except _BodyTooLarge:
+            await _plain(send, 413, b'Request Entity Too Large')
+            return
+        except _Disconnected:
+            return
+        try:
+            environ = self._environ(scope, body, length)
+            if scope['path'].startswith(self.stream_prefixes):
+                await self._stream(environ, receive, send)
+            else:
+                await self._buffered(environ, receive, send)
+        finally:
+            body.close()
+            if spool is not None:
+                os.remove(spool)
+
+    async def _read_body(self, scope, receive):
+        """返回 (可读文件对象, 长度, 临时文件路径或 None)。"""
+        limit = self._limit()
+        for name, value in scope['headers']:
+            if name == b'content-length' and limit is not None and int(value) > limit:
+                raise _BodyTooLarge()
+        chunks, size, spool, f = [], 0, None, None
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise _Disconnected()
+                data = message.get('body', b'')
+                size += len(data)
+                if limit is not None and size > limit:
+                    raise _BodyTooLarge()
+                if f is not None:
+                    await f.write(data)
+                else:
+                    chunks.append(data)
+                    if size > SPOOL_MEMORY:
+                        fd, spool = tempfile.mkstemp(prefix='asgi-body-')
+                        os.close(fd)
+                        f = await _aopen(spool, 'wb', self.pool)
+                        await f.write(b''.join(chunks))
+                        chunks = []
+                if not message.get('more_body', False):
+                    break
+        except BaseException:
+            if f is not None:
+                await f.close()
+            if spool is not None:
+                os.remove(spool)
+            raise
+        if f is None:
+            return io.BytesIO(b''.join(chunks)), size, None
+        await f.close()
+        body = await asyncio.get_running_loop().run_in_executor(self.pool, open, spool, 'rb')
+        return body, size, spool
+
+    def _environ(self, scope, body, length):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'asgi.scope': scope,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = 'HTTP_' + name
+                environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
+
+    def _call(self, environ):
+        """在线程中调用 WSGI 应用，返回 (状态码, 响应头, 响应体, 迭代器, 已取出的第一块)。"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            # 响应头要等 _call 返回后才发送，出错时直接用新的状态覆盖即可
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                  for k, v in headers]
+            return lambda data: None  # 不支持已废弃的 write()
+
+        result = self.wsgi_app(environ, start_response)
+        it = iter(result)
+        # 有的应用在产出第一块时才调用 start_response
+        first = next(it, _END) if not started else None
+        return started['status'], started['headers'], result, it, first
+
+    async def _buffered(self, environ, receive, send):
+        def run():
+            status, headers, result, it, first = self._call(environ)
+            if not any(k == b'content-length' for k, _ in headers):
+                # 没有 Content-Length 的是流式响应（如 ?stream=1 的目录列表），改为逐块发送
+                return status, headers, None, (result, it, first)
+            try:
+                chunks = [] if first in (None, _END) else [first]
+                chunks.extend(it)
+                return status, headers, b''.join(chunks), None
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        # 视图和之后逐块读取响应体都在同一个 contextvars 上下文里执行，
+        # stream_with_context 推入的请求上下文在换了线程之后仍然可见
+        ctx = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        status, headers, body, rest = await loop.run_in_executor(self.pool, ctx.run, run)
+        if rest is not None:
+            await self._send_stream(ctx, status, headers, *rest, receive, send)
+            return
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _stream(self, environ, receive, send):
+        ctx = contextvars.copy_context()
+        status, headers, result, it, first = await asyncio.get_running_loop().run_in_executor(
+            self.pool, ctx.run, self._call, environ)
+        await self._send_stream(ctx, status, headers, result, it, first, receive, send)
+
+    async def _send_stream(self, ctx, status, headers, result, it, first, receive, send):
+        loop = asyncio.get_running_loop()
+        # 客户端中途断开时停止读取响应体
+        gone = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            chunk = first
+            while not gone.done():
+                if chunk is None:
+                    chunk = await loop.run_in_executor(self.pool, ctx.run, next, it, _END)
+                if chunk is _END:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = None
+            if not gone.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            gone.cancel()
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.pool, ctx.run, result.close)
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _plain(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                            (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,152 @@
+"""
+ASGI 模式下的慢客户端压测：一个进程同时服务大量慢速上传 / 下载。
+
+    python benchmarks/bench_asgi_slow_clients.py [客户端数，默认 1000] [文件 KB，默认 512] [每块间隔 ms，默认 50]
+
+在临时目录中加载 app.py，直接调用 app.asgi_app（不经过网络与 ASGI 服务器）：
+  - 一半客户端下载同一个文件，每收到一块（64KB）就 sleep 一次
+  - 一半客户端以同样的速度上传一个文件（multipart，/upload）
+所有客户端同时开始。同步 WSGI worker 中每个慢传输占住一个线程，
+作为对照给出同样线程数下的估算耗时：ceil(客户端数 / 线程数) × 单个传输耗时。
+"""
+
+import os
+import sys
+import math
+import time
+import types
+import shutil
+import asyncio
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHUNK = 64 * 1024
+
+
+def load_app(workdir):
+    path = os.path.join(ROOT, 'app.py')
+    with open(path, encoding='utf-8') as f:
+        src = f.read()
+    mod = types.ModuleType('bench_app')
+    mod.__file__ = os.path.join(workdir, 'app.py')
+    sys.modules['bench_app'] = mod
+    exec(compile(src, path, 'exec'), mod.__dict__)
+    return mod
+
+
+def session_cookie(mod):
+    client = mod.app.test_client()
+    form = {'username': 'bench', 'password': 'bench'}
+    client.post('/register', data=form)
+    client.post('/login', data=form)
+    return '; '.join('%s=%s' % (c.name, c.value) for c in client.cookie_jar)
+
+
+def scope(method, path, cookie, headers=()):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '',
+        'query_string': b'', 'scheme': 'http', 'http_version': '1.1',
+        'server': ('bench', 80), 'client': ('127.0.0.1', 0),
+        'headers': [(b'cookie', cookie.encode())] + list(headers),
+    }
+
+
+async def download(app, cookie, delay):
+    status, received, requested = None, 0, False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status, received
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        else:
+            received += len(message.get('body', b''))
+            await asyncio.sleep(delay)  # 慢速网络
+            if not message.get('more_body'):
+                done.set()
+
+    await app(scope('GET', '/download/bench/big.bin', cookie), receive, send)
+    return status, received
+
+
+async def upload(app, cookie, delay, index, payload, folder):
+    boundary = 'benchboundary%d' % index
+    head = ('--%s\r\nContent-Disposition: form-data; name="path"\r\n\r\nbench\r\n'
+            '--%s\r\nContent-Disposition: form-data; name="file"; filename="up%d.txt"\r\n'
+            'Content-Type: text/plain\r\n\r\n' % (boundary, boundary, index)).encode()
+    body = head + payload + ('\r\n--%s--\r\n' % boundary).encode()
+    pos, status = 0, None
+
+    async def receive():
+        nonlocal pos
+        if pos > 0:
+            await asyncio.sleep(delay)  # 慢速网络
+        data = body[pos:pos + CHUNK]
+        pos += len(data)
+        return {'type': 'http.request', 'body': data, 'more_body': pos < len(body)}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    headers = [(b'content-type', ('multipart/form-data; boundary=%s' % boundary).encode()),
+               (b'content-length', str(len(body)).encode())]
+    await app(scope('POST', '/upload', cookie, headers), receive, send)
+    return status, os.path.getsize(os.path.join(folder, 'up%d.txt' % index))
+
+
+async def run(app, cookie, clients, payload, delay, folder):
+    tasks = []
+    for i in range(clients):
+        if i % 2:
+            tasks.append(upload(app, cookie, delay, i, payload, folder))
+        else:
+            tasks.append(download(app, cookie, delay))
+    return await asyncio.gather(*tasks)
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    size = int(sys.argv[2]) * 1024 if len(sys.argv) > 2 else 512 * 1024
+    delay = (int(sys.argv[3]) if len(sys.argv) > 3 else 50) / 1000.0
+    workdir = tempfile.mkdtemp(prefix='bench-asgi-')
+    try:
+        mod = load_app(workdir)
+        cookie = session_cookie(mod)
+        payload = os.urandom(size)
+        folder = os.path.join(mod.UPLOAD_FOLDER, 'bench')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, 'big.bin'), 'wb') as f:
+            f.write(payload)
+        app = mod.asgi_app
+
+        t = time.perf_counter()
+        results = asyncio.run(run(app, cookie, clients, payload, delay, folder))
+        elapsed = time.perf_counter() - t
+
+        ok = sum(1 for status, n in results if status == 200 and n == size)
+        per_transfer = math.ceil(size / CHUNK) * delay
+        threads = app.threads
+        print('%d 个慢客户端（一半上传一半下载），每个 %d KB，单个传输约 %.2f 秒'
+              % (clients, size // 1024, per_transfer))
+        print('ASGI：%.2f 秒完成，成功 %d / %d，线程池 %d 线程（实际创建 %d）'
+              % (elapsed, ok, clients, threads, len(app.pool._threads)))
+        print('同步 WSGI（%d 线程）估算：%.2f 秒'
+              % (threads, math.ceil(clients / threads) * per_transfer))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+分块去重基准：在合成的“多版本”数据集上比较内容定义分块（cdc.chunks）
+与固定大小分块的去重率，并测量分块 + 哈希的吞吐。
+
+    python benchmarks/bench_cdc.py [基础文件 MB，默认 16] [版本数，默认 5]
+
+每个版本在上一版本基础上做少量随机编辑（插入 / 删除 / 覆盖若干字节），
+模拟“改了一帧的视频”“追加了几行的日志”之类的场景。
+去重率 = 逻辑总字节 / 实际需要存储的唯一块字节。
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import hashlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cdc  # noqa: E402
+
+
+def random_base(rng, size):
+    return bytearray(os.urandom(size))
+
+
+def text_base(rng, size):
+    words = [b'alpha', b'beta', b'gamma', b'delta', b'error', b'info', b'GET',
+             b'/index.html', b'200', b'404', b'user', b'login', b'upload']
+    out = bytearray()
+    while len(out) < size:
+        out += b' '.join(rng.choice(words) for _ in range(rng.randint(4, 16)))
+        out += b'\n'
+    return out[:size]
+
+
+def mutate(rng, data, edits=4):
+    data = bytearray(data)
+    for _ in range(edits):
+        pos = rng.randrange(len(data))
+        op = rng.choice(('insert', 'delete', 'overwrite'))
+        n = rng.randint(1, 4096)
+        if op == 'insert':
+            data[pos:pos] = os.urandom(n)
+        elif op == 'delete':
+            del data[pos:pos + n]
+        else:
+            data[pos:pos + n] = os.urandom(min(n, len(data) - pos))
+    return data
+
+
+def fixed_chunks(stream, size=cdc.AVG_SIZE):
+    while True:
+        data = stream.read(size)
+        if not data:
+            return
+        yield data
+
+
+def measure(versions, chunker):
+    seen = set()
+    logical = stored = 0
+    t = time.perf_counter()
+    for v in versions:
+        for data in chunker(io.BytesIO(v)):
+            digest = hashlib.sha256(data).digest()
+            logical += len(data)
+            if digest not in seen:
+                seen.add(digest)
+                stored += len(data)
+    elapsed = time.perf_counter() - t
+    return logical, stored, elapsed
+
+
+def main():
+    mb = float(sys.argv[1]) if len(sys.argv) > 1 else 16
+    nver = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    size = int(mb * 1024 * 1024)
+    rng = random.Random(42)
+
+    print('base=%.1f MB versions=%d' % (mb, nver))
+    print('%-8s %-6s %12s %12s %8s %10s' %
+          ('dataset', 'mode', 'logical MB', 'stored MB', 'ratio', 'MB/s'))
+    for name, make in (('random', random_base), ('text', text_base)):
+        versions = [make(rng, size)]
+        for _ in range(nver - 1):
+            versions.append(mutate(rng, versions[-1]))
+        for mode, chunker in (('cdc', cdc.chunks), ('fixed', fixed_chunks)):
+            logical, stored, elapsed = measure(versions, chunker)
+            print('%-8s %-6s %12.1f %12.1f %8.2f %10.1f' % (
+                name, mode, logical / 2**20, stored / 2**20,
+                logical / stored, logical / 2**20 / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+目录列举微基准：旧写法（listdir + isdir + stat）对比 listing.scan_dir。
+
+    python benchmarks/bench_listing.py [条目数，默认 100000]
+
+在临时目录中生成 N 个条目（约 1% 为子目录），分别统计：
+  - 墙钟时间（取 3 次最好成绩）
+  - 逐条目的 stat 类系统调用次数（通过包装 os.stat / DirEntry.stat 计数）
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import listing  # noqa: E402
+
+
+def make_tree(root, n):
+    for i in range(n):
+        p = os.path.join(root, 'f%06d.txt' % i)
+        if i % 100 == 0:
+            os.mkdir(p + '.d')
+        else:
+            with open(p, 'wb') as f:
+                f.write(b'x' * (i % 64))
+
+
+def legacy_with_stat(path):
+    out = []
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        st = os.stat(full)
+        out.append((name, os.path.isdir(full), st.st_size, st.st_mtime))
+    return out
+
+
+def legacy_names(path):
+    return [(n, os.path.isdir(os.path.join(path, n))) for n in os.listdir(path)]
+
+
+def best_of(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+class _CountingEntry:
+    def __init__(self, de, counter):
+        self._de, self._counter = de, counter
+
+    def __getattr__(self, name):
+        return getattr(self._de, name)
+
+    def stat(self, *a, **kw):
+        self._counter[0] += 1
+        return self._de.stat(*a, **kw)
+
+
+_real_scandir = os.scandir
+
+
+class _CountingScandir:
+    def __init__(self, path, counter):
+        self._it, self._counter = _real_scandir(path), counter
+
+    def __enter__(self):
+        return (_CountingEntry(de, self._counter) for de in self._it)
+
+    def __exit__(self, *exc):
+        self._it.close()
+
+
+def count_stats(fn, *args):
+    """对一次调用计数 os.stat / DirEntry.stat 次数（不计时）。"""
+    counter = [0]
+    real_stat = os.stat
+
+    def counting_stat(*a, **kw):
+        counter[0] += 1
+        return real_stat(*a, **kw)
+
+    os.stat = counting_stat
+    os.scandir = lambda p: _CountingScandir(p, counter)
+    try:
+        fn(*args)
+    finally:
+        os.stat = real_stat
+        os.scandir = _real_scandir
+    return counter[0]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    root = tempfile.mkdtemp(prefix='bench_listing_')
+    try:
+        make_tree(root, n)
+        cases = [
+            ('legacy listdir+isdir+stat', legacy_with_stat, (root,)),
+            ('scan_dir(stat=True)',       lambda p: list(listing.scan_dir(p)), (root,)),
+            ('legacy listdir+isdir',      legacy_names, (root,)),
+            ('scan_dir(stat=False)',      lambda p: list(listing.scan_dir(p, stat=False)), (root,)),
+        ]
+        print('entries: %d' % n)
+        print('%-28s %10s %14s' % ('case', 'wall(s)', 'stat calls'))
+        for label, fn, args in cases:
+            print('%-28s %10.3f %14d' % (label, best_of(fn, *args), count_stats(fn, *args)))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+/api/user/<id>/media 分页基准：页码（OFFSET）对比游标（keyset）。
+
+    python benchmarks/bench_media_pagination.py [条目数，默认 200000] [每页条数，默认 20]
+
+在临时目录中加载 图文.py，给一个用户灌入 N 条 media 记录，然后：
+  - 游标模式从第 1 页一直翻到最后一页，记录第 1 / 10 / 100 / 1000 / 10000 页的请求耗时
+  - 页码模式直接请求同样的页码
+每个数字取 5 次最好成绩（毫秒）。游标模式各页耗时应基本持平。
+"""
+
+import os
+import sys
+import time
+import types
+import shutil
+import sqlite3
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SAMPLE_PAGES = (1, 10, 100, 1000, 10000)
+
+
+def load_app(workdir):
+    """加载 图文.py（前两行是安装 / 运行说明，跳过）；数据库与上传目录都放在 workdir。"""
+    path = os.path.join(ROOT, '图文.py')
+    with open(path, encoding='utf-8') as f:
+        src = f.read().split('\n', 2)[2]
+    mod = types.ModuleType('tuwen')
+    mod.__file__ = os.path.join(workdir, '图文.py')
+    exec(compile(src, path, 'exec'), mod.__dict__)
+    return mod
+
+
+def fill(db_path, uid, n):
+    conn = sqlite3.connect(db_path)
+    base = time.time() - n
+    conn.executemany(
+        'INSERT INTO media(user_id, filename, kind, mime, size, mtime, width, height) '
+        'VALUES(?,?,?,?,?,?,?,?)',
+        ((uid, 'img%07d.jpg' % i, 'image', 'image/jpeg', 1000, base + i // 3, 640, 480)
+         for i in range(n)))
+    conn.commit()
+    conn.close()
+
+
+def best_of(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workdir = tempfile.mkdtemp(prefix='bench-media-')
+    try:
+        mod = load_app(workdir)
+        client = mod.app.test_client()
+        client.post('/register', data={'username': 'bench', 'password': 'bench'})
+        db_path = mod.app.config['DATABASE']
+        uid = sqlite3.connect(db_path).execute(
+            "SELECT id FROM user WHERE username='bench'").fetchone()[0]
+        fill(db_path, uid, n)
+        url = '/api/user/%d/media' % uid
+        pages = [p for p in SAMPLE_PAGES if (p - 1) * per_page < n]
+
+        cursor_ms, cursor, page = {}, '', 1
+        while cursor is not None and page <= pages[-1]:
+            query = {'cursor': cursor, 'per_page': per_page}
+            if page in pages:
+                cursor_ms[page] = best_of(lambda: client.get(url, query_string=query))
+            cursor = client.get(url, query_string=query).get_json()['next']
+            page += 1
+
+        print('%d 条记录，每页 %d 条（毫秒）' % (n, per_page))
+        print('%8s %10s %10s' % ('页码', 'OFFSET', '游标'))
+        for p in pages:
+            offset_ms = best_of(lambda: client.get(
+                url, query_string={'page': p, 'per_page': per_page}))
+            print('%8d %10.2f %10.2f' % (p, offset_ms, cursor_ms[p]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
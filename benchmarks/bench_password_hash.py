@@ -0,0 +1,68 @@
+"""
+每核每秒能处理多少次登录（密码验证），按哈希方案与强度列出。
+
+    python benchmarks/bench_password_hash.py [每项验证次数，默认 20]
+
+单线程：直接调用 verify()，得到一次验证的耗时。
+线程池：通过 check() 并发提交，线程数为 CPU 核数，得到整机吞吐再除以核数
+（对照组 SHA-256 只有单线程数字）。
+图文.py 旧版的无盐 SHA-256 作为对照；argon2 仅在安装了 argon2-cffi 时测试。
+"""
+
+import os
+import sys
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import passwords  # noqa: E402
+
+CASES = [
+    ('pbkdf2', 260000),
+    ('pbkdf2', 600000),
+    ('scrypt', 2 ** 14),
+    ('scrypt', 2 ** 15),
+    ('scrypt', 2 ** 16),
+    ('argon2', 2),
+    ('argon2', 3),
+]
+
+
+def measure(hasher, stored, n, cores):
+    t = time.perf_counter()
+    for _ in range(n):
+        assert hasher.verify(stored, 'correct horse')
+    single = (time.perf_counter() - t) / n
+    if hasher.needs_rehash(stored):
+        # 旧哈希经 check() 会被顺便升级，线程池数字没有意义
+        return single * 1000, 1 / single
+    with ThreadPoolExecutor(max_workers=cores) as clients:
+        t = time.perf_counter()
+        results = list(clients.map(lambda _: hasher.check(stored, 'correct horse'),
+                                   range(n * cores)))
+        elapsed = time.perf_counter() - t
+    assert all(ok for ok, _ in results)
+    return single * 1000, n * cores / elapsed / cores
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    cores = os.cpu_count() or 1
+    print('CPU 核数 %d，每项 %d 次' % (cores, n))
+    print('%-8s %10s %10s %14s' % ('方案', '强度', '单次 ms', '登录/秒/核'))
+    legacy = hashlib.sha256(b'correct horse').hexdigest()
+    ms, rate = measure(passwords.PasswordHasher(workers=cores), legacy, n * 1000, cores)
+    print('%-8s %10s %10.4f %14.0f' % ('sha256', '-', ms, rate))
+    for scheme, cost in CASES:
+        if scheme == 'argon2' and passwords.argon2 is None:
+            continue
+        hasher = passwords.PasswordHasher(scheme, cost, workers=cores)
+        ms, rate = measure(hasher, hasher.hash('correct horse'), n, cores)
+        print('%-8s %10d %10.2f %14.1f' % (scheme, cost, ms, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+文件名查找延迟：pathindex.PathIndex 在大量路径上的查询延迟。
+
+    python benchmarks/bench_path_find.py [路径数，默认 1000000]
+
+直接往分区索引里写入随机生成的相对路径（目录 3 层 + 文件名，mtime 随机），
+不在磁盘上真的创建文件；再对几类查询各跑若干次，输出 p50 / p95（毫秒）。
+对比：取出全部路径逐条匹配（即没有 trigram 索引时的做法，还不含 os.walk 的开销）。
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pathindex
+
+WORDS = ['photos', 'docs', 'music', 'video', 'report', 'invoice', 'backup', 'project',
+         'draft', 'final', '2023', '2024', 'summer', 'trip', 'notes', '照片', '合同', '报表']
+EXTS = ['jpg', 'png', 'mp4', 'mkv', 'txt', 'pdf', 'docx', 'mp3']
+RARE = 'zephyrine'
+
+QUERIES = {
+    '罕见子串': RARE,
+    '常见子串': 'report',
+    '中文': '合同',
+    '扩展名': '*.mkv',
+    '通配符': 'invoice_12*.pdf',
+    '带目录': 'summer/*/trip*',
+    '短关键词': 'q9',
+}
+ROUNDS = 20
+
+
+def make_rows(n):
+    rnd = random.Random(42)
+    now = time.time()
+    for i in range(n):
+        parent = '/'.join(rnd.choice(WORDS) for _ in range(3))
+        name = '%s_%d.%s' % (RARE if rnd.random() < 0.00002 else rnd.choice(WORDS), i,
+                             rnd.choice(EXTS))
+        yield parent + '/' + name, parent, 0, rnd.randrange(1 << 20), now - rnd.random() * 3e7
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    workdir = tempfile.mkdtemp(prefix='bench-find-')
+    try:
+        # base 不存在，后台线程的首次建索引什么也不做；partitions 为空，不做定期核对
+        index = pathindex.PathIndex(os.path.join(workdir, 'index'), os.path.join(workdir, 'files'),
+                                    partitions=lambda: [])
+        conn = index._conn('')
+        index.wait()
+        t = time.perf_counter()
+        conn.execute('BEGIN')
+        conn.executemany(pathindex._UPSERT, make_rows(n))
+        conn.execute('COMMIT')
+        print('%d 条路径，建索引 %.1f 秒' % (n, time.perf_counter() - t))
+        for label, q in QUERIES.items():
+            times = []
+            for _ in range(ROUNDS):
+                t = time.perf_counter()
+                items, more = index.find('', q)
+                times.append((time.perf_counter() - t) * 1000)
+            _, _, match = pathindex.compile_query(q)
+            t = time.perf_counter()
+            sum(1 for (path,) in conn.execute('SELECT path FROM paths') if match(path))
+            scan = (time.perf_counter() - t) * 1000
+            print('%-8s %-16s p50 %7.2f ms  p95 %7.2f ms  %3d 条%s   逐条匹配 %6.0f ms'
+                  % (label, q, pct(times, 0.5), pct(times, 0.95), len(items),
+                     '+' if more else ' ', scan))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
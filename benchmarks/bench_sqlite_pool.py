@@ -0,0 +1,91 @@
+"""
+登录 / 注册吞吐：连接池 + WAL（dbpool.py）对比原来的每请求新建连接 + 回滚日志。
+
+    python benchmarks/bench_sqlite_pool.py [应用，默认 一键运行.py] [线程数，默认 8] [每线程轮数，默认 200]
+
+在临时目录中加载应用，每个线程用自己的测试客户端反复执行：注册一个新用户，
+然后登录 4 次（读多写少）。两种配置各用一个全新的数据库：
+  before  SQLITE_POOL_SIZE=0、journal_mode=DELETE、synchronous=FULL（等同原来的 get_db）
+  after   dbpool 默认值（连接复用、WAL、synchronous=NORMAL）
+app.py 的密码哈希（pbkdf2）本身就很耗 CPU，数据库差异会被掩盖；
+一键运行.py 的登录基本只有数据库开销。
+"""
+
+import os
+import sys
+import time
+import types
+import shutil
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LOGINS_PER_ROUND = 4
+
+CONFIGS = {
+    'before': {'SQLITE_POOL_SIZE': 0, 'SQLITE_JOURNAL_MODE': 'DELETE',
+               'SQLITE_SYNCHRONOUS': 'FULL'},
+    'after': {},
+}
+
+
+def load_app(name, workdir):
+    """以 workdir 为应用目录加载 name（数据库、上传目录都落在 workdir）。"""
+    path = os.path.join(ROOT, name)
+    with open(path, encoding='utf-8') as f:
+        src = f.read()
+    if name == '图文.py':
+        src = src.split('\n', 2)[2]  # 前两行是安装 / 运行说明
+    mod = types.ModuleType('bench_app')
+    mod.__file__ = os.path.join(workdir, name)
+    sys.modules['bench_app'] = mod
+    exec(compile(src, path, 'exec'), mod.__dict__)
+    return mod
+
+
+def run(name, config, threads, rounds):
+    workdir = tempfile.mkdtemp(prefix='bench-pool-')
+    try:
+        mod = load_app(name, workdir)
+        mod.app.config.update(config)
+        mod.db_pool.clear()
+        errors = []
+
+        def worker(tid):
+            client = mod.app.test_client()
+            for i in range(rounds):
+                form = {'username': 'u%d_%d' % (tid, i), 'password': 'pw'}
+                codes = [client.post('/register', data=form).status_code]
+                codes += [client.post('/login', data=form).status_code
+                          for _ in range(LOGINS_PER_ROUND)]
+                errors.extend(c for c in codes if c >= 400)
+
+        pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        t = time.perf_counter()
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        elapsed = time.perf_counter() - t
+        ops = threads * rounds * (1 + LOGINS_PER_ROUND)
+        return ops / elapsed, len(errors), mod.db_pool.stats()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else '一键运行.py'
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    print('%s：%d 线程 × %d 轮（每轮 1 次注册 + %d 次登录）'
+          % (name, threads, rounds, LOGINS_PER_ROUND))
+    for label, config in CONFIGS.items():
+        rate, errors, stats = run(name, config, threads, rounds)
+        print('%-7s %8.0f 请求/秒  失败 %d  新建连接 %d  复用 %d'
+              % (label, rate, errors, stats['created'], stats['reused']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+全文检索延迟：textsearch.TextIndex 在大量文本行上的建索引耗时与查询延迟。
+
+    python benchmarks/bench_text_search.py [文件数，默认 400] [每个文件行数，默认 500]
+
+在临时目录中生成文本文件（随机词 + 少量中文），用 crawl() 建立索引，
+再对常见词 / 罕见词 / 多关键词 / 中文各查询若干次，输出 p50 / p95（毫秒）。
+对比：同样的查询逐个文件读取、做子串匹配（即没有索引时只能打开文件一个个找）。
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import textsearch
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel',
+         'india', 'juliet', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa',
+         'quebec', 'romeo', 'sierra', 'tango', 'uniform', 'victor', 'whiskey', 'xray']
+CJK = ['配置文件', '数据库连接', '用户登录', '缓存失效', '上传完成', '权限检查']
+RARE = 'zephyrine'
+
+QUERIES = {
+    '常见词': 'sierra',
+    '罕见词': RARE,
+    '多关键词': 'alpha tango',
+    '中文': '数据库连接',
+}
+ROUNDS = 20
+
+
+def make_tree(root, files, lines):
+    rnd = random.Random(42)
+    for i in range(files):
+        d = os.path.join(root, 'dir%02d' % (i % 20))
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, 'file%05d.log' % i), 'w', encoding='utf-8') as f:
+            for n in range(lines):
+                words = rnd.choices(WORDS, k=8)
+                if n % 50 == 0:
+                    words.append(rnd.choice(CJK))
+                if rnd.random() < 0.0005:
+                    words.append(RARE)
+                f.write('%d %s\n' % (n, ' '.join(words)))
+
+
+def grep(root, q):
+    hits = 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            with open(os.path.join(dirpath, name), encoding='utf-8') as f:
+                if q in f.read():
+                    hits += 1
+    return hits
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    workdir = tempfile.mkdtemp(prefix='bench-fts-')
+    try:
+        root = os.path.join(workdir, 'files')
+        make_tree(root, files, lines)
+        # partitions 为空：后台线程不做核对，由这里显式 crawl()
+        index = textsearch.TextIndex(os.path.join(workdir, 'index'), lambda p: root,
+                                     partitions=lambda: [], extensions={'log'})
+        t = time.perf_counter()
+        index.crawl('')
+        print('%d 个文件 × %d 行 = %d 行，建索引 %.1f 秒（分词器 %s）'
+              % (files, lines, files * lines, time.perf_counter() - t, textsearch.TOKENIZER))
+        for label, q in QUERIES.items():
+            times = []
+            for _ in range(ROUNDS):
+                t = time.perf_counter()
+                items, _ = index.search('', q)
+                times.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            grep(root, q.split()[0])
+            scan = (time.perf_counter() - t) * 1000
+            print('%-6s p50 %7.2f ms  p95 %7.2f ms  首页 %2d 条   逐个文件查找 %8.0f ms'
+                  % (label, pct(times, 0.5), pct(times, 0.95), len(items), scan))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
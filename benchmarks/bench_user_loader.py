@@ -0,0 +1,89 @@
+"""
+load_user 缓存效果：一次画廊页面加载省下多少次用户表查询。
+
+    python benchmarks/bench_user_loader.py [图片数，默认 50] [页面加载次数，默认 20]
+
+在临时目录中加载 图文.py，注册并登录一个用户，放入 N 张图片，然后反复模拟一次
+画廊页面加载：/dashboard 各页 + 页面上引用的全部缩略图 / 原图 + /api/user/<id>/media。
+没有缓存时每次 load_user 都是一次查库，即 hits + misses；有缓存时只有 misses。
+"""
+
+import os
+import re
+import sys
+import time
+import types
+import shutil
+import sqlite3
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 页面里引用的缩略图 / 原图地址
+URL_RE = re.compile(r'(?:src|href|poster)="(/(?:thumb|uploads)/[^"]+)"')
+
+
+def load_app(workdir):
+    """加载 图文.py（前两行是安装 / 运行说明，跳过）；数据库与上传目录都放在 workdir。"""
+    path = os.path.join(ROOT, '图文.py')
+    with open(path, encoding='utf-8') as f:
+        src = f.read().split('\n', 2)[2]
+    mod = types.ModuleType('tuwen')
+    mod.__file__ = os.path.join(workdir, '图文.py')
+    exec(compile(src, path, 'exec'), mod.__dict__)
+    return mod
+
+
+def page_load(client, uid, pages):
+    """模拟浏览器打开画廊的全部页；返回发出的请求数。"""
+    count = 0
+    for page in range(1, pages + 1):
+        html = client.get('/dashboard', query_string={'page': page}).get_data(as_text=True)
+        count += 1
+        for url in set(URL_RE.findall(html)):
+            client.get(url)
+            count += 1
+    client.get('/api/user/%d/media' % uid)
+    return count + 1
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    loads = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workdir = tempfile.mkdtemp(prefix='bench-user-')
+    try:
+        mod = load_app(workdir)
+        client = mod.app.test_client()
+        client.post('/register', data={'username': 'bench', 'password': 'bench'})
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        uid = sqlite3.connect(mod.app.config['DATABASE']).execute(
+            "SELECT id FROM user WHERE username='bench'").fetchone()[0]
+        folder = mod.get_user_folder(uid)
+        for i in range(n):
+            with open(os.path.join(folder, 'img%04d.png' % i), 'wb') as f:
+                f.write(b'\x89PNG\r\n\x1a\n')
+        with mod.app.app_context():
+            mod.reconcile_media()
+        pages = (n + mod.PER_PAGE - 1) // mod.PER_PAGE
+
+        page_load(client, uid, pages)  # 预热：首次查库
+        before = mod.user_cache.stats()
+        t = time.perf_counter()
+        requests = sum(page_load(client, uid, pages) for _ in range(loads))
+        elapsed = time.perf_counter() - t
+        after = mod.user_cache.stats()
+
+        hits = (after['local_hits'] + after['shared_hits']
+                - before['local_hits'] - before['shared_hits'])
+        misses = after['misses'] - before['misses']
+        print('%d 张图片，%d 页；%d 次页面加载，共 %d 个请求，%.1f ms/次'
+              % (n, pages, loads, requests, elapsed * 1000 / loads))
+        print('  无缓存时查库：%.1f 次' % ((hits + misses) / loads))
+        print('  有缓存时查库：%.1f 次（省下 %.1f 次）' % (misses / loads, hits / loads))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
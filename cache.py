@@ -0,0 +1,291 @@
+"""
+cache.py — 多个 gunicorn worker 共享的两级缓存。
+
+  本地层：进程内 LRU（带 TTL），命中不产生任何 IO
+  共享层：同机所有 worker 共用的 SQLite 文件（WAL 模式）；
+          装了 redis 且设置了 CACHE_REDIS_URL 时改用 Redis
+  失效通道：invalidate() 在共享层记一条事件（Redis 下为 pub/sub 消息），
+          其它 worker 每次访问缓存前先 sync()：SQLite 用 PRAGMA data_version
+          判断是否有别的连接提交过，有才去读新事件并丢弃本地副本。
+          不需要后台线程，一个 worker 里的改名在其它 worker 的下一次请求即可见。
+
+值用 pickle 序列化，只应存放本应用自己产生的数据。
+"""
+
+import os
+import re
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# 本地层默认容量与过期时间
+LOCAL_MAX_ITEMS = 10000
+DEFAULT_TTL = 300
+
+# 失效事件保留时长（秒）；比它更久没访问缓存的 worker 会整体清空本地层
+EVENT_RETENTION = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+  key     TEXT PRIMARY KEY,
+  value   BLOB NOT NULL,
+  expires REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+  seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+  key    TEXT NOT NULL,
+  prefix INTEGER NOT NULL,
+  origin INTEGER NOT NULL,
+  ts     REAL NOT NULL
+);
+"""
+
+
+class SQLiteBackend:
+    """共享层：一个 WAL 模式的 SQLite 文件，每个线程一个连接（fork 后重建）。"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._seq = None
+        self._seq_pid = None
+        self._writes = 0
+
+    def _conn(self):
+        loc = self._local
+        if getattr(loc, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            loc.conn, loc.pid, loc.version = conn, os.getpid(), None
+        return loc.conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value, expires FROM kv WHERE key=?', (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        self._conn().execute('INSERT OR REPLACE INTO kv(key, value, expires) VALUES(?,?,?)',
+                             (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires))
+
+    def delete(self, key, prefix=False):
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if prefix:
+                # 用范围条件代替 LIKE，可以走主键索引
+                conn.execute('DELETE FROM kv WHERE key >= ? AND key < ?',
+                             (key, key + '\U0010ffff'))
+            else:
+                conn.execute('DELETE FROM kv WHERE key=?', (key,))
+            conn.execute('INSERT INTO events(key, prefix, origin, ts) VALUES(?,?,?,?)',
+                         (key, int(prefix), os.getpid(), now))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                conn.execute('DELETE FROM events WHERE ts < ?', (now - EVENT_RETENTION,))
+                conn.execute('DELETE FROM kv WHERE expires < ?', (now,))
+
+    def poll(self):
+        """
+        返回自上次 poll 以来其它进程发出的失效事件 [(key, prefix)]；
+        若事件已被清理、无法得知漏掉了什么，返回 None（调用方应清空本地层）。
+        """
+        conn = self._conn()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._local.version and self._seq_pid == os.getpid():
+            return []
+        self._local.version = version
+        with self._lock:
+            if self._seq_pid != os.getpid():
+                self._seq = conn.execute(
+                    'SELECT COALESCE(MAX(seq), 0) FROM events').fetchone()[0]
+                self._seq_pid = os.getpid()
+                return []
+            first = conn.execute('SELECT MIN(seq) FROM events').fetchone()[0]
+            rows = conn.execute('SELECT seq, key, prefix, origin FROM events '
+                                'WHERE seq > ? ORDER BY seq', (self._seq,)).fetchall()
+            if rows:
+                missed = first > self._seq + 1  # 中间的事件已被清理
+                self._seq = rows[-1][0]
+                if missed:
+                    return None
+        pid = os.getpid()
+        return [(key, bool(prefix)) for _, key, prefix, origin in rows if origin != pid]
+
+
+class RedisBackend:
+    """共享层：Redis（可选依赖 redis）；失效事件走 pub/sub。"""
+
+    name = 'redis'
+    CHANNEL = 'cache:invalidate'
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._pid = None
+
+    def get(self, key):
+        data = self._redis.get(key)
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        ex=int(ttl) if ttl else None)
+
+    def delete(self, key, prefix=False):
+        if prefix:
+            pattern = re.sub(r'([*?\[\]\\])', r'\\\1', key) + '*'
+            for k in self._redis.scan_iter(match=pattern, count=1000):
+                self._redis.delete(k)
+        else:
+            self._redis.delete(key)
+        self._redis.publish(self.CHANNEL, pickle.dumps((key, prefix, os.getpid())))
+
+    def poll(self):
+        if self._pid != os.getpid():
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(self.CHANNEL)
+            self._pid = os.getpid()
+        out = []
+        while True:
+            msg = self._pubsub.get_message()
+            if msg is None:
+                return out
+            if msg.get('type') == 'message':
+                key, prefix, origin = pickle.loads(msg['data'])
+                if origin != os.getpid():
+                    out.append((key, prefix))
+
+
+class TieredCache:
+    """本地 LRU + 可选共享层 + 跨进程失效。"""
+
+    def __init__(self, shared=None, max_items=LOCAL_MAX_ITEMS, ttl=DEFAULT_TTL):
+        self.shared = shared
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (value, 过期时刻)
+        self._subscribers = []
+        self.local_hits = self.shared_hits = self.misses = 0
+        self.remote_invalidations = 0
+
+    def subscribe(self, fn):
+        """fn(key, prefix) 会在收到其它进程的失效事件时被调用。"""
+        self._subscribers.append(fn)
+
+    def sync(self):
+        """处理其它进程发来的失效事件；每次读缓存前调用，开销为一次 PRAGMA。"""
+        if self.shared is None:
+            return
+        events = self.shared.poll()
+        if events is None:
+            self.clear_local()
+            events = [('', True)]
+        for key, prefix in events:
+            self._drop(key, prefix)
+            self.remote_invalidations += 1
+            for fn in self._subscribers:
+                fn(key, prefix)
+
+    def _drop(self, key, prefix):
+        with self._lock:
+            if prefix:
+                for k in [k for k in self._items if k.startswith(key)]:
+                    del self._items[k]
+            else:
+                self._items.pop(key, None)
+
+    def get(self, key, default=None, local=True):
+        """local=False 时只查共享层（调用方自己有进程内缓存时使用）。"""
+        self.sync()
+        now = time.monotonic()
+        if local:
+            with self._lock:
+                item = self._items.get(key)
+                if item is not None and item[1] > now:
+                    self._items.move_to_end(key)
+                    self.local_hits += 1
+                    return item[0]
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                if local:
+                    self._set_local(key, value, self.ttl)
+                return value
+        self.misses += 1
+        return default
+
+    def _set_local(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def set(self, key, value, ttl=None, local=True):
+        if local:
+            self._set_local(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl or self.ttl)
+
+    def get_or_load(self, key, loader, ttl=None):
+        """缓存未命中时调用 loader()；loader 返回 None 不缓存。"""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key, prefix=False):
+        """删除 key（prefix=True 时删除所有以 key 开头的键），并通知其它进程。"""
+        self._drop(key, prefix)
+        if self.shared is not None:
+            self.shared.delete(key, prefix)
+
+    def clear_local(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        total = self.local_hits + self.shared_hits + self.misses
+        return {
+            'backend': self.shared.name if self.shared is not None else 'local',
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.local_hits + self.shared_hits) / total, 4) if total else 0.0,
+            'remote_invalidations': self.remote_invalidations,
+            'local_items': len(self._items),
+        }
+
+
+def from_env(default_path, **kwargs):
+    """
+    按环境变量选择共享层：
+      CACHE_REDIS_URL=redis://...   使用 Redis
+      CACHE_BACKEND=local           只用进程内缓存（单 worker 时）
+      否则                          SQLite 文件 CACHE_DB（默认 default_path）
+    kwargs 传给 TieredCache（max_items、ttl）。
+    """
+    url = os.environ.get('CACHE_REDIS_URL')
+    if url:
+        return TieredCache(RedisBackend(url), **kwargs)
+    if os.environ.get('CACHE_BACKEND', '').lower() == 'local':
+        return TieredCache(**kwargs)
+    return TieredCache(SQLiteBackend(os.environ.get('CACHE_DB', default_path)), **kwargs)
@@ -0,0 +1,67 @@
+"""
+cdc.py — 基于 Gear 滚动哈希的内容定义分块（content-defined chunking）。
+
+切分点由内容决定：在文件中间插入 / 删除若干字节，只会影响附近一两个块，
+其余块的哈希不变，从而可以按块去重。参数默认平均块约 64 KB。
+"""
+
+import random
+
+MIN_SIZE = 16 * 1024
+AVG_SIZE = 64 * 1024
+MAX_SIZE = 256 * 1024
+
+# 读取输入流的粒度
+READ_SIZE = 1024 * 1024
+
+# 32 位哈希：纯 Python 下比 64 位更快，高位仍覆盖最近 32 个字节
+_MASK32 = 0xFFFFFFFF
+
+# 固定种子生成 Gear 表，保证不同进程 / 不同版本切分结果一致
+_rng = random.Random(0x9E3779B97F4A7C15)
+GEAR = [_rng.getrandbits(32) for _ in range(256)]
+del _rng
+
+
+def _mask_for(avg_size: int) -> int:
+    # 取哈希高位判断切分点，平均每 avg_size 字节命中一次
+    bits = max(1, avg_size.bit_length() - 1)
+    return ((1 << bits) - 1) << (32 - bits)
+
+
+def cut_point(data, n: int, min_size=MIN_SIZE, avg_size=AVG_SIZE,
+              max_size=MAX_SIZE) -> int:
+    """在 data[:n] 中寻找第一个切分点，返回块长度。"""
+    if n <= min_size:
+        return n
+    end = min(n, max_size)
+    mask = _mask_for(avg_size)
+    gear = GEAR
+    h = 0
+    # 前 min_size 字节不可能切分，直接跳过
+    for i, b in enumerate(data[min_size:end], min_size):
+        h = ((h << 1) + gear[b]) & _MASK32
+        if not h & mask:
+            return i + 1
+    return end
+
+
+def chunks(stream, min_size=MIN_SIZE, avg_size=AVG_SIZE, max_size=MAX_SIZE,
+           read_size=READ_SIZE):
+    """
+    从可读流中逐块产出 bytes；内存占用约为 max_size + read_size。
+    """
+    buf = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buf) < max_size:
+            data = stream.read(read_size)
+            if not data:
+                eof = True
+                break
+            buf += data
+        if not buf:
+            return
+        n = cut_point(buf, len(buf), min_size, avg_size, max_size)
+        yield bytes(buf[:n])
+        del buf[:n]
@@ -0,0 +1,121 @@
+"""
+dbpool.py — sqlite3 应用共用的连接池。
+
+原来每个请求都 sqlite3.connect 一次、请求结束就关掉，预编译语句缓存随连接一起丢掉；
+数据库又是默认的回滚日志模式，写事务期间所有读都要等。这里改为：
+
+  - 每个 worker 进程一个小连接池，请求开始时取出、teardown 时归还（fork 后自动重建）
+  - 新连接统一设置 WAL、synchronous、busy_timeout 等 PRAGMA
+  - 连接复用，sqlite3 自带的语句缓存（cached_statements）跨请求生效
+  - 等锁超时（database is locked）返回 503 + Retry-After，而不是 500
+
+用法：
+    db_pool = dbpool.ConnectionPool(DB_PATH, app)
+    def get_db():
+        return db_pool.get()
+
+以下 app.config 项可覆盖默认值（在第一次取连接前设置，或设置后调用 clear()）：
+    SQLITE_POOL_SIZE            每个进程最多保留的空闲连接数；0 表示不复用（每请求新建）
+    SQLITE_BUSY_TIMEOUT         等待写锁的秒数
+    SQLITE_JOURNAL_MODE         WAL / DELETE / ...
+    SQLITE_SYNCHRONOUS          NORMAL / FULL / ...
+    SQLITE_CACHED_STATEMENTS    每个连接缓存的预编译语句数
+"""
+
+import os
+import sqlite3
+import threading
+
+from flask import g
+
+DEFAULTS = {
+    'SQLITE_POOL_SIZE': 8,
+    'SQLITE_BUSY_TIMEOUT': 5.0,
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_CACHED_STATEMENTS': 256,
+}
+
+
+class ConnectionPool:
+    def __init__(self, path, app=None, detect_types=0, foreign_keys=False):
+        self.path = path
+        self.detect_types = detect_types
+        self.foreign_keys = foreign_keys
+        self.config = dict(DEFAULTS)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+        self.created = self.reused = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.config = app.config
+        app.teardown_appcontext(self._teardown)
+        app.register_error_handler(sqlite3.OperationalError, _busy_handler)
+
+    def _connect(self):
+        cfg = self.config
+        timeout = float(cfg['SQLITE_BUSY_TIMEOUT'])
+        conn = sqlite3.connect(self.path, timeout=timeout, detect_types=self.detect_types,
+                               cached_statements=int(cfg['SQLITE_CACHED_STATEMENTS']),
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=%s' % cfg['SQLITE_JOURNAL_MODE'])
+        conn.execute('PRAGMA synchronous=%s' % cfg['SQLITE_SYNCHRONOUS'])
+        conn.execute('PRAGMA busy_timeout=%d' % int(timeout * 1000))
+        if self.foreign_keys:
+            conn.execute('PRAGMA foreign_keys=ON')
+        self.created += 1
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 继承来的连接不能跨进程使用，直接丢弃
+                self._idle, self._pid = [], os.getpid()
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn):
+        # 请求里没提交的事务不能带给下一个请求
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < int(self.config['SQLITE_POOL_SIZE']):
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def get(self):
+        """当前应用上下文的连接；同一请求内多次调用返回同一个连接。"""
+        conn = g.get('_dbpool_conn')
+        if conn is None:
+            conn = g._dbpool_conn = self.acquire()
+        return conn
+
+    def _teardown(self, exc):
+        conn = g.pop('_dbpool_conn', None)
+        if conn is not None:
+            self.release(conn)
+
+    def clear(self):
+        """关闭所有空闲连接（修改配置后调用）。"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        return {'created': self.created, 'reused': self.reused, 'idle': len(self._idle)}
+
+
+def _busy_handler(e):
+    if 'locked' in str(e) or 'busy' in str(e):
+        return '数据库繁忙，请稍后重试', 503, {'Retry-After': '1'}
+    raise e
@@ -1,12 +1,23 @@
 import os
+import re
+import json
 import hashlib
+import sqlite3
+import tempfile
 import time
 from io import BytesIO
+import click
 from flask import (
-    Flask, request, flash, send_file,
-    render_template_string, redirect, url_for,
+    Flask, g, request, flash,
+    render_template, redirect, url_for,
     jsonify
 )
+from jinja2 import DictLoader
+
+import cdc
+import listing
+import serving
+import streaming
 
 # ─────────────────────────────────────────────────────
 # 配置部分
@@ -27,6 +38,31 @@ app.secret_key = os.environ.get("FLASK_SECRET", "请替换为自己的随机字
 # 限制单文件最大上传 100 MB
 app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024
 
+# 上传时每次读取/哈希/写入的块大小，即单个上传的内存峰值
+CHUNK_SIZE = 1024 * 1024
+
+# 上传过程中的临时文件前缀（列表时跳过）
+TMP_PREFIX = ".upload-"
+
+# 分片目录布局：SHARD_LEVELS=2 时 cid=abcdef... → STORAGE/ab/cd/abcdef...
+# 默认 0 即平铺布局（与已有的存储目录一致）；修改后用 `flask migrate-layout` 在线迁移
+SHARD_LEVELS = int(os.environ.get("STORAGE_SHARD_LEVELS", "0"))
+SHARD_WIDTH = int(os.environ.get("STORAGE_SHARD_WIDTH", "2"))
+
+# 可选的分块存储模式（STORAGE_CHUNKED=1）：按内容定义分块，块级去重。
+# 文件 CID 仍是整个文件的 SHA-256，对应一个列出各块哈希的清单；
+# 块与清单固定按两级分片存放，不受上面的 SHARD_* 影响。
+CHUNKED_STORAGE = os.environ.get("STORAGE_CHUNKED") == "1"
+CHUNK_DIR = os.path.join(STORAGE, "chunks")
+MANIFEST_DIR = os.path.join(STORAGE, "manifests")
+
+# 元数据索引（SQLite），避免每次列表都扫描 STORAGE
+INDEX_DB = os.path.join(BASEDIR, "storage.db")
+
+# 首页 / 列表接口的分页
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 
 # ─────────────────────────────────────────────────────
 # 辅助函数
@@ -42,6 +78,344 @@ def sha256_bytes(data: bytes) -> str:
     return h.hexdigest()
 
 
+_cid_re = re.compile(r"^[0-9a-f]{64}$")
+_shard_re = re.compile(r"^[0-9a-f]{1,63}$")
+
+# 遍历 / 查找时最多进入的分片目录层数与单层目录名的最大宽度
+# （与当前配置无关，旧布局的目录也能找到）
+MAX_SHARD_DEPTH = 8
+MAX_SHARD_WIDTH = 4
+
+
+def is_cid(name: str) -> bool:
+    """CID 必须是 64 位小写十六进制（同时挡住 ../ 之类的路径）。"""
+    return bool(_cid_re.match(name))
+
+
+def blob_path(cid: str) -> str:
+    """按当前分片配置计算 blob 的存放路径。"""
+    parts = [cid[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+    return os.path.join(STORAGE, *parts, cid)
+
+
+def _probe_blob(cid: str, top: str, pos: int = 0, depth: int = 0):
+    # 沿 CID 的前缀逐层试探实际存在的分片目录（任意层数 / 宽度），只进入存在的目录
+    path = os.path.join(top, cid)
+    if depth and os.path.isfile(path):
+        return path
+    if depth < MAX_SHARD_DEPTH:
+        for w in range(1, MAX_SHARD_WIDTH + 1):
+            sub = os.path.join(top, cid[pos:pos + w])
+            if os.path.isdir(sub):
+                found = _probe_blob(cid, sub, pos + w, depth + 1)
+                if found:
+                    return found
+    return None
+
+
+def find_blob(cid: str):
+    """
+    查找 blob 的实际路径，不存在返回 None。
+    迁移期间 blob 可能还在平铺路径或任意一种旧的分片布局下：先查当前分片路径、
+    再查平铺路径、再沿 CID 前缀试探其它分片布局，最后再查一次当前路径
+    （迁移可能恰好发生在几次检查之间）。上传去重同样经由这里，不会重复写入。
+    """
+    if not is_cid(cid):
+        return None
+    sharded, flat = blob_path(cid), os.path.join(STORAGE, cid)
+    for path in (sharded, flat):
+        if os.path.isfile(path):
+            return path
+    found = _probe_blob(cid, STORAGE)
+    if found:
+        return found
+    return sharded if os.path.isfile(sharded) else None
+
+
+def iter_blobs(top: str = STORAGE, depth: int = 0):
+    """
+    遍历存储目录，产出 (路径, listing.Entry)；平铺与任意层数 / 宽度的分片布局都能遍历，
+    改过 SHARD_* 之后 migrate-layout 仍能找到旧布局下的 blob。
+    只进入名称为十六进制（分片目录）的子目录，chunks / manifests 等不会被当成分片。
+    """
+    for e in listing.scan_dir(top):
+        if e.is_dir:
+            if depth < MAX_SHARD_DEPTH and _shard_re.match(e.name):
+                yield from iter_blobs(os.path.join(top, e.name), depth + 1)
+        elif is_cid(e.name):
+            yield os.path.join(top, e.name), e
+
+
+def _fanout(root: str, name: str) -> str:
+    return os.path.join(root, name[:2], name[2:4], name)
+
+
+def chunk_path(digest: str) -> str:
+    return _fanout(CHUNK_DIR, digest)
+
+
+def manifest_path(cid: str) -> str:
+    return _fanout(MANIFEST_DIR, cid)
+
+
+def load_manifest(cid: str):
+    """读取分块清单 {size, chunks: [[块哈希, 长度], ...]}，不存在返回 None。"""
+    if not is_cid(cid):
+        return None
+    try:
+        with open(manifest_path(cid), encoding="utf-8") as rf:
+            return json.load(rf)
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path: str, data: bytes):
+    # 先写 STORAGE 下的临时文件再改名，读者永远看不到半个文件
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=STORAGE, prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as wf:
+            wf.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def store_stream(stream) -> tuple:
+    """
+    流式写入：按 CHUNK_SIZE 分块读取上传流，边计算 SHA-256
+    边写入 STORAGE 下的临时文件，读完后原子改名为 CID；
+    若该 CID 已存在则直接丢弃临时文件。
+    返回 (cid, size)；上传内容为空时返回 (None, 0)。
+    """
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=STORAGE, prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as wf:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+                wf.write(chunk)
+                size += len(chunk)
+        if not size:
+            os.remove(tmp)
+            return None, 0
+
+        cid = h.hexdigest()
+        if find_blob(cid):
+            os.remove(tmp)
+        else:
+            path = blob_path(cid)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        return cid, size
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def store_chunked(stream) -> tuple:
+    """
+    分块写入：用 cdc.chunks() 按内容切块，每块以自身 SHA-256 存一次，
+    已有的块直接复用；最后写入文件 CID 对应的清单。
+    返回值与 store_stream() 相同。
+    """
+    h = hashlib.sha256()
+    size = 0
+    refs = []
+    for data in cdc.chunks(stream):
+        digest = hashlib.sha256(data).hexdigest()
+        path = chunk_path(digest)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        refs.append([digest, len(data)])
+        h.update(data)
+        size += len(data)
+    if not size:
+        return None, 0
+
+    cid = h.hexdigest()
+    if not find_blob(cid) and not os.path.exists(manifest_path(cid)):
+        manifest = {"size": size, "chunks": refs}
+        _write_atomic(manifest_path(cid), json.dumps(manifest).encode("utf-8"))
+    return cid, size
+
+
+def ingest(stream) -> tuple:
+    """按配置选择整文件或分块存储。"""
+    return store_chunked(stream) if CHUNKED_STORAGE else store_stream(stream)
+
+
+def read_manifest_range(manifest: dict, start: int, end: int):
+    """读出分块文件的 [start, end) 区间，只打开覆盖到的块。"""
+    offset = 0
+    for digest, length in manifest["chunks"]:
+        if offset >= end:
+            break
+        if offset + length > start:
+            lo, hi = max(start - offset, 0), min(end - offset, length)
+            with open(chunk_path(digest), "rb") as rf:
+                rf.seek(lo)
+                yield rf.read(hi - lo)
+        offset += length
+
+
+def send_blob(cid: str):
+    """
+    以附件形式发送 CID 对应的内容（整文件或分块），不存在返回 None。
+    CID 即内容哈希，天然是强 ETag，且内容永不改变，可长期缓存。
+    """
+    path = find_blob(cid)
+    if path:
+        return serving.send_path(path, mimetype="application/octet-stream",
+                                 download_name=cid, as_attachment=True,
+                                 etag=cid, immutable=True, private=False)
+    manifest = load_manifest(cid)
+    if manifest:
+        return serving.serve(
+            manifest["size"],
+            lambda s, e: read_manifest_range(manifest, s, e),
+            etag=cid, mtime=os.stat(manifest_path(cid)).st_mtime,
+            download_name=cid, as_attachment=True,
+            immutable=True, private=False,
+        )
+    return None
+
+
+# ─────────────────────────────────────────────────────
+# 元数据索引：cid / size / mtime / 原始文件名 / mime
+# ─────────────────────────────────────────────────────
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+  cid      TEXT PRIMARY KEY,
+  size     INTEGER NOT NULL,
+  mtime    REAL NOT NULL,
+  filename TEXT,
+  mime     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_mtime ON blobs(mtime, cid);
+CREATE INDEX IF NOT EXISTS idx_blobs_size  ON blobs(size, cid);
+"""
+
+# 允许的排序列（白名单，直接拼进 SQL）
+SORT_COLUMNS = {"updated": "mtime", "mtime": "mtime", "size": "size", "cid": "cid"}
+
+
+def get_index():
+    """当前应用上下文共用的索引连接。"""
+    db = getattr(g, "_index", None)
+    if db is None:
+        db = g._index = sqlite3.connect(INDEX_DB)
+        db.row_factory = sqlite3.Row
+    return db
+
+
+@app.teardown_appcontext
+def close_index(exc):
+    db = getattr(g, "_index", None)
+    if db is not None:
+        db.close()
+
+
+def init_index():
+    with sqlite3.connect(INDEX_DB) as db:
+        db.executescript(INDEX_SCHEMA)
+        empty = db.execute("SELECT 1 FROM blobs LIMIT 1").fetchone() is None
+    # 首次启用索引时，从现有 STORAGE 导入一次
+    if empty:
+        with app.app_context():
+            reconcile_index()
+
+
+def index_blob(cid: str, size: int, filename: str = None, mime: str = None):
+    """
+    上传后登记一条记录；同一 CID 再次上传时保留首次的文件名。
+    """
+    st = os.stat(find_blob(cid) or manifest_path(cid))
+    db = get_index()
+    db.execute(
+        "INSERT OR IGNORE INTO blobs(cid, size, mtime, filename, mime) "
+        "VALUES(?,?,?,?,?)",
+        (cid, size, st.st_mtime, filename, mime)
+    )
+    db.commit()
+
+
+def query_files(sort="updated", order="desc", limit=PAGE_SIZE, offset=0,
+                min_size=None, max_size=None) -> tuple:
+    """
+    基于索引的分页查询，返回 (items, total)。
+    排序列带 cid 作为次序键，保证分页稳定。
+    """
+    col = SORT_COLUMNS.get(sort, "mtime")
+    direction = "ASC" if order == "asc" else "DESC"
+    where, args = [], []
+    if min_size is not None:
+        where.append("size >= ?")
+        args.append(min_size)
+    if max_size is not None:
+        where.append("size <= ?")
+        args.append(max_size)
+    cond = (" WHERE " + " AND ".join(where)) if where else ""
+
+    db = get_index()
+    total = db.execute("SELECT COUNT(*) FROM blobs" + cond, args).fetchone()[0]
+    rows = db.execute(
+        f"SELECT * FROM blobs{cond} ORDER BY {col} {direction}, cid {direction} "
+        "LIMIT ? OFFSET ?",
+        args + [limit, offset]
+    ).fetchall()
+    items = [{
+        "cid": r["cid"],
+        "size": r["size"],
+        "updated": format_time(r["mtime"]),
+        "filename": r["filename"],
+        "mime": r["mime"],
+    } for r in rows]
+    return items, total
+
+
+def reconcile_index(fix: bool = True) -> dict:
+    """
+    以 STORAGE 目录为准核对索引：
+      - missing：目录里有、索引里没有 → 补登记（无文件名）
+      - stale：  索引里有、目录里没有 → 删除记录
+      - changed：大小或修改时间不一致 → 更新
+    fix=False 时只统计不修改。
+    """
+    on_disk = {e.name: e for e in list_all_files()}
+    db = get_index()
+    indexed = {r["cid"]: r for r in db.execute("SELECT cid, size, mtime FROM blobs")}
+
+    missing = [cid for cid in on_disk if cid not in indexed]
+    stale = [cid for cid in indexed if cid not in on_disk]
+    changed = [cid for cid, r in indexed.items()
+               if cid in on_disk and (r["size"], r["mtime"]) !=
+               (on_disk[cid].size, on_disk[cid].mtime)]
+
+    if fix:
+        db.executemany(
+            "INSERT INTO blobs(cid, size, mtime) VALUES(?,?,?)",
+            [(cid, on_disk[cid].size, on_disk[cid].mtime) for cid in missing]
+        )
+        db.executemany("DELETE FROM blobs WHERE cid=?", [(cid,) for cid in stale])
+        db.executemany(
+            "UPDATE blobs SET size=?, mtime=? WHERE cid=?",
+            [(on_disk[cid].size, on_disk[cid].mtime, cid) for cid in changed]
+        )
+        db.commit()
+    return {"missing": len(missing), "stale": len(stale), "changed": len(changed)}
+
+
 def format_time(ts: float) -> str:
     """
     将 UNIX 时间戳格式化为人类可读形式。
@@ -51,33 +425,27 @@ def format_time(ts: float) -> str:
 
 def list_all_files() -> list:
     """
-    遍历 STORAGE 目录，返回所有文件的元信息列表。
-    每项包含：
-      - cid: 文件名（SHA-256 哈希）
-      - size: 文件大小（字节）
-      - updated: 最后修改时间（字符串）
+    遍历 STORAGE 目录，返回所有文件的 listing.Entry（name 即 CID）；
+    分块存储的文件取清单中的原始大小。
+    只在重建 / 核对索引时使用，页面和接口都走 query_files()。
     """
-    items = []
-    for fname in os.listdir(STORAGE):
-        path = os.path.join(STORAGE, fname)
-        if not os.path.isfile(path):
-            continue
-        stat = os.stat(path)
-        items.append({
-            "cid": fname,
-            "size": stat.st_size,
-            "updated": format_time(stat.st_mtime)
-        })
-    # 按更新时间降序排序
-    items.sort(key=lambda x: x["updated"], reverse=True)
-    return items
+    entries = [e for _, e in iter_blobs()]
+    if os.path.isdir(MANIFEST_DIR):
+        for _, e in iter_blobs(MANIFEST_DIR):
+            entries.append(e._replace(size=load_manifest(e.name)["size"]))
+    return entries
+
+
+init_index()
 
 
 # ─────────────────────────────────────────────────────
-# HTML 基础模板（使用 Bootstrap 5 CDN）
+# HTML 模板（使用 Bootstrap 5 CDN）
+# 注册为具名模板，首次渲染时编译一次，之后复用 jinja 环境里缓存的模板对象
 # ─────────────────────────────────────────────────────
 
-BASE_HTML = """<!doctype html>
+TEMPLATES = {
+    "base.html": """<!doctype html>
 <html lang="zh-CN">
 <head>
   <meta charset="utf-8">
@@ -100,11 +468,78 @@ BASE_HTML = """<!doctype html>
       </div>
     {% endif %}
   {% endwith %}
-  {{ body }}
+  {% block body %}{% endblock %}
 </div>
 <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
 </body>
-</html>"""
+</html>""",
+
+    "uploaded.html": """{% extends "base.html" %}
+{% block body %}
+<div class="card">
+  <div class="card-body">
+    <h5 class="card-title text-success">上传成功 ✅</h5>
+    <p class="card-text">CID：<code>{{ cid }}</code></p>
+    <p>文件大小：<strong>{{ "{:,}".format(size) }} bytes</strong></p>
+    <p>
+      <a href="{{ url_for('download_file', cid=cid) }}" class="btn btn-primary">下载该文件</a>
+      <a href="{{ url_for('index') }}" class="btn btn-secondary">返回首页</a>
+    </p>
+  </div>
+</div>
+{% endblock %}""",
+
+    "index.html": """{% extends "base.html" %}
+{% block body %}
+<div class="row g-4 mb-4">
+  <!-- 上传卡片 -->
+  <div class="col-md-6">
+    <div class="card h-100">
+      <div class="card-header">上传文件 → 生成 CID</div>
+      <div class="card-body">
+        <form method="post" enctype="multipart/form-data">
+          <input type="file" name="file" class="form-control mb-3" required>
+          <button type="submit" class="btn btn-success">上传并生成 CID</button>
+        </form>
+      </div>
+    </div>
+  </div>
+  <!-- 下载卡片 -->
+  <div class="col-md-6">
+    <div class="card h-100">
+      <div class="card-header">根据 CID 下载文件</div>
+      <div class="card-body">
+        <form method="post">
+          <input type="text" name="cid" class="form-control mb-3"
+                 placeholder="请输入 SHA-256 哈希 (CID)" required>
+          <button type="submit" class="btn btn-primary">下载文件</button>
+        </form>
+      </div>
+    </div>
+  </div>
+</div>
+<!-- 文件列表 -->
+<h5>已存储文件列表（最近 {{ files|length }} 个，共 {{ total }} 个）</h5>
+<table class="table table-sm">
+  <thead>
+    <tr><th>CID</th><th>文件名</th><th>大小（bytes）</th><th>更新时间</th><th>操作</th></tr>
+  </thead>
+  <tbody>
+  {% for f in files %}
+    <tr>
+      <td>{{ f.cid }}</td>
+      <td>{{ f.filename or '' }}</td>
+      <td>{{ "{:,}".format(f.size) }}</td>
+      <td>{{ f.updated }}</td>
+      <td><a href="{{ url_for('download_file', cid=f.cid) }}"
+             class="btn btn-sm btn-outline-primary">下载</a></td>
+    </tr>
+  {% endfor %}
+  </tbody>
+</table>
+{% endblock %}""",
+}
+app.jinja_loader = DictLoader(TEMPLATES)
 
 
 # ─────────────────────────────────────────────────────
@@ -117,97 +552,24 @@ def index():
         # —— 文件上传 —— 
         if "file" in request.files:
             f = request.files["file"]
-            buf = f.read()
-            if not buf:
+            # 边读边算 CID，第一次上传时才落盘
+            cid, size = ingest(f.stream)
+            if not cid:
                 flash("⚠️ 上传文件为空，请重新选择。")
                 return redirect(url_for("index"))
-
-            # 计算 CID
-            cid = sha256_bytes(buf)
-            path = os.path.join(STORAGE, cid)
-
-            # 如果第一次上传，则保存文件
-            if not os.path.exists(path):
-                with open(path, "wb") as wf:
-                    wf.write(buf)
+            index_blob(cid, size, f.filename, listing.guess_mime(f.filename or ""))
 
             # 上传结果页面
-            body = f"""
-            <div class="card">
-              <div class="card-body">
-                <h5 class="card-title text-success">上传成功 ✅</h5>
-                <p class="card-text">CID：<code>{cid}</code></p>
-                <p>文件大小：<strong>{len(buf):,} bytes</strong></p>
-                <p>
-                  <a href="{url_for('download_file', cid=cid)}" class="btn btn-primary">下载该文件</a>
-                  <a href="{url_for('index')}" class="btn btn-secondary">返回首页</a>
-                </p>
-              </div>
-            </div>
-            """
-            return render_template_string(BASE_HTML, title="上传结果", body=body)
+            return render_template("uploaded.html", title="上传结果", cid=cid, size=size)
 
         # —— 根据 CID 下载 —— 
         cid = request.form.get("cid", "").strip()
         if cid:
             return redirect(url_for("download_file", cid=cid))
 
-    # GET 请求：渲染首页，含上传/下载表单和文件列表
-    file_list = list_all_files()
-    rows = ""
-    for f in file_list:
-        rows += (
-            f"<tr>"
-            f"<td>{f['cid']}</td>"
-            f"<td>{f['size']:,}</td>"
-            f"<td>{f['updated']}</td>"
-            f"<td>"
-            f"<a href='{url_for('download_file', cid=f['cid'])}' "
-            f"class='btn btn-sm btn-outline-primary'>下载</a>"
-            f"</td>"
-            f"</tr>"
-        )
-
-    body = f"""
-    <div class="row g-4 mb-4">
-      <!-- 上传卡片 -->
-      <div class="col-md-6">
-        <div class="card h-100">
-          <div class="card-header">上传文件 → 生成 CID</div>
-          <div class="card-body">
-            <form method="post" enctype="multipart/form-data">
-              <input type="file" name="file" class="form-control mb-3" required>
-              <button type="submit" class="btn btn-success">上传并生成 CID</button>
-            </form>
-          </div>
-        </div>
-      </div>
-      <!-- 下载卡片 -->
-      <div class="col-md-6">
-        <div class="card h-100">
-          <div class="card-header">根据 CID 下载文件</div>
-          <div class="card-body">
-            <form method="post">
-              <input type="text" name="cid" class="form-control mb-3"
-                     placeholder="请输入 SHA-256 哈希 (CID)" required>
-              <button type="submit" class="btn btn-primary">下载文件</button>
-            </form>
-          </div>
-        </div>
-      </div>
-    </div>
-    <!-- 文件列表 -->
-    <h5>已存储文件列表</h5>
-    <table class="table table-sm">
-      <thead>
-        <tr><th>CID</th><th>大小（bytes）</th><th>更新时间</th><th>操作</th></tr>
-      </thead>
-      <tbody>
-        {rows}
-      </tbody>
-    </table>
-    """
-    return render_template_string(BASE_HTML, title="首页", body=body)
+    # GET 请求：渲染首页，含上传/下载表单和最近的文件列表（逐块输出）
+    file_list, total = query_files(limit=PAGE_SIZE)
+    return streaming.stream_template("index.html", title="首页", files=file_list, total=total)
 
 
 # ─────────────────────────────────────────────────────
@@ -220,18 +582,11 @@ def download_file(cid):
     根据路径参数 cid，检查存储目录是否存在对应文件，
     若存在则以附件形式返回二进制流，否则重定向回首页并给出警告。
     """
-    path = os.path.join(STORAGE, cid)
-    if not os.path.isfile(path):
+    resp = send_blob(cid)
+    if resp is None:
         flash(f"⚠️ 未找到文件 CID：{cid}")
         return redirect(url_for("index"))
-
-    # send_file 支持文件路径或 BytesIO
-    return send_file(
-        path,
-        as_attachment=True,
-        download_name=cid,
-        mimetype="application/octet-stream"
-    )
+    return resp
 
 
 # ─────────────────────────────────────────────────────
@@ -249,19 +604,14 @@ def api_upload():
         return jsonify({"error": "missing file"}), 400
 
     f = request.files["file"]
-    buf = f.read()
-    if not buf:
+    cid, size = ingest(f.stream)
+    if not cid:
         return jsonify({"error": "empty file"}), 400
-
-    cid = sha256_bytes(buf)
-    path = os.path.join(STORAGE, cid)
-    if not os.path.exists(path):
-        with open(path, "wb") as wf:
-            wf.write(buf)
+    index_blob(cid, size, f.filename, listing.guess_mime(f.filename or ""))
 
     return jsonify({
         "cid": cid,
-        "size": len(buf),
+        "size": size,
         "url": url_for("api_download", cid=cid, _external=True)
     })
 
@@ -272,25 +622,68 @@ def api_download(cid):
     接口：文件下载
     - 直接返回二进制流，未找到则返回 404 JSON
     """
-    path = os.path.join(STORAGE, cid)
-    if not os.path.isfile(path):
+    resp = send_blob(cid)
+    if resp is None:
         return jsonify({"error": "not found"}), 404
-
-    return send_file(
-        path,
-        as_attachment=True,
-        download_name=cid,
-        mimetype="application/octet-stream"
-    )
+    return resp
 
 
 @app.route("/api/list", methods=["GET"])
 def api_list():
     """
-    接口：列出所有已存储文件
-    - 返回 JSON 数组，每项包含 {cid, size, updated}
+    接口：列出已存储文件（查询元数据索引）
+    - 参数：sort=updated|size|cid，order=desc|asc，
+            limit（<= MAX_PAGE_SIZE），offset，min_size，max_size
+    - 返回 JSON 数组，每项包含 {cid, size, updated, filename, mime}
+    - 响应头 X-Total-Count 为满足过滤条件的总数
     """
-    return jsonify(list_all_files())
+    limit = request.args.get("limit", PAGE_SIZE, type=int)
+    items, total = query_files(
+        sort=request.args.get("sort", "updated"),
+        order=request.args.get("order", "desc"),
+        limit=max(1, min(limit, MAX_PAGE_SIZE)),
+        offset=max(0, request.args.get("offset", 0, type=int)),
+        min_size=request.args.get("min_size", type=int),
+        max_size=request.args.get("max_size", type=int),
+    )
+    resp = jsonify(items)
+    resp.headers["X-Total-Count"] = str(total)
+    return resp
+
+
+# ─────────────────────────────────────────────────────
+# 命令行：重建 / 核对索引
+#   FLASK_APP=i.py flask reindex            以 STORAGE 为准修复索引
+#   FLASK_APP=i.py flask reindex --verify   只检查，不一致时退出码为 1
+# ─────────────────────────────────────────────────────
+
+@app.cli.command("reindex")
+@click.option("--verify", is_flag=True, help="只核对，不修改索引")
+def reindex_command(verify):
+    stats = reconcile_index(fix=not verify)
+    click.echo("missing={missing} stale={stale} changed={changed}".format(**stats))
+    if verify and any(stats.values()):
+        raise SystemExit(1)
+
+
+# ─────────────────────────────────────────────────────
+# 命令行：在线迁移存储布局
+#   FLASK_APP=i.py flask migrate-layout
+# 逐个把不在当前分片路径上的 blob 原子改名过去；迁移期间服务照常，
+# 读取经由 find_blob() 同时兼容新旧路径。
+# ─────────────────────────────────────────────────────
+
+@app.cli.command("migrate-layout")
+def migrate_layout_command():
+    moved = 0
+    for path, e in iter_blobs():
+        target = blob_path(e.name)
+        if path == target:
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        moved += 1
+    click.echo(f"moved={moved} layout={SHARD_LEVELS}x{SHARD_WIDTH}")
 
 
 # ─────────────────────────────────────────────────────
@@ -0,0 +1,464 @@
+"""
+jobs.py — 耗时文件操作（复制 / 移动 / 删除 / 打包）的后台任务队列，供各应用共用。
+
+请求里只做参数校验并提交任务，立即返回任务 id；任务在后台线程池中执行，
+状态与进度写在 SQLite 任务表里，任何 worker 都能查询、取消。
+
+接口（默认挂在 /jobs 下）：
+  GET    /jobs                 当前用户最近的任务
+  GET    /jobs/<id>            → {state, bytes_done, bytes_total, items_done, items_total, error}
+  POST   /jobs/<id>/cancel     请求取消（运行中的任务在下一个数据块处停止）
+  GET    /jobs/client.js       浏览器端 waitJob() / cancelJob()
+
+state：queued → running → done / failed / cancelled。
+取消或失败的复制 / 打包会删除已写出的部分；删除任务无法撤销已删掉的文件。
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, jsonify, Response
+
+# 复制 / 打包时每次读写的块大小，也是检查取消的粒度
+COPY_CHUNK = 1024 * 1024
+
+# 进度写库的最小间隔（秒）
+FLUSH_INTERVAL = 0.5
+
+# 已结束的任务保留时长
+KEEP_SECONDS = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id          TEXT PRIMARY KEY,
+  queue       TEXT NOT NULL,
+  owner       TEXT NOT NULL,
+  kind        TEXT NOT NULL,
+  params      TEXT NOT NULL,
+  state       TEXT NOT NULL,
+  cancel      INTEGER NOT NULL DEFAULT 0,
+  pid         INTEGER,
+  bytes_done  INTEGER NOT NULL DEFAULT 0,
+  bytes_total INTEGER NOT NULL DEFAULT 0,
+  items_done  INTEGER NOT NULL DEFAULT 0,
+  items_total INTEGER NOT NULL DEFAULT 0,
+  error       TEXT,
+  created     REAL NOT NULL,
+  updated     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs(queue, owner, created);
+"""
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Job:
+    """处理函数看到的任务句柄：登记总量、推进进度、检查是否被取消。"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self.bytes_done = self.bytes_total = 0
+        self.items_done = self.items_total = 0
+        self._flushed = 0.0
+
+    def total(self, nbytes, items):
+        self.bytes_total, self.items_total = nbytes, items
+        self.flush()
+
+    def advance(self, nbytes=0, items=0):
+        self.bytes_done += nbytes
+        self.items_done += items
+        if time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """写入进度并检查取消标记（取消请求可能来自另一个 worker）。"""
+        self._flushed = time.monotonic()
+        cancel = self.queue._progress(self)
+        if cancel:
+            raise Cancelled()
+
+
+def _tally(job, path):
+    """统计 path 下的文件数与字节数（不跟随符号链接）。"""
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size, 1
+    nbytes, items = 0, 1
+    for root, dirs, files in os.walk(path):
+        items += len(dirs) + len(files)
+        for name in files:
+            try:
+                nbytes += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+        job.advance()
+    return nbytes, items
+
+
+def _copy_file(job, src, dst):
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        job.advance(items=1)
+        return
+    with open(src, "rb") as fi, open(dst, "wb") as fo:
+        while True:
+            buf = fi.read(COPY_CHUNK)
+            if not buf:
+                break
+            fo.write(buf)
+            job.advance(len(buf))
+    shutil.copystat(src, dst)
+    job.advance(items=1)
+
+
+def _copy_tree(job, src, dst):
+    if not os.path.isdir(src) or os.path.islink(src):
+        _copy_file(job, src, dst)
+        return
+    os.makedirs(dst)
+    job.advance(items=1)
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        for name in dirs:
+            s, d = os.path.join(root, name), os.path.join(target, name)
+            if os.path.islink(s):
+                os.symlink(os.readlink(s), d)
+            else:
+                os.makedirs(d)
+            job.advance(items=1)
+        for name in files:
+            _copy_file(job, os.path.join(root, name), os.path.join(target, name))
+    shutil.copystat(src, dst)
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def do_copy(job, src, dst, count=True):
+    if os.path.lexists(dst):
+        raise ValueError("目标已存在")
+    if count:
+        job.total(*_tally(job, src))
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        _copy_tree(job, src, dst)
+    except BaseException:
+        _remove(dst)
+        raise
+
+
+def do_move(job, src, dst):
+    if os.path.lexists(dst):
+        raise ValueError("目标已存在")
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.rename(src, dst)
+        job.total(0, 1)
+        job.advance(items=1)
+        return
+    except OSError:
+        pass  # 跨文件系统：复制后删除源
+    nbytes, items = _tally(job, src)
+    job.total(nbytes * 2, items * 2)
+    do_copy(job, src, dst, count=False)
+    do_delete(job, src, count=False)
+
+
+def do_delete(job, target, count=True):
+    if count:
+        job.total(*_tally(job, target))
+    if not os.path.isdir(target) or os.path.islink(target):
+        nbytes = os.lstat(target).st_size
+        os.remove(target)
+        job.advance(nbytes, 1)
+        return
+    for root, dirs, files in os.walk(target, topdown=False):
+        for name in files:
+            p = os.path.join(root, name)
+            nbytes = os.lstat(p).st_size
+            os.remove(p)
+            job.advance(nbytes, 1)
+        for name in dirs:
+            p = os.path.join(root, name)
+            if os.path.islink(p):
+                os.remove(p)
+            else:
+                os.rmdir(p)
+            job.advance(items=1)
+    os.rmdir(target)
+    job.advance(items=1)
+
+
+def _zip_file(job, zf, path, base):
+    info = zipfile.ZipInfo.from_file(path, os.path.relpath(path, base))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with open(path, "rb") as fi, zf.open(info, "w") as fo:
+        while True:
+            buf = fi.read(COPY_CHUNK)
+            if not buf:
+                break
+            fo.write(buf)
+            job.advance(len(buf))
+    job.advance(items=1)
+
+
+def do_archive(job, src, dst):
+    """把 src（文件或目录）打包为 zip 文件 dst。"""
+    if os.path.lexists(dst):
+        raise ValueError("目标已存在")
+    job.total(*_tally(job, src))
+    tmp = dst + ".part"
+    base = os.path.dirname(src)
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            if not os.path.isdir(src):
+                _zip_file(job, zf, src, base)
+            for root, dirs, files in os.walk(src):
+                zf.write(root, os.path.relpath(root, base))
+                job.advance(items=1)
+                for name in files:
+                    _zip_file(job, zf, os.path.join(root, name), base)
+        os.replace(tmp, dst)
+    except BaseException:
+        _remove(tmp)
+        raise
+
+
+HANDLERS = {"copy": do_copy, "move": do_move, "delete": do_delete, "archive": do_archive}
+
+# 各类任务影响到的路径（用于结束后刷新目录缓存）
+AFFECTED = {"copy": ("dst",), "move": ("src", "dst"), "delete": ("target",), "archive": ("dst",)}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class JobQueue:
+    """
+    持久化的任务队列。name 用来区分共用同一个数据库文件的不同应用；
+    on_change(*paths)：任务结束（无论成功与否）后以受影响的路径回调，用于刷新缓存。
+    """
+
+    def __init__(self, path, name="default", workers=2, on_change=None):
+        self.path = path
+        self.name = name
+        self.workers = workers
+        self.on_change = on_change
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cancel = set()
+        self._pool = None
+        self._pid = None
+        self._recover()
+
+    def _conn(self):
+        loc = self._local
+        if getattr(loc, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            loc.conn, loc.pid = conn, os.getpid()
+        return loc.conn
+
+    def _executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="jobs-" + self.name)
+                self._pid = os.getpid()
+            return self._pool
+
+    def _recover(self):
+        """执行进程已退出却仍未结束的任务标记为失败。"""
+        conn = self._conn()
+        for row in conn.execute("SELECT id, pid FROM jobs WHERE queue=? AND state IN "
+                                "('queued', 'running')", (self.name,)).fetchall():
+            if row["pid"] is None or not _pid_alive(row["pid"]):
+                conn.execute("UPDATE jobs SET state='failed', error=?, updated=? WHERE id=?",
+                             ("服务重启，任务中断", time.time(), row["id"]))
+        conn.execute("DELETE FROM jobs WHERE queue=? AND state IN ('done', 'failed', 'cancelled') "
+                     "AND updated < ?", (self.name, time.time() - KEEP_SECONDS))
+
+    def submit(self, owner, kind, **params):
+        if kind not in HANDLERS:
+            raise ValueError("未知的任务类型：%s" % kind)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs(id, queue, owner, kind, params, state, pid, created, updated) "
+            "VALUES(?,?,?,?,?,?,?,?,?)",
+            (job_id, self.name, str(owner), kind, json.dumps(params), "queued",
+             os.getpid(), now, now))
+        self._executor().submit(self._run, job_id, kind, params)
+        return job_id
+
+    def _progress(self, job):
+        conn = self._conn()
+        conn.execute("UPDATE jobs SET bytes_done=?, bytes_total=?, items_done=?, items_total=?, "
+                     "updated=? WHERE id=?",
+                     (job.bytes_done, job.bytes_total, job.items_done, job.items_total,
+                      time.time(), job.id))
+        if job.id in self._cancel:
+            return True
+        return bool(conn.execute("SELECT cancel FROM jobs WHERE id=?", (job.id,)).fetchone()[0])
+
+    def _finish(self, job, state, error=None):
+        self._conn().execute(
+            "UPDATE jobs SET state=?, error=?, bytes_done=?, bytes_total=?, items_done=?, "
+            "items_total=?, updated=? WHERE id=?",
+            (state, error, job.bytes_done, job.bytes_total, job.items_done, job.items_total,
+             time.time(), job.id))
+        self._cancel.discard(job.id)
+
+    def _run(self, job_id, kind, params):
+        job = Job(self, job_id)
+        conn = self._conn()
+        started = conn.execute("UPDATE jobs SET state='running', updated=? "
+                               "WHERE id=? AND state='queued' AND cancel=0",
+                               (time.time(), job_id)).rowcount
+        if not started:
+            return  # 开始前已被取消
+        try:
+            HANDLERS[kind](job, **params)
+        except Cancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            self._finish(job, "failed", str(e) or type(e).__name__)
+        else:
+            self._finish(job, "done")
+        finally:
+            if self.on_change:
+                self.on_change(*(params[k] for k in AFFECTED[kind]))
+
+    def cancel(self, job_id, owner):
+        """请求取消；返回任务当前状态，任务不存在时抛 KeyError。"""
+        conn = self._conn()
+        now = time.time()
+        # 还没开始的直接标记为已取消；运行中的由执行线程在下一次写进度时停止
+        conn.execute("UPDATE jobs SET cancel=1, state='cancelled', updated=? WHERE id=? "
+                     "AND queue=? AND owner=? AND state='queued'",
+                     (now, job_id, self.name, str(owner)))
+        if conn.execute("UPDATE jobs SET cancel=1, updated=? WHERE id=? AND queue=? "
+                        "AND owner=? AND state='running'",
+                        (now, job_id, self.name, str(owner))).rowcount:
+            self._cancel.add(job_id)
+        return self.get(job_id, owner)
+
+    def get(self, job_id, owner):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id=? AND queue=? AND owner=?",
+                                   (job_id, self.name, str(owner))).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return _public(row)
+
+    def list(self, owner, limit=50):
+        rows = self._conn().execute(
+            "SELECT * FROM jobs WHERE queue=? AND owner=? ORDER BY created DESC LIMIT ?",
+            (self.name, str(owner), limit)).fetchall()
+        return [_public(r) for r in rows]
+
+
+def _public(row):
+    out = {k: row[k] for k in ("id", "kind", "state", "bytes_done", "bytes_total",
+                               "items_done", "items_total", "error", "created", "updated")}
+    out["cancel_requested"] = bool(row["cancel"])
+    return out
+
+
+def create_blueprint(queue, guard=None, owner=lambda: "", url_prefix="/jobs"):
+    """
+    生成任务查询 / 取消接口的 Blueprint。
+    - guard：视图装饰器（如 login_required）
+    - owner()：当前用户标识，只能看到自己的任务
+    """
+    bp = Blueprint("jobs", __name__, url_prefix=url_prefix)
+    wrap = guard or (lambda f: f)
+
+    @bp.route("", methods=["GET"])
+    @wrap
+    def job_list():
+        return jsonify({"ok": True, "jobs": queue.list(owner())})
+
+    @bp.route("/<job_id>", methods=["GET"])
+    @wrap
+    def job_status(job_id):
+        try:
+            return jsonify({"ok": True, **queue.get(job_id, owner())})
+        except KeyError:
+            return jsonify({"ok": False, "error": "任务不存在"}), 404
+
+    @bp.route("/<job_id>/cancel", methods=["POST"])
+    @wrap
+    def job_cancel(job_id):
+        try:
+            return jsonify({"ok": True, **queue.cancel(job_id, owner())})
+        except KeyError:
+            return jsonify({"ok": False, "error": "任务不存在"}), 404
+
+    @bp.route("/client.js")
+    def client_js():
+        return Response(CLIENT_JS, mimetype="application/javascript")
+
+    return bp
+
+
+CLIENT_JS = r"""
+// waitJob(id, onProgress, base) → Promise<任务>
+// 每 500ms 轮询一次任务状态；onProgress(job) 可用 bytes_done / bytes_total 显示进度。
+// 任务完成时 resolve，失败或被取消时以错误信息 reject。
+function waitJob(id, onProgress, base){
+  base = base || '/jobs';
+  return new Promise((resolve, reject) => {
+    (function poll(){
+      fetch(base + '/' + id, {credentials: 'same-origin'})
+        .then(r => r.json())
+        .then(job => {
+          if(job.ok === false) throw job.error;
+          if(onProgress) onProgress(job);
+          if(job.state === 'done') resolve(job);
+          else if(job.state === 'failed') reject(job.error || '任务失败');
+          else if(job.state === 'cancelled') reject('任务已取消');
+          else setTimeout(poll, 500);
+        })
+        .catch(reject);
+    })();
+  });
+}
+
+// cancelJob(id, base) → Promise<任务>
+function cancelJob(id, base){
+  return fetch((base || '/jobs') + '/' + id + '/cancel',
+               {method: 'POST', credentials: 'same-origin'}).then(r => r.json());
+}
+
+// jobProgressText(job) → "12.3 / 45.6 MB" 或 "120 / 300 项"
+function jobProgressText(job){
+  if(job.bytes_total > 0){
+    let mb = n => (n / 1048576).toFixed(1);
+    return mb(job.bytes_done) + ' / ' + mb(job.bytes_total) + ' MB';
+  }
+  return job.items_done + ' / ' + job.items_total + ' 项';
+}
+"""
@@ -0,0 +1,507 @@
+"""
+listing.py — 基于 os.scandir 的目录列举引擎，供各个应用共用。
+
+os.listdir + os.path.isdir + os.stat 每个条目要两三次系统调用；
+os.scandir 在读目录时就拿到了条目类型（d_type），is_dir() 不再额外 stat，
+只有确实需要大小 / 修改时间时才对每个条目 stat 一次。
+
+另有进程内的目录列表缓存 cache（见 ListingCache）：浏览路由读缓存，
+修改文件的路由调用 cache.invalidate()；Linux 上用 inotify 感知应用之外的改动，
+其它平台退回按目录 mtime + 短 TTL 校验。
+"""
+
+import os
+import re
+import time
+import heapq
+import fnmatch
+import ctypes
+import ctypes.util
+import struct
+import threading
+import mimetypes
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+
+# 紧凑的条目记录；stat=False 时 size / mtime 为 None
+Entry = namedtuple('Entry', 'name is_dir size mtime mime')
+
+
+@lru_cache(maxsize=1024)
+def _mime_for_ext(ext):
+    return mimetypes.guess_type('x' + ext)[0] or 'application/octet-stream'
+
+
+def guess_mime(name):
+    """按扩展名猜 MIME 类型（按扩展名缓存结果）。"""
+    return _mime_for_ext(os.path.splitext(name)[1].lower())
+
+
+def scan_dir(path, stat=True, files_only=False):
+    """
+    逐项产出目录 path 下的 Entry。
+    - stat=False：只用 DirEntry 自带的类型信息，不做任何逐条目系统调用
+    - files_only=True：跳过子目录
+    读取失败（如悬空符号链接）的条目直接跳过。
+    """
+    with os.scandir(path) as it:
+        for de in it:
+            try:
+                is_dir = de.is_dir()
+                if files_only and (is_dir or not de.is_file()):
+                    continue
+                if stat:
+                    st = de.stat()
+                    size, mtime = st.st_size, st.st_mtime
+                else:
+                    size = mtime = None
+            except OSError:
+                continue
+            yield Entry(de.name, is_dir, size, mtime,
+                        None if is_dir else guess_mime(de.name))
+
+
+def list_dir(path, stat=True, files_only=False, key=None, reverse=False):
+    """返回排序后的 Entry 列表；默认按名称排序。"""
+    entries = list(scan_dir(path, stat=stat, files_only=files_only))
+    entries.sort(key=key or (lambda e: e.name), reverse=reverse)
+    return entries
+
+
+def with_stat(dirpath, entry):
+    """为 stat=False 得到的条目补上 size / mtime（只对需要的条目调用）。"""
+    st = os.stat(os.path.join(dirpath, entry.name))
+    return entry._replace(size=st.st_size, mtime=st.st_mtime)
+
+
+# ---------------------------------------------------------------------------
+# 排序 / 过滤 / 分页
+# ---------------------------------------------------------------------------
+
+SORT_KEYS = ('name', 'size', 'mtime', 'extension')
+
+
+def sort_key(sort='name', reverse=False):
+    """
+    返回 Entry -> 元组 的排序键：目录总在文件前面（降序时也一样），
+    同值再按名称（先不区分大小写）排。目录内名称唯一，所以键不会重复，
+    上一页最后一条的键可以作为游标唯一定位下一页。
+    目录按 size / extension 排序时取 0 / ''。
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError('未知的排序字段：%s' % sort)
+    first = 1 if reverse else 0
+
+    def key(e):
+        lower = e.name.lower()
+        if sort == 'name':
+            value = lower
+        elif sort == 'size':
+            value = 0 if e.is_dir else e.size
+        elif sort == 'mtime':
+            value = e.mtime
+        else:
+            value = '' if e.is_dir else os.path.splitext(lower)[1]
+        return (first if e.is_dir else 1 - first, value, lower, e.name)
+    return key
+
+
+def entry_filter(pattern=None, exts=None, min_size=None, max_size=None, kind=None):
+    """
+    组合过滤条件，返回 Entry -> bool；没有任何条件时返回 None。
+    - pattern：名称通配符（* ? [...]，不区分大小写）；不含通配符时按子串匹配
+    - exts：扩展名集合（不带点，小写），只保留这些类型的文件
+    - min_size / max_size：文件大小范围（字节），只保留文件
+    - kind：'file' 或 'folder'
+    """
+    tests = []
+    if pattern:
+        if not any(c in pattern for c in '*?['):
+            pattern = '*%s*' % pattern
+        match = re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+        tests.append(lambda e: match(e.name) is not None)
+    if exts:
+        exts = {'.' + x.lower().lstrip('.') for x in exts}
+        tests.append(lambda e: not e.is_dir and os.path.splitext(e.name)[1].lower() in exts)
+    if min_size is not None:
+        tests.append(lambda e: not e.is_dir and e.size >= min_size)
+    if max_size is not None:
+        tests.append(lambda e: not e.is_dir and e.size <= max_size)
+    if kind in ('file', 'folder'):
+        want_dir = kind == 'folder'
+        tests.append(lambda e: e.is_dir == want_dir)
+    if not tests:
+        return None
+    return lambda e: all(t(e) for t in tests)
+
+
+def select_page(entries, key, reverse=False, match=None, after=None, limit=100):
+    """
+    从 entries 中取排序后位于 after（上一页最后一条的排序键）之后的 limit 条。
+    用 heapq 只保留前 limit+1 个，O(n log k)，不必整体排序；大目录的第一页也很便宜。
+    返回 (本页条目, 满足过滤条件的总数, 是否还有下一页)。
+    """
+    total = 0
+
+    def candidates():
+        nonlocal total
+        for e in entries:
+            if match is not None and not match(e):
+                continue
+            total += 1
+            k = key(e)
+            if after is not None and (k >= after if reverse else k <= after):
+                continue
+            yield k, e
+
+    pick = heapq.nlargest if reverse else heapq.nsmallest
+    page = pick(limit + 1, candidates(), key=lambda item: item[0])
+    return [e for _, e in page[:limit]], total, len(page) > limit
+
+
+# ---------------------------------------------------------------------------
+# 目录列表缓存
+# ---------------------------------------------------------------------------
+
+# 所有已缓存目录的条目总数上限（每条约 200 字节，默认约 40 MB）
+CACHE_MAX_ENTRIES = int(os.environ.get('LISTING_CACHE_ENTRIES', 200000))
+
+# 没有 inotify 时，即使目录 mtime 未变也最多信任这么久（文件内容改写不会更新目录 mtime）
+MTIME_TTL = 5.0
+
+# 放进跨进程共享层（cache.TieredCache）的列表的有效期
+SHARED_TTL = 30
+
+# 只有不超过这么多条目的列表才放进共享层：更大的列表每次都要整份序列化 / 反序列化，
+# 还会占满共享层，不如各 worker 自己扫一遍
+SHARED_MAX_ENTRIES = int(os.environ.get('LISTING_SHARED_ENTRIES', 5000))
+
+_IN_MODIFY, _IN_ATTRIB, _IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+_IN_MOVED_FROM, _IN_MOVED_TO, _IN_CREATE, _IN_DELETE = 0x40, 0x80, 0x100, 0x200
+_IN_DELETE_SELF, _IN_MOVE_SELF, _IN_IGNORED, _IN_ONLYDIR = 0x400, 0x800, 0x8000, 0x1000000
+_IN_Q_OVERFLOW = 0x4000
+_EVENT = struct.Struct('iIII')
+
+
+class _Inotify:
+    """
+    通过 ctypes 调用 inotify：每个已缓存目录一个 watch，
+    后台线程读事件并回调 on_change(path, gone)；gone 表示目录本身被删除 / 移走。
+    事件队列溢出（可能漏掉了事件）或读取线程退出时回调 on_lost()；
+    线程退出后 alive 为 False，调用方不能再把“有 watch”当作缓存有效的依据。
+    """
+
+    MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+            _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+
+    def __init__(self, on_change, on_lost):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._rm = libc.inotify_rm_watch
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        self._on_change = on_change
+        self._on_lost = on_lost
+        self.alive = True
+        self._lock = threading.Lock()
+        self._wd = {}     # path -> wd
+        self._paths = {}  # wd -> {path}（同一目录可能经不同路径访问）
+        threading.Thread(target=self._run, name='listing-inotify', daemon=True).start()
+
+    def watch(self, path):
+        """开始监视目录；失败（如超出 max_user_watches）返回 False。"""
+        with self._lock:
+            if path in self._wd:
+                return True
+            wd = self._add(self._fd, os.fsencode(path), self.MASK | _IN_ONLYDIR)
+            if wd < 0:
+                return False
+            self._wd[path] = wd
+            self._paths.setdefault(wd, set()).add(path)
+            return True
+
+    def unwatch(self, path):
+        with self._lock:
+            wd = self._wd.pop(path, None)
+            if wd is None:
+                return
+            paths = self._paths.get(wd, set())
+            paths.discard(path)
+            if not paths:
+                self._paths.pop(wd, None)
+                self._rm(self._fd, wd)
+
+    def _run(self):
+        try:
+            while True:
+                self._dispatch(os.read(self._fd, 64 * 1024))
+        except OSError:
+            pass
+        finally:
+            self.alive = False
+            self._on_lost()
+
+    def _dispatch(self, buf):
+        off = 0
+        while off < len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, off)
+            off += _EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:  # wd 为 -1，不对应任何目录
+                self._on_lost()
+                continue
+            with self._lock:
+                paths = list(self._paths.get(wd, ()))
+                if mask & _IN_IGNORED:
+                    for p in self._paths.pop(wd, ()):
+                        self._wd.pop(p, None)
+            gone = bool(mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED))
+            for p in paths:
+                self._on_change(p, gone)
+
+
+class ListingCache:
+    """
+    按目录绝对路径缓存排好序的 Entry 列表，总条目数超过上限时按 LRU 淘汰。
+
+    校验方式：
+      - inotify 可用且 watch 成功：缓存一直有效，直到收到该目录的事件
+      - 否则：目录 mtime 未变且缓存时间不超过 MTIME_TTL
+    应用自己的修改路由应调用 invalidate()，保证本次请求之后立即可见。
+
+    attach() 接入 cache.TieredCache 后（多 worker 部署）：
+      - invalidate() 通过共享层广播给其它 worker
+      - 本进程未命中时先查共享层里其它 worker 扫描好的结果（按目录 mtime 校验）
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, use_inotify=True):
+        self.max_entries = max_entries
+        self.use_inotify = use_inotify
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # (path, stat) -> (entries, 目录 mtime_ns, 缓存时刻, 是否有 watch)
+        self._order = {}             # path -> dirs_first() 的结果（随所依据的 entries 对象失效）
+        self._size = 0
+        self._gen = 0                # 失效代数；扫描期间发生过失效则不缓存该次结果
+        self._watcher = None
+        self._pid = None
+        self.shared = None
+        self.hits = self.misses = self.invalidations = self.evictions = 0
+        self.shared_hits = 0
+
+    def attach(self, shared):
+        self.shared = shared
+        shared.subscribe(self._on_remote)
+
+    @staticmethod
+    def _shared_key(path, stat):
+        return 'ls:%s|%d' % (path, stat)
+
+    def _on_remote(self, key, prefix):
+        # 其它 worker 的失效事件；key 为空表示事件有遗漏，整体清空
+        if not key:
+            self.clear()
+        elif key.startswith('ls:'):
+            path = key[3:]
+            if path.endswith('|'):
+                self.invalidate(path[:-1], publish=False)
+            elif path.endswith(os.sep):
+                self.invalidate(path.rstrip(os.sep) or os.sep, recursive=True, publish=False)
+
+    def _ensure_watcher(self):
+        # 惰性启动；fork 出的 worker 没有父进程的监视线程，需要重建并清空继承来的缓存
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._items.clear()
+                    self._order.clear()
+                    self._size = 0
+                    self._watcher = None
+                    if self.use_inotify:
+                        try:
+                            self._watcher = _Inotify(self._on_change, self._drop_watched)
+                        except (OSError, AttributeError, TypeError):
+                            self._watcher = None
+                    self._pid = os.getpid()
+        return self._watcher
+
+    def _on_change(self, path, gone):
+        # 每个 worker 各自有 inotify，不必再广播
+        self.invalidate(path, recursive=gone, publish=False)
+
+    def _drop_watched(self):
+        # inotify 队列溢出或读取线程退出：有 watch 的目录的改动可能漏掉了，这些缓存全部作废
+        with self._lock:
+            self._gen += 1
+            keys = [k for k, item in self._items.items() if item[3]]
+            for k in keys:
+                self._size -= len(self._items.pop(k)[0])
+                self._order.pop(k[0], None)
+            self.invalidations += 1
+
+    def _valid(self, path, item):
+        # 有 watch 且监视线程还在：一直有效，直到收到事件；否则退回 mtime + TTL 校验
+        if item[3] and self._watcher is not None and self._watcher.alive:
+            return True
+        if time.monotonic() - item[2] > MTIME_TTL:
+            return False
+        try:
+            return os.stat(path).st_mtime_ns == item[1]
+        except OSError:
+            return False
+
+    def _cached(self, path, stat):
+        # 带 stat 的结果同样满足只要名称 / 类型的请求
+        keys = [(path, True)] if stat else [(path, False), (path, True)]
+        for key in keys:
+            with self._lock:
+                item = self._items.get(key)
+            if item is not None and self._valid(path, item):
+                with self._lock:
+                    if key in self._items:
+                        self._items.move_to_end(key)
+                    self.hits += 1
+                return item[0]
+        return None
+
+    def _lookup(self, path, stat):
+        watcher = self._ensure_watcher()
+        if self.shared is not None:
+            self.shared.sync()
+        entries = self._cached(path, stat)
+        if entries is not None:
+            return entries
+        with self._lock:
+            gen = self._gen
+        # 先挂 watch 再扫描，扫描期间的改动不会漏掉
+        watched = watcher is not None and watcher.alive and watcher.watch(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        # 只共享 stat=False 的列表：文件内容改写不更新目录 mtime，
+        # 共享层里的大小 / 修改时间无从校验，最长会旧 SHARED_TTL 秒
+        shared = self.shared if not stat else None
+        found = None
+        if shared is not None:
+            found = shared.get(self._shared_key(path, stat), local=False)
+        if found is not None and found[1] == mtime_ns:
+            entries = found[0]
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            entries = list_dir(path, stat=stat)
+            with self._lock:
+                self.misses += 1
+            if shared is not None and len(entries) <= SHARED_MAX_ENTRIES:
+                shared.set(self._shared_key(path, stat), (entries, mtime_ns),
+                           ttl=SHARED_TTL, local=False)
+        if len(entries) > self.max_entries:
+            # 单个目录就超过整个缓存的上限：不缓存，每次重新扫描，上限才是真正的上限
+            if watched and (path, not stat) not in self._items:
+                watcher.unwatch(path)
+            return entries
+        with self._lock:
+            if self._gen == gen:
+                old = self._items.pop((path, stat), None)
+                if old is not None:
+                    self._size -= len(old[0])
+                self._items[(path, stat)] = (entries, mtime_ns, time.monotonic(), watched)
+                self._size += len(entries)
+                self._evict()
+        return entries
+
+    def _evict(self):
+        # 调用方持有 self._lock
+        while self._size > self.max_entries and self._items:
+            (path, stat), item = self._items.popitem(last=False)
+            self._size -= len(item[0])
+            self._order.pop(path, None)
+            self.evictions += 1
+            if self._watcher is not None and (path, not stat) not in self._items:
+                self._watcher.unwatch(path)
+
+    def list_dir(self, path, stat=True, files_only=False, key=None, reverse=False):
+        """与模块级 list_dir 相同的接口，但结果来自缓存；返回新列表，可随意修改。"""
+        entries = self._lookup(os.path.abspath(path), stat)
+        if files_only:
+            entries = [e for e in entries if not e.is_dir]
+        else:
+            entries = list(entries)
+        if key is not None or reverse:
+            entries.sort(key=key or (lambda e: e.name), reverse=reverse)
+        return entries
+
+    def entries(self, path, stat=True):
+        """缓存中按名称排好序的条目本身，不复制（大目录分页时避免每次拷贝）；调用方不得修改。"""
+        return self._lookup(os.path.abspath(path), stat)
+
+    def dirs_first(self, path, stat=True):
+        """
+        文件夹在前、文件在后（各自按名称）的条目，返回 (entries, names, 文件夹数)。
+        names 与 entries 一一对应，供按名称游标分页时 bisect（两段分别有序）。
+        每份缓存的列表只整理一次，之后的分页直接切片；调用方不得修改。
+        """
+        path = os.path.abspath(path)
+        entries = self._lookup(path, stat)
+        with self._lock:
+            memo = self._order.get(path)
+        if memo is None or memo[0] is not entries:
+            dirs = [e for e in entries if e.is_dir]
+            ordered = dirs + [e for e in entries if not e.is_dir]
+            memo = (entries, ordered, [e.name for e in ordered], len(dirs))
+            with self._lock:
+                if any(item[0] is entries for item in
+                       (self._items.get((path, False)), self._items.get((path, True))) if item):
+                    self._order[path] = memo
+        return memo[1:]
+
+    def invalidate(self, path, recursive=False, publish=True):
+        """
+        使目录 path 的缓存失效；recursive=True 时连同其下所有子目录
+        （删除 / 重命名 / 移动目录后使用）。publish=False 时不通知其它 worker。
+        """
+        path = os.path.abspath(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            self._gen += 1
+            keys = [k for k in self._items
+                    if k[0] == path or (recursive and k[0].startswith(prefix))]
+            for k in keys:
+                self._size -= len(self._items.pop(k)[0])
+                self._order.pop(k[0], None)
+            self.invalidations += 1
+        if publish and self.shared is not None:
+            self.shared.invalidate('ls:%s|' % path, prefix=True)
+            if recursive:
+                self.shared.invalidate('ls:' + prefix, prefix=True)
+
+    def touch(self, *paths):
+        """路径被创建 / 删除 / 改名 / 写入之后调用：所在目录失效，若是目录则连同其子树。"""
+        for p in paths:
+            p = os.path.abspath(p)
+            self.invalidate(os.path.dirname(p))
+            self.invalidate(p, recursive=True)
+
+    def clear(self):
+        with self._lock:
+            self._gen += 1
+            self._items.clear()
+            self._order.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'dirs': len(self._items),
+                'entries': self._size,
+                'max_entries': self.max_entries,
+                'mode': 'inotify' if self._watcher is not None and self._watcher.alive else 'mtime',
+            }
+
+
+# 进程内共享的缓存实例
+cache = ListingCache()
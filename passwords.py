@@ -0,0 +1,144 @@
+"""
+passwords.py — 可配置的密码哈希。
+
+  scrypt   hashlib.scrypt（默认），格式与 werkzeug >= 2.3 相同：scrypt:N:r:p$salt$hex
+  pbkdf2   hashlib.pbkdf2_hmac，格式与 werkzeug 相同：pbkdf2:sha256:迭代次数$salt$hex
+  argon2   可选依赖 argon2-cffi（pip install argon2-cffi），格式 $argon2id$...
+
+已有的哈希都能验证：werkzeug 生成的任意格式，以及 图文.py 旧版的无盐 SHA-256。
+登录时 check() 发现哈希方案或强度与当前配置不同，会顺便返回新哈希，由调用方写回数据库。
+
+哈希计算放在一个固定大小的线程池里执行，调用方线程同步等待结果。
+这不会让请求线程空出来，作用是限流：登录风暴时同时在算的哈希最多 workers 个，
+其余排队，不会把所有核心都占满（hashlib 计算期间释放 GIL，其它请求照常处理）。
+
+配置（app.config 或同名环境变量）：
+    PASSWORD_SCHEME    scrypt / pbkdf2 / argon2
+    PASSWORD_COST      scrypt 的 N（2 的幂）、pbkdf2 的迭代次数、argon2 的 time_cost
+    PASSWORD_WORKERS   同时计算哈希的线程数上限，默认 CPU 核数
+"""
+
+import os
+import hmac
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash
+
+try:
+    import argon2
+except ImportError:  # argon2-cffi 为可选依赖
+    argon2 = None
+
+DEFAULT_COST = {'scrypt': 2 ** 15, 'pbkdf2': 260000, 'argon2': 3}
+SCRYPT_R, SCRYPT_P = 8, 1
+ARGON2_MEMORY_KB = 64 * 1024
+SALT_BYTES = 12
+
+
+def _salt():
+    return base64.b64encode(os.urandom(SALT_BYTES)).decode('ascii').rstrip('=')
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt.encode('utf-8'), n=n, r=r, p=p,
+                          maxmem=132 * n * r * p, dklen=64).hex()
+
+
+def _pbkdf2(password, salt, iterations, digest='sha256'):
+    return hashlib.pbkdf2_hmac(digest, password.encode('utf-8'),
+                               salt.encode('utf-8'), iterations).hex()
+
+
+def _is_legacy_sha256(stored):
+    return len(stored) == 64 and all(c in '0123456789abcdef' for c in stored)
+
+
+class PasswordHasher:
+    def __init__(self, scheme=None, cost=None, workers=None):
+        if scheme is None:
+            scheme = 'scrypt' if hasattr(hashlib, 'scrypt') else 'pbkdf2'
+        if scheme not in DEFAULT_COST:
+            raise ValueError('未知的密码哈希方案：%s' % scheme)
+        if scheme == 'argon2' and argon2 is None:
+            raise ValueError('PASSWORD_SCHEME=argon2 需要安装 argon2-cffi')
+        self.scheme = scheme
+        self.cost = int(cost or DEFAULT_COST[scheme])
+        if scheme == 'argon2':
+            self._argon2 = argon2.PasswordHasher(time_cost=self.cost,
+                                                 memory_cost=ARGON2_MEMORY_KB)
+        self._pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                        thread_name_prefix='passwords')
+
+    @classmethod
+    def from_config(cls, config):
+        def opt(key):
+            return config.get(key) or os.environ.get(key)
+        workers = opt('PASSWORD_WORKERS')
+        return cls(opt('PASSWORD_SCHEME'), opt('PASSWORD_COST'),
+                   int(workers) if workers else None)
+
+    def hash(self, password):
+        if self.scheme == 'scrypt':
+            salt = _salt()
+            return 'scrypt:%d:%d:%d$%s$%s' % (self.cost, SCRYPT_R, SCRYPT_P, salt,
+                                              _scrypt(password, salt, self.cost, SCRYPT_R, SCRYPT_P))
+        if self.scheme == 'pbkdf2':
+            salt = _salt()
+            return 'pbkdf2:sha256:%d$%s$%s' % (self.cost, salt, _pbkdf2(password, salt, self.cost))
+        return self._argon2.hash(password)
+
+    def verify(self, stored, password):
+        """stored 可以是本模块、werkzeug 或 图文.py 旧版（无盐 SHA-256）生成的哈希。"""
+        if not stored:
+            return False
+        if stored.startswith('$argon2'):
+            if argon2 is None:
+                return False
+            try:
+                return argon2.PasswordHasher().verify(stored, password)
+            except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHash):
+                return False
+        if stored.startswith('scrypt:'):
+            try:
+                method, salt, digest = stored.split('$', 2)
+                n, r, p = (int(x) for x in method.split(':')[1:4])
+            except ValueError:
+                return False
+            return hmac.compare_digest(_scrypt(password, salt, n, r, p), digest)
+        if _is_legacy_sha256(stored):
+            return hmac.compare_digest(
+                hashlib.sha256(password.encode('utf-8')).hexdigest(), stored)
+        try:
+            return check_password_hash(stored, password)
+        except ValueError:  # 无法识别的格式
+            return False
+
+    def needs_rehash(self, stored):
+        """哈希方案或强度与当前配置不一致。"""
+        if self.scheme == 'argon2':
+            if not stored.startswith('$argon2'):
+                return True
+            return self._argon2.check_needs_rehash(stored)
+        if self.scheme == 'scrypt':
+            return stored.split('$', 1)[0] != 'scrypt:%d:%d:%d' % (self.cost, SCRYPT_R, SCRYPT_P)
+        return stored.split('$', 1)[0] != 'pbkdf2:sha256:%d' % self.cost
+
+    def _check(self, stored, password):
+        if not self.verify(stored, password):
+            return False, None
+        if self.needs_rehash(stored):
+            return True, self.hash(password)
+        return True, None
+
+    def check(self, stored, password):
+        """
+        验证密码，返回 (是否正确, 新哈希或 None)；阻塞到线程池算完为止。
+        新哈希不为 None 时调用方应写回数据库（透明升级旧哈希）。
+        """
+        return self._pool.submit(self._check, stored, password).result()
+
+    def generate(self, password):
+        """生成哈希（注册时使用），同样受线程池并发上限约束、阻塞等待。"""
+        return self._pool.submit(self.hash, password).result()
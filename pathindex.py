@@ -0,0 +1,432 @@
+"""
+pathindex.py — 按文件名 / 路径查找（整棵目录树），供各应用共用。
+
+每个分区（用户）一个 SQLite 文件，记录该分区下所有文件和文件夹的相对路径、大小、mtime；
+路径上另建一张 FTS5 trigram 表（SQLite >= 3.34；更早的版本没有这张表，查询都走扫描），
+子串 / 通配符查询先用它缩小候选范围，不必逐个目录去 os.walk。关键词（通配符之间的片段）都不足 3 个字符时用不上该索引，
+只能扫描路径表：100 万条路径、命中又很少时约需 100 毫秒。
+
+索引的更新来源：
+  - 应用的修改路由（上传 / 新建 / 删除 / 重命名 / 移动 / 后台任务）调用 touch(绝对路径...)，
+    参数与 listing.cache.touch 相同；路径放进队列，由后台线程对照磁盘刷新该路径及其子树
+  - 分区第一次使用时整棵树建一次索引；之后每隔 CRAWL_INTERVAL 核对一次，补上应用之外的改动
+
+查询（默认挂在 /api/find）：
+  GET /api/find?q=关键词&limit=50&path=子目录
+      → {items: [{path, name, is_dir, size, mtime}], more}
+  q 不含通配符时按子串匹配整条相对路径（不区分大小写）；
+  含 * ? [...] 时按通配符匹配文件名，通配符里带 / 时匹配路径（可从任意一级目录开始）。
+  结果按修改时间从新到旧排列。
+"""
+
+import os
+import re
+import time
+import heapq
+import queue
+import fnmatch
+import hashlib
+import sqlite3
+import threading
+
+from flask import Blueprint, jsonify, request
+
+import listing
+
+# 后台核对磁盘的间隔（秒）
+CRAWL_INTERVAL = int(os.environ.get('FIND_CRAWL_INTERVAL', 600))
+
+PAGE_SIZE = 50
+MAX_PAGE = 500
+
+# trigram 候选不超过这么多条时取出后按 mtime 排序；
+# 更多（如 ".jpg"）说明命中很密，直接从最近修改的条目里找更快
+MAX_CANDIDATES = 5000
+
+# 用不上 trigram 索引时，先在最近修改的这么多条里找，找不够一页再扫描整张表
+RECENT_SCAN = 20000
+
+
+def _has_trigram():
+    # FTS5 trigram 需要 SQLite >= 3.34；没有时不建 grams 表，查询全部走扫描
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+HAS_TRIGRAM = _has_trigram()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paths (
+  id      INTEGER PRIMARY KEY,
+  path    TEXT NOT NULL UNIQUE,
+  parent  TEXT NOT NULL,
+  is_dir  INTEGER NOT NULL,
+  size    INTEGER NOT NULL,
+  mtime   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS paths_parent ON paths(parent);
+CREATE INDEX IF NOT EXISTS paths_mtime ON paths(mtime);
+"""
+
+_GRAMS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS grams USING fts5(
+  path, content='paths', content_rowid='id', tokenize='trigram', detail='none');
+CREATE TRIGGER IF NOT EXISTS paths_ai AFTER INSERT ON paths BEGIN
+  INSERT INTO grams(rowid, path) VALUES (new.id, new.path);
+END;
+CREATE TRIGGER IF NOT EXISTS paths_ad AFTER DELETE ON paths BEGIN
+  INSERT INTO grams(grams, rowid, path) VALUES ('delete', old.id, old.path);
+END;
+"""
+
+_UPSERT = ('INSERT INTO paths(path, parent, is_dir, size, mtime) VALUES (?,?,?,?,?) '
+           'ON CONFLICT(path) DO UPDATE SET is_dir=excluded.is_dir, size=excluded.size, '
+           'mtime=excluded.mtime')
+
+
+def _parent(rel):
+    return rel.rsplit('/', 1)[0] if '/' in rel else ''
+
+
+def compile_query(q):
+    """
+    把用户输入转换成 (字面片段, LIKE 模式, 判定函数)。
+    字面片段是通配符之间的普通字符，用来在 trigram 索引里找候选；
+    LIKE 模式在扫描整张表时先做一遍粗筛（用户输入里的 % _ 也被当成通配符，只会多不会少）；
+    判定函数对路径做精确判断。
+    """
+    q = q.strip().strip('/')
+    if not q:
+        raise ValueError('请输入文件名')
+    if not any(c in q for c in '*?['):
+        lower = q.lower()
+        return [q], '%' + q + '%', lambda path: lower in path.lower()
+    pieces, like, i = [''], [], 0
+    while i < len(q):
+        c = q[i]
+        if c == '[':
+            # [...] 只占一个字符；与之配对的 ] 不算紧跟在 [ 或 [! 后面的那个，没有配对时 [ 是普通字符
+            j = i + 2 if q[i + 1:i + 2] == '!' else i + 1
+            end = q.find(']', j + 1)
+            if end > 0:
+                like.append('_')
+                pieces.append('')
+                i = end + 1
+                continue
+        if c in '*?':
+            like.append('%' if c == '*' else '_')
+            pieces.append('')
+        else:
+            like.append(c)
+            pieces[-1] += c
+        i += 1
+    like = '%' + ''.join(like)
+    pieces = [p for p in pieces if p]
+    if '/' in q:
+        rx = re.compile('(?:%s)|(?:%s)' % (fnmatch.translate(q), fnmatch.translate('*/' + q)),
+                        re.IGNORECASE)
+        return pieces, like, lambda path: rx.match(path) is not None
+    rx = re.compile(fnmatch.translate(q), re.IGNORECASE)
+    return pieces, like, lambda path: rx.match(path.rsplit('/', 1)[-1]) is not None
+
+
+def trigram_query(pieces):
+    """
+    字面片段 → FTS5 查询：片段中的每个三字组都要出现（AND）。
+    detail='none' 不支持多个 token 的短语，所以不写成 "片段"，而是拆成三字组逐个引用；
+    不足 3 个字符的片段用不上索引，全都不足时返回 None。
+    """
+    grams = []
+    for p in pieces:
+        for i in range(len(p) - 2):
+            g = p[i:i + 3]
+            if g not in grams:
+                grams.append(g)
+    return ' AND '.join('"%s"' % g.replace('"', '""') for g in grams) or None
+
+
+class PathIndex:
+    """
+    directory：索引文件所在目录，每个分区一个 <分区>.db
+    base：文件根目录
+    partitioned=True：base 下每个一级子目录是一个分区（如 uploads/<用户 id>），
+                      分区名就是子目录名；否则整个 base 是一个分区 ''
+    partitions()：后台核对时要检查的分区；默认为本进程启动以来用到过的分区
+    """
+
+    def __init__(self, directory, base, partitioned=False, partitions=None,
+                 crawl_interval=CRAWL_INTERVAL):
+        self.directory = directory
+        self.base = os.path.abspath(base)
+        self.partitioned = partitioned
+        self.partitions = partitions or (lambda: list(self._seen))
+        self.crawl_interval = crawl_interval
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._queue = queue.Queue()
+        self._pid = None
+        self.refreshed = self.crawls = 0
+        self.last_crawl = None
+
+    def root_of(self, partition):
+        return os.path.join(self.base, str(partition)) if self.partitioned else self.base
+
+    def locate(self, path):
+        """绝对路径 → (分区, 相对路径)；不在 base 之下时返回 None。"""
+        rel = os.path.relpath(os.path.abspath(path), self.base)
+        if rel == '.' or rel == '..' or rel.startswith('..' + os.sep):
+            return None
+        rel = rel.replace(os.sep, '/')
+        if not self.partitioned:
+            return '', rel
+        partition, _, rel = rel.partition('/')
+        return partition, rel
+
+    # —— 连接 / 后台线程 ——
+
+    def _db_path(self, partition):
+        raw = str(partition) or 'default'
+        name = re.sub(r'[^0-9A-Za-z_.-]', '_', raw)
+        if name != raw:  # 清洗过的名字可能撞车，加上原名的哈希
+            name += '-' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.directory, name + '.db')
+
+    def _conn(self, partition):
+        partition = str(partition)
+        loc = self._local
+        if getattr(loc, 'pid', None) != os.getpid():
+            loc.conns, loc.pid = {}, os.getpid()
+        conn = loc.conns.get(partition)
+        if conn is None:
+            db_path = self._db_path(partition)
+            fresh = not os.path.exists(db_path)
+            conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._init_grams(conn)
+            loc.conns[partition] = conn
+        else:
+            fresh = False
+        self._seen.add(partition)
+        self._ensure_worker()
+        if fresh:  # 新分区：整棵树建一次索引
+            self._queue.put((partition, ''))
+        return conn
+
+    def _ensure_worker(self):
+        # 后台线程在第一次使用时启动（服务器 fork 出 worker 之后）
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+        threading.Thread(target=self._run, name='pathindex', daemon=True).start()
+
+    def _run(self):
+        next_crawl = time.monotonic() + self.crawl_interval
+        while True:
+            try:
+                partition, rel = self._queue.get(timeout=max(0, next_crawl - time.monotonic()))
+            except queue.Empty:
+                for partition in self.partitions():
+                    try:
+                        self.crawl(partition)
+                    except (OSError, sqlite3.Error):
+                        pass
+                next_crawl = time.monotonic() + self.crawl_interval
+                continue
+            try:
+                self.refresh(partition, rel)
+            except (OSError, sqlite3.Error):
+                pass
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """等队列里的刷新全部完成（测试 / 基准用）。"""
+        self._queue.join()
+
+    # —— 写索引 ——
+
+    def _delete(self, conn, rels):
+        """删除若干路径及其子树（'dir/' <= path < 'dir0' 走 path 上的唯一索引）。"""
+        for rel in rels:
+            conn.execute('DELETE FROM paths WHERE path = ? OR (path >= ? AND path < ?)',
+                         (rel, rel + '/', rel + '0'))
+
+    def _write(self, conn, rows, gone):
+        if not rows and not gone:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._delete(conn, gone)
+            conn.executemany(_UPSERT, rows)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def refresh(self, partition, rel=''):
+        """
+        对照磁盘刷新 rel（'' 为整个分区）：本身和子树中新增 / 变化的写入索引，
+        已不存在的删除。每个目录一个事务，大目录树不会长时间占着写锁。
+        """
+        conn = self._conn(partition)
+        root = self.root_of(partition)
+        if rel:
+            try:
+                st = os.stat(os.path.join(root, rel))
+            except FileNotFoundError:
+                self._write(conn, [], [rel])
+                self.refreshed += 1
+                return
+            is_dir = os.path.isdir(os.path.join(root, rel))
+            self._write(conn, [(rel, _parent(rel), int(is_dir), 0 if is_dir else st.st_size,
+                                st.st_mtime)], [])
+            if not is_dir:
+                # 原来可能是同名目录
+                conn.execute('DELETE FROM paths WHERE path >= ? AND path < ?', (rel + '/', rel + '0'))
+                self.refreshed += 1
+                return
+        stack = [rel]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                entries = list(listing.scan_dir(os.path.join(root, rel_dir)))
+            except OSError:
+                continue
+            known = {r[0]: r[1:] for r in conn.execute(
+                'SELECT path, is_dir, size, mtime FROM paths WHERE parent = ?', (rel_dir,))}
+            rows = []
+            for e in entries:
+                path = rel_dir + '/' + e.name if rel_dir else e.name
+                row = (int(e.is_dir), 0 if e.is_dir else e.size, e.mtime)
+                if known.pop(path, None) != row:
+                    rows.append((path, rel_dir) + row)
+                if e.is_dir:
+                    stack.append(path)
+            self._write(conn, rows, list(known))
+        self.refreshed += 1
+
+    def crawl(self, partition):
+        """核对整个分区。"""
+        self.refresh(partition, '')
+        self.crawls += 1
+        self.last_crawl = time.time()
+
+    def touch(self, *paths):
+        """路径被创建 / 删除 / 改名 / 写入之后调用（绝对路径，与 listing.cache.touch 相同）。"""
+        for p in paths:
+            loc = self.locate(p)
+            if loc is None:
+                continue
+            self._conn(loc[0])
+            self._queue.put(loc)
+
+    # —— 查询 ——
+
+    @staticmethod
+    def _init_grams(conn):
+        had = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN ('grams', 'paths_ai')"
+                           ).fetchone()[0] == 2
+        if not HAS_TRIGRAM:
+            # 索引文件可能由支持 trigram 的 SQLite 建过：去掉触发器，否则写 paths 会失败
+            conn.execute('DROP TRIGGER IF EXISTS paths_ai')
+            conn.execute('DROP TRIGGER IF EXISTS paths_ad')
+            return
+        conn.executescript(_GRAMS_SCHEMA)
+        if not had:  # 新文件，或由 / 曾由不支持 trigram 的 SQLite 打开过：grams 按 paths 重建
+            conn.execute("INSERT INTO grams(grams) VALUES ('rebuild')")
+
+    def find(self, partition, q, limit=PAGE_SIZE, prefix=''):
+        """
+        返回 (结果列表, 是否还有更多)，按 mtime 从新到旧。
+        prefix 为子目录时只在该目录下查找。q 为空时抛 ValueError。
+        """
+        pieces, like, match = compile_query(q)
+        conn = self._conn(partition)
+        prefix = prefix.strip('/')
+        cols = 'SELECT path, is_dir, size, mtime FROM paths'
+        rows = None
+        fts = trigram_query(pieces) if HAS_TRIGRAM else None
+        if fts:
+            ids = [r[0] for r in conn.execute('SELECT rowid FROM grams WHERE grams MATCH ? LIMIT ?',
+                                              (fts, MAX_CANDIDATES + 1))]
+            if len(ids) <= MAX_CANDIDATES:
+                rows = []
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    rows += conn.execute(cols + ' WHERE id IN (%s)' % ','.join('?' * len(chunk)),
+                                         chunk).fetchall()
+                if prefix:
+                    rows = [r for r in rows if r[0].startswith(prefix + '/')]
+                rows = heapq.nlargest(limit + 1, (r for r in rows if match(r[0])),
+                                      key=lambda r: r[3])
+        if rows is None:
+            # 候选太多（常见子串）或关键词不足 3 个字符：用不上 trigram 索引
+            where, args = 'path LIKE ?', [like]
+            if prefix:
+                where += ' AND path >= ? AND path < ?'
+                args += [prefix + '/', prefix + '0']
+            # 先沿 mtime 索引从新到旧找，命中够一页就停；最多看 RECENT_SCAN 条
+            rows = []
+            for r in conn.execute('SELECT * FROM (%s ORDER BY mtime DESC LIMIT %d) WHERE %s'
+                                  % (cols, RECENT_SCAN, where), args):
+                if match(r[0]):
+                    rows.append(r)
+                    if len(rows) > limit:
+                        break
+            else:
+                # 不够：顺序扫描整张表（比沿 mtime 索引逐行回表快得多）
+                rows = heapq.nlargest(limit + 1, (r for r in conn.execute(
+                    cols + ' WHERE ' + where, args) if match(r[0])), key=lambda r: r[3])
+        items = [{
+            'path': path,
+            'name': path.rsplit('/', 1)[-1],
+            'is_dir': bool(is_dir),
+            'size': size,
+            'mtime': int(mtime),
+        } for path, is_dir, size, mtime in rows[:limit]]
+        return items, len(rows) > limit
+
+    def stats(self):
+        return {
+            'trigram': HAS_TRIGRAM,
+            'queued': self._queue.qsize(),
+            'refreshed': self.refreshed,
+            'crawls': self.crawls,
+            'last_crawl': self.last_crawl,
+        }
+
+
+def create_blueprint(index, partition=lambda: '', guard=None, url_prefix='/api/find'):
+    """
+    生成 /api/find 接口的 Blueprint。
+    - partition()：当前请求对应的分区（如当前用户 id），只在该分区里查找
+    - guard：视图装饰器（如 login_required）
+    """
+    bp = Blueprint('pathindex', __name__, url_prefix=url_prefix)
+    wrap = guard or (lambda f: f)
+
+    @bp.route('', methods=['GET'])
+    @wrap
+    def find():
+        q = request.args.get('q', '')
+        limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE))
+        prefix = request.args.get('path', '')
+        try:
+            items, more = index.find(str(partition()), q, limit, prefix)
+        except ValueError as e:
+            return jsonify({'ok': False, 'error': str(e)}), 400
+        return jsonify({'ok': True, 'q': q.strip(), 'items': items, 'more': more})
+
+    return bp
@@ -0,0 +1,330 @@
+"""
+resumable.py — 可断点续传的分片上传（tus 风格），供各应用共用。
+
+协议（默认挂在 /resumable 下）：
+  POST   /resumable                    {path, filename, size} → {id, chunk_size}
+  PUT    /resumable/<id>?offset=N      请求体为该分片的原始字节（也可用 Upload-Offset 头）
+  GET    /resumable/<id>               → {size, received: [[start, end], ...], offset}
+  POST   /resumable/<id>/finalize      全部收齐后移动到目标目录 → {name, size, mtime}
+  DELETE /resumable/<id>               放弃上传
+  GET    /resumable/client.js          浏览器端上传器 resumableUpload() / uploadPool() / postWithProgress()
+
+分片可以乱序、并行上传：每个分片直接写进预分配文件的对应偏移，
+写完后在 ranges/ 下建一个 "start-end" 标记文件，无需加锁即可跨进程汇总进度。
+单个请求只携带一个分片，因此总文件大小不再受 MAX_CONTENT_LENGTH 限制。
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import uuid
+
+from flask import Blueprint, request, jsonify, Response
+
+# 建议的分片大小（须小于应用的 MAX_CONTENT_LENGTH）
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# 写盘粒度
+BLOCK_SIZE = 256 * 1024
+
+# 超过该时长没有新分片的上传会被清理
+EXPIRE_SECONDS = 24 * 3600
+
+_id_re = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """请求本身有误（参数不合法 / 未收齐等），对应 HTTP 400。"""
+
+
+def merge_ranges(ranges):
+    out = []
+    for start, end in sorted(ranges):
+        if out and start <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], end)
+        else:
+            out.append([start, end])
+    return out
+
+
+class ResumableStore:
+    """
+    上传会话暂存区。每个会话一个目录：
+      meta.json  — 目标路径、文件名、总大小、所属用户
+      data.part  — 预分配到总大小的数据文件
+      ranges/    — 已写入区间的标记文件
+    暂存区应与目标目录在同一文件系统上，完成时才能原子改名。
+    """
+
+    def __init__(self, root, chunk_size=CHUNK_SIZE, max_size=None):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, uid):
+        if not _id_re.match(uid or ""):
+            raise KeyError(uid)
+        return os.path.join(self.root, uid)
+
+    def load(self, uid, owner):
+        try:
+            with open(os.path.join(self._dir(uid), "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(uid)
+        if meta["owner"] != str(owner):
+            raise KeyError(uid)
+        return meta
+
+    def create(self, owner, path, filename, size):
+        if size < 0 or (self.max_size is not None and size > self.max_size):
+            raise UploadError("文件大小不合法")
+        self.purge_expired()
+        uid = uuid.uuid4().hex
+        d = os.path.join(self.root, uid)
+        os.makedirs(os.path.join(d, "ranges"))
+        with open(os.path.join(d, "data.part"), "wb") as f:
+            f.truncate(size)
+        meta = {"id": uid, "owner": str(owner), "path": path,
+                "filename": filename, "size": size, "created": time.time()}
+        with open(os.path.join(d, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return meta
+
+    def received(self, uid):
+        ranges = []
+        for name in os.listdir(os.path.join(self._dir(uid), "ranges")):
+            start, _, end = name.partition("-")
+            ranges.append((int(start), int(end)))
+        return merge_ranges(ranges)
+
+    def status(self, meta):
+        received = self.received(meta["id"])
+        # 从头开始连续收到的字节数（tus 的 Upload-Offset 语义）
+        offset = received[0][1] if received and received[0][0] == 0 else 0
+        return {"id": meta["id"], "size": meta["size"], "received": received,
+                "offset": offset, "chunk_size": self.chunk_size}
+
+    def write(self, meta, offset, stream, length):
+        if offset < 0 or length < 0 or offset + length > meta["size"]:
+            raise UploadError("分片越界")
+        d = self._dir(meta["id"])
+        remaining = length
+        with open(os.path.join(d, "data.part"), "r+b") as f:
+            f.seek(offset)
+            while remaining > 0:
+                data = stream.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+        written = length - remaining
+        if written:
+            open(os.path.join(d, "ranges", "%d-%d" % (offset, offset + written)), "w").close()
+        os.utime(os.path.join(d, "meta.json"))
+        return written
+
+    def finalize(self, meta, dest):
+        """确认收齐后把数据文件移动到 dest，并删除会话。"""
+        received = self.received(meta["id"])
+        if meta["size"] and received != [[0, meta["size"]]]:
+            raise UploadError("分片尚未收齐")
+        d = self._dir(meta["id"])
+        shutil.move(os.path.join(d, "data.part"), dest)
+        shutil.rmtree(d, ignore_errors=True)
+
+    def discard(self, meta):
+        shutil.rmtree(self._dir(meta["id"]), ignore_errors=True)
+
+    def purge_expired(self):
+        cutoff = time.time() - EXPIRE_SECONDS
+        for name in os.listdir(self.root):
+            meta = os.path.join(self.root, name, "meta.json")
+            try:
+                if os.path.getmtime(meta) < cutoff:
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            except OSError:
+                pass
+
+
+def create_blueprint(store, resolve_target, guard=None, owner=lambda: "",
+                     on_complete=None, url_prefix="/resumable"):
+    """
+    生成挂载上传接口的 Blueprint。
+    - resolve_target(path, filename)：返回目标文件的绝对路径，不合法时抛 ValueError
+    - guard：视图装饰器（如 login_required）
+    - owner()：当前用户标识，会话只允许创建者访问
+    - on_complete(dest)：文件落盘后的回调
+    """
+    bp = Blueprint("resumable", __name__, url_prefix=url_prefix)
+    wrap = guard or (lambda f: f)
+
+    def error(msg, code=400):
+        return jsonify({"ok": False, "error": msg}), code
+
+    @bp.route("", methods=["POST"])
+    @wrap
+    def init_upload():
+        j = request.get_json(silent=True) or {}
+        filename = (j.get("filename") or "").strip()
+        size = j.get("size")
+        if not filename or not isinstance(size, int):
+            return error("缺少 filename / size")
+        try:
+            resolve_target(j.get("path", ""), filename)
+            meta = store.create(owner(), j.get("path", ""), filename, size)
+        except (ValueError, UploadError) as e:
+            return error(str(e))
+        return jsonify({"ok": True, **store.status(meta)}), 201
+
+    @bp.route("/<uid>", methods=["GET"])
+    @wrap
+    def upload_status(uid):
+        try:
+            meta = store.load(uid, owner())
+        except KeyError:
+            return error("上传不存在或已过期", 404)
+        return jsonify({"ok": True, **store.status(meta)})
+
+    @bp.route("/<uid>", methods=["PUT", "PATCH"])
+    @wrap
+    def upload_chunk(uid):
+        try:
+            meta = store.load(uid, owner())
+        except KeyError:
+            return error("上传不存在或已过期", 404)
+        offset = request.args.get("offset", type=int)
+        if offset is None:
+            offset = request.headers.get("Upload-Offset", type=int)
+        length = request.content_length
+        if offset is None or length is None:
+            return error("缺少 offset 或 Content-Length")
+        try:
+            written = store.write(meta, offset, request.stream, length)
+        except UploadError as e:
+            return error(str(e))
+        resp = jsonify({"ok": True, "written": written})
+        resp.headers["Upload-Offset"] = str(offset + written)
+        return resp
+
+    @bp.route("/<uid>/finalize", methods=["POST"])
+    @wrap
+    def upload_finalize(uid):
+        try:
+            meta = store.load(uid, owner())
+        except KeyError:
+            return error("上传不存在或已过期", 404)
+        try:
+            dest = resolve_target(meta["path"], meta["filename"])
+            store.finalize(meta, dest)
+        except (ValueError, UploadError) as e:
+            return error(str(e))
+        if on_complete:
+            on_complete(dest)
+        return jsonify({"ok": True, "name": os.path.basename(dest), "size": meta["size"],
+                        "mtime": int(os.path.getmtime(dest))})
+
+    @bp.route("/<uid>", methods=["DELETE"])
+    @wrap
+    def upload_abort(uid):
+        try:
+            store.discard(store.load(uid, owner()))
+        except KeyError:
+            return error("上传不存在或已过期", 404)
+        return jsonify({"ok": True})
+
+    @bp.route("/client.js")
+    def client_js():
+        return Response(CLIENT_JS, mimetype="application/javascript")
+
+    return bp
+
+
+CLIENT_JS = r"""
+// uploadPool(items, limit, worker) → Promise<[{item, result} | {item, error}]>
+// 最多 limit 个 worker(item) 同时进行，前一个结束才取下一个；单项失败不影响其余项。
+function uploadPool(items, limit, worker){
+  items = Array.from(items);
+  let next = 0, results = new Array(items.length);
+  function run(){
+    if(next >= items.length) return Promise.resolve();
+    let i = next++;
+    return Promise.resolve().then(() => worker(items[i]))
+      .then(r => { results[i] = {item: items[i], result: r}; },
+            e => { results[i] = {item: items[i], error: e}; })
+      .then(run);
+  }
+  let runners = [];
+  for(let k = 0; k < Math.min(limit, items.length); k++) runners.push(run());
+  return Promise.all(runners).then(() => results);
+}
+
+// postWithProgress(url, formData, onProgress) → Promise<响应 JSON>
+// 用 XHR 发送以便拿到上传进度；非 2xx 或 {ok: false} 时以错误信息 reject。
+function postWithProgress(url, data, onProgress){
+  return new Promise((resolve, reject) => {
+    let x = new XMLHttpRequest();
+    x.open('POST', url);
+    x.upload.onprogress = e => { if(e.lengthComputable && onProgress) onProgress(e.loaded, e.total); };
+    x.onload = () => {
+      let body;
+      try { body = JSON.parse(x.responseText); } catch(e) { body = {ok: false, error: x.responseText}; }
+      if(x.status >= 200 && x.status < 300 && body.ok !== false) resolve(body);
+      else reject(body.error || x.statusText);
+    };
+    x.onerror = () => reject('网络错误');
+    x.send(data);
+  });
+}
+
+// resumableUpload(file, path, opts) → Promise<{name, size}>
+//   opts.parallel   同时上传的分片数（默认 3）
+//   opts.onProgress (已上传字节, 总字节)
+// 会话 id 记在 localStorage 中，页面刷新 / 断网后再次上传同一文件会从已收到的部分继续。
+function resumableUpload(file, path, opts){
+  opts = opts || {};
+  const base = opts.base || '/resumable';
+  const parallel = opts.parallel || 3;
+  const key = ['resumable', path, file.name, file.size, file.lastModified].join(':');
+  const json = r => r.json().then(o => { if(!r.ok || !o.ok) throw (o.error || r.statusText); return o; });
+
+  function start(){
+    let id = localStorage.getItem(key);
+    let resume = id ? fetch(base + '/' + id).then(json).catch(() => null) : Promise.resolve(null);
+    return resume.then(st => st || fetch(base, {
+      method: 'POST', headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({path: path, filename: file.name, size: file.size})
+    }).then(json).then(o => { localStorage.setItem(key, o.id); return o; }));
+  }
+
+  return start().then(st => {
+    // 计算尚未收到的区间，并按 chunk_size 切成分片
+    let pending = [], pos = 0, done = 0;
+    st.received.concat([[file.size, file.size]]).forEach(([s, e]) => {
+      for(let o = pos; o < s; o += st.chunk_size) pending.push([o, Math.min(o + st.chunk_size, s)]);
+      done += e - s; pos = Math.max(pos, e);
+    });
+    if(opts.onProgress) opts.onProgress(done, file.size);
+    function worker(){
+      let next = pending.shift();
+      if(!next) return Promise.resolve();
+      return fetch(base + '/' + st.id + '?offset=' + next[0], {
+        method: 'PUT', body: file.slice(next[0], next[1])
+      }).then(json).then(() => {
+        done += next[1] - next[0];
+        if(opts.onProgress) opts.onProgress(done, file.size);
+        return worker();
+      });
+    }
+    let workers = [];
+    for(let i = 0; i < parallel; i++) workers.push(worker());
+    return Promise.all(workers)
+      .then(() => fetch(base + '/' + st.id + '/finalize', {method: 'POST'}))
+      .then(json)
+      .then(o => { localStorage.removeItem(key); return o; });
+  });
+}
+"""
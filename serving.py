@@ -0,0 +1,248 @@
+"""
+serving.py — 各应用共用的文件响应：Range / If-Range（含多段）、强 ETag、
+If-None-Match / If-Modified-Since 304，以及 Cache-Control。
+
+视频拖动进度条时浏览器只请求需要的那一段，不必从头重传整个文件。
+
+文件字节的实际发送方式由配置 FILE_DELIVERY（或同名环境变量）决定：
+  python            — 默认，由 Python worker 分块读取发送
+  sendfile          — 整文件响应交给 WSGI file_wrapper（gunicorn 下走 os.sendfile 零拷贝）
+  x-accel-redirect  — 只返回响应头，由 nginx 按内部 location 发送文件；
+                      需配置 FILE_DELIVERY_PREFIXES = {本地目录: 内部 URL 前缀}
+  x-sendfile        — 只返回响应头，由 Apache mod_xsendfile / lighttpd 发送文件
+"""
+
+import os
+import uuid
+import calendar
+from stat import S_ISREG
+from urllib.parse import quote
+
+from flask import current_app, request, Response, abort
+from werkzeug.http import http_date
+from werkzeug.utils import safe_join
+from werkzeug.wsgi import wrap_file
+
+import listing
+
+# 每次从文件读取的块大小
+BLOCK_SIZE = 64 * 1024
+
+# 一次请求最多接受的区段数，超出则按整文件返回
+MAX_RANGES = 16
+
+# 内容不可变（如按哈希寻址）时的缓存时长：一年
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def delivery_backend() -> str:
+    return (current_app.config.get("FILE_DELIVERY")
+            or os.environ.get("FILE_DELIVERY", "python")).lower()
+
+
+def delivery_prefixes() -> dict:
+    """
+    X-Accel-Redirect 的目录映射；环境变量格式：
+      FILE_DELIVERY_PREFIXES="/srv/app/uploads=/_files/uploads,/srv/app/storage=/_files/storage"
+    """
+    prefixes = current_app.config.get("FILE_DELIVERY_PREFIXES")
+    if prefixes is None:
+        prefixes = {}
+        for item in os.environ.get("FILE_DELIVERY_PREFIXES", "").split(","):
+            if "=" in item:
+                root, prefix = item.split("=", 1)
+                prefixes[root.strip()] = prefix.strip()
+    return prefixes
+
+
+def offload_headers(path):
+    """
+    按配置生成交给前端代理发送文件的响应头；不适用时返回 None（由 Python 发送）。
+    """
+    backend = delivery_backend()
+    if backend == "x-sendfile":
+        # 响应头只能是 latin-1：原样透传 UTF-8 字节
+        return {"X-Sendfile": os.path.abspath(path).encode("utf-8").decode("latin-1")}
+    if backend == "x-accel-redirect":
+        path = os.path.abspath(path)
+        for root, prefix in sorted(delivery_prefixes().items(),
+                                   key=lambda kv: len(kv[0]), reverse=True):
+            root = os.path.abspath(root)
+            if path.startswith(root + os.sep):
+                rel = os.path.relpath(path, root).replace(os.sep, "/")
+                return {"X-Accel-Redirect": prefix.rstrip("/") + "/" + quote(rel)}
+    return None
+
+
+def file_etag(st) -> str:
+    """由 inode / mtime / size 派生的强 ETag（文件改写后必然变化）。"""
+    return "%x-%x-%x" % (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def read_file_range(path, start, end):
+    """读取 path 的 [start, end) 区间。"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _content_disposition(name, as_attachment):
+    kind = "attachment" if as_attachment else "inline"
+    try:
+        name.encode("ascii")
+        return '%s; filename="%s"' % (kind, name.replace('"', ''))
+    except UnicodeEncodeError:
+        return "%s; filename*=UTF-8''%s" % (kind, quote(name, safe=""))
+
+
+def _resolve_ranges(rng, size):
+    """把 werkzeug 的 Range 转为 [(start, end)]；全部不可满足时返回 []。"""
+    out = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            out.append((start, stop))
+    return out
+
+
+def _epoch(dt):
+    # werkzeug 不同版本返回 naive(UTC) 或 aware 的 datetime，统一换算
+    return calendar.timegm(dt.utctimetuple())
+
+
+def _if_range_ok(etag, mtime):
+    ir = request.if_range
+    if ir.etag is None and ir.date is None:
+        return True
+    if ir.etag is not None:
+        # If-Range 只接受强比较
+        return ir.etag == etag
+    return mtime is not None and int(mtime) == _epoch(ir.date)
+
+
+def _not_modified(etag, mtime):
+    if request.if_none_match:
+        return etag is not None and request.if_none_match.contains_weak(etag)
+    ims = request.if_modified_since
+    return ims is not None and mtime is not None and int(mtime) <= _epoch(ims)
+
+
+def serve(size, read_range, mimetype="application/octet-stream", etag=None,
+          mtime=None, download_name=None, as_attachment=False,
+          immutable=False, private=True, full_body=None, offload=None):
+    """
+    通用响应构造：read_range(start, end) 产出 [start, end) 的字节。
+    - immutable=True：内容永不改变（如 CID），允许长期缓存
+    - 否则要求客户端每次用 ETag / Last-Modified 重新验证
+    - full_body()：可选，整文件响应时使用的可迭代对象（如 WSGI file_wrapper）
+    - offload：可选，交给前端代理发送文件的响应头；Range 也由代理处理
+    """
+    headers = {"Accept-Ranges": "bytes"}
+    if etag:
+        headers["ETag"] = '"%s"' % etag
+    if mtime is not None:
+        headers["Last-Modified"] = http_date(mtime)
+    if immutable:
+        headers["Cache-Control"] = "%s, max-age=%d, immutable" % (
+            "private" if private else "public", IMMUTABLE_MAX_AGE)
+    else:
+        headers["Cache-Control"] = "private, no-cache" if private else "no-cache"
+    if download_name or as_attachment:
+        headers["Content-Disposition"] = _content_disposition(
+            download_name or "download", as_attachment)
+
+    if request.method in ("GET", "HEAD") and _not_modified(etag, mtime):
+        return Response(status=304, headers=headers)
+
+    if offload:
+        headers.update(offload)
+        return Response(status=200, mimetype=mimetype, headers=headers)
+
+    head = request.method == "HEAD"
+    ranges = None
+    if request.range and request.range.units == "bytes" and _if_range_ok(etag, mtime):
+        ranges = _resolve_ranges(request.range, size)
+        if not ranges:
+            headers["Content-Range"] = "bytes */%d" % size
+            return Response(status=416, headers=headers)
+        if len(ranges) > MAX_RANGES:
+            ranges = None
+
+    if not ranges:
+        headers["Content-Length"] = str(size)
+        if head:
+            body = ()
+        elif full_body is not None:
+            body = full_body()
+        else:
+            body = read_range(0, size)
+        return Response(body, status=200, mimetype=mimetype, headers=headers,
+                        direct_passthrough=True)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = "bytes %d-%d/%d" % (start, end - 1, size)
+        headers["Content-Length"] = str(end - start)
+        body = () if head else read_range(start, end)
+        return Response(body, status=206, mimetype=mimetype, headers=headers,
+                        direct_passthrough=True)
+
+    # 多段：multipart/byteranges
+    boundary = uuid.uuid4().hex
+    parts = []
+    for start, end in ranges:
+        part_head = ("\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n"
+                     % (boundary, mimetype, start, end - 1, size)).encode("latin-1")
+        parts.append((part_head, start, end))
+    tail = ("\r\n--%s--\r\n" % boundary).encode("latin-1")
+    headers["Content-Length"] = str(
+        sum(len(h) + e - s for h, s, e in parts) + len(tail))
+
+    def body():
+        for part_head, start, end in parts:
+            yield part_head
+            yield from read_range(start, end)
+        yield tail
+
+    return Response(() if head else body(), status=206,
+                    content_type="multipart/byteranges; boundary=" + boundary,
+                    headers=headers, direct_passthrough=True)
+
+
+def send_path(path, mimetype=None, download_name=None, as_attachment=False,
+              etag=None, immutable=False, private=True):
+    """发送已经过路径校验的文件；不存在时 404。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    if not S_ISREG(st.st_mode):
+        abort(404)
+    if mimetype is None:
+        mimetype = listing.guess_mime(path)
+    full_body = ((lambda: wrap_file(request.environ, open(path, "rb"), BLOCK_SIZE))
+                 if delivery_backend() == "sendfile" else None)
+    return serve(
+        st.st_size, lambda s, e: read_file_range(path, s, e),
+        mimetype=mimetype, etag=etag or file_etag(st), mtime=st.st_mtime,
+        download_name=download_name or (os.path.basename(path) if as_attachment else None),
+        as_attachment=as_attachment, immutable=immutable, private=private,
+        full_body=full_body, offload=offload_headers(path),
+    )
+
+
+def send_from(directory, filename, **kw):
+    """send_from_directory 的替代：安全拼接路径后交给 send_path。"""
+    path = safe_join(directory, filename)
+    if path is None:
+        abort(404)
+    return send_path(path, **kw)
@@ -0,0 +1,107 @@
+"""
+streaming.py — 大目录列表的流式响应：边读目录边输出，内存占用与条目数无关。
+
+  stream_template(name, **context)   逐块渲染模板（Flask 2.2 之前没有内置的 stream_template）
+  ndjson(rows)                       每行一个 JSON 对象（application/x-ndjson）
+
+条目一般直接来自 listing.scan_dir()：不排序、不经过目录缓存，
+50 万个条目的目录也能在读到第一批条目时就开始输出。
+输出先攒到 CHUNK_SIZE 再交给服务器，避免每个条目一次 write。
+
+前端用 CLIENT_JS 中的 readNdjson() 边收边处理（create_blueprint 在 /stream/client.js 提供）。
+"""
+
+import json
+
+from flask import Blueprint, Response, current_app, get_flashed_messages, stream_with_context
+
+# 攒够这么多字节再发送一次
+CHUNK_SIZE = 32 * 1024
+
+
+def _chunked(pieces, size=CHUNK_SIZE):
+    buf, n = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        n += len(piece)
+        if n >= size:
+            yield "".join(buf)
+            buf, n = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+def stream_template(name, **context):
+    """
+    边渲染边发送模板，context 中的可迭代对象（如 scan_dir 生成器）在渲染时才逐项读取。
+    闪现消息先取出：响应头（含 session cookie）会在模板渲染前发出。
+    """
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    get_flashed_messages()
+    template = app.jinja_env.get_template(name)
+    return Response(stream_with_context(_chunked(template.generate(context))),
+                    mimetype="text/html")
+
+
+def ndjson(rows):
+    """
+    rows 中的每个对象输出为一行 JSON。
+    读取 rows 时出错会输出一行 {"error": ...} 后结束，客户端据此判断列表不完整。
+    """
+    def lines():
+        try:
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+        except OSError as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+    resp = Response(stream_with_context(_chunked(lines())), mimetype="application/x-ndjson")
+    # 反向代理（nginx）默认会缓冲整个响应，这里要求它直接转发
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def create_blueprint(url_prefix="/stream"):
+    """只提供 /stream/client.js。"""
+    bp = Blueprint("streaming", __name__, url_prefix=url_prefix)
+
+    @bp.route("/client.js")
+    def client_js():
+        return Response(CLIENT_JS, mimetype="application/javascript")
+
+    return bp
+
+
+CLIENT_JS = r"""
+// readNdjson(url, onRows, opts) → Promise<行数>
+// 边下载边解析 NDJSON，每收到一批完整的行调用一次 onRows(rows)。
+// opts.signal：AbortController.signal，切换目录时可中止旧的请求。
+// 服务端中途出错时输出 {"error": ...} 行，这里以该错误信息 reject。
+function readNdjson(url, onRows, opts){
+  opts = opts || {};
+  return fetch(url, {credentials: 'same-origin', signal: opts.signal}).then(r => {
+    if(!r.ok) return r.text().then(t => { throw t || r.statusText; });
+    const reader = r.body.getReader(), decoder = new TextDecoder();
+    let rest = '', count = 0;
+    function pump(){
+      return reader.read().then(res => {
+        rest += decoder.decode(res.value || new Uint8Array(0), {stream: !res.done});
+        let lines = rest.split('\n');
+        rest = res.done ? '' : lines.pop();
+        let rows = [];
+        for(const line of lines){
+          if(!line) continue;
+          const row = JSON.parse(line);
+          if(row.error !== undefined && Object.keys(row).length === 1) throw row.error;
+          rows.push(row);
+        }
+        if(rows.length){ count += rows.length; onRows(rows); }
+        return res.done ? count : pump();
+      });
+    }
+    return pump();
+  });
+}
+"""
@@ -0,0 +1,396 @@
+"""
+textsearch.py — 文本文件全文检索（SQLite FTS5），供各应用共用。
+
+索引按分区（用户 / 存储根目录）拆成独立的 SQLite 文件，查询只打开自己的那一个，
+单次查询的开销随该分区的数据量增长，而不是随全站增长。
+
+索引的更新来源：
+  - 应用的修改路由调用 update() / remove() / rename()：
+    remove / rename 直接改索引；update 只把路径放进队列，由后台线程读文件、写索引
+  - 后台线程每隔 CRAWL_INTERVAL 对照磁盘（大小 + mtime）补上应用之外的改动
+
+分词使用 FTS5 的 trigram（SQLite >= 3.34）：中英文都按子串匹配；
+更早的 SQLite 退回 unicode61（按词匹配，连续的中文算一个词）。
+trigram 下不足 3 个字符的关键词进不了索引，改用 LIKE 在正文上过滤：
+和长关键词一起出现时只过滤 MATCH 的结果；全是短关键词时只扫描最近修改的
+SHORT_SCAN_DOCS 个文件，结果按修改时间从新到旧排列（score 为 0）。
+
+接口（默认挂在 /api/search）：
+  GET /api/search?q=关键词&page=1&limit=20&path=子目录
+      → {items: [{path, snippet, size, mtime, score}], next_page}
+  snippet 已做 HTML 转义，命中部分用 <mark> 标出；多个关键词之间是“且”的关系。
+"""
+
+import os
+import re
+import html
+import time
+import queue
+import hashlib
+import sqlite3
+import threading
+
+from flask import Blueprint, jsonify, request
+
+import listing
+
+# 默认参与索引的扩展名
+TEXT_EXTENSIONS = {'txt', 'md', 'json', 'xml', 'csv', 'log', 'py', 'html', 'js', 'css'}
+
+# 每个文件最多索引的字节数（更大的文件只索引开头部分）
+MAX_BYTES = 8 * 1024 * 1024
+
+# 后台核对磁盘的间隔（秒）
+CRAWL_INTERVAL = int(os.environ.get('SEARCH_CRAWL_INTERVAL', 600))
+
+PAGE_SIZE = 20
+MAX_PAGE = 100
+MAX_TERMS = 8
+
+# 关键词全都不足 3 个字符时，最多逐个扫描的文件数（按修改时间从新到旧）
+SHORT_SCAN_DOCS = int(os.environ.get('SEARCH_SHORT_SCAN', 2000))
+
+# snippet() 的命中标记，转义之后再换成 <mark>
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def _tokenizer():
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        return 'trigram'
+    except sqlite3.OperationalError:
+        return 'unicode61'
+    finally:
+        conn.close()
+
+
+TOKENIZER = _tokenizer()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+  id     INTEGER PRIMARY KEY,
+  path   TEXT NOT NULL UNIQUE,
+  size   INTEGER NOT NULL,
+  mtime  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_docs_mtime ON docs(mtime);
+CREATE VIRTUAL TABLE IF NOT EXISTS body USING fts5(text, tokenize='%s');
+""" % TOKENIZER
+
+
+def _like_prefix(rel):
+    """rel 目录下所有路径的 LIKE 模式（转义 % _ \\）。"""
+    return re.sub(r'([%_\\])', r'\\\1', rel) + '/%'
+
+
+def _like_term(term):
+    """正文包含 term 的 LIKE 模式（转义 % _ \\）。"""
+    return '%' + re.sub(r'([%_\\])', r'\\\1', term) + '%'
+
+
+def build_query(q):
+    """
+    把用户输入拆成关键词，返回 (MATCH 表达式, 短关键词列表)。
+    每个关键词作为短语加引号（不解析 FTS5 语法），以 AND 连接；trigram 下不足 3 个字符的
+    关键词不进 MATCH，由调用方用 LIKE 过滤。全是短关键词时 MATCH 表达式为 None。
+    """
+    terms = q.split()[:MAX_TERMS]
+    if not terms:
+        raise ValueError('请输入关键词')
+    short = [t for t in terms if TOKENIZER == 'trigram' and len(t) < 3]
+    phrases = ['"%s"' % t.replace('"', '""') for t in terms if t not in short]
+    return (' AND '.join(phrases) or None), short
+
+
+def _mark_excerpt(text, terms, head, tail):
+    """LIKE 扫描得到的正文片段：标出关键词并转义，与 snippet() 的输出格式一致。"""
+    pattern = re.compile('|'.join(re.escape(t) for t in terms), re.I)
+    text = pattern.sub(lambda m: _MARK_START + m.group(0) + _MARK_END, text)
+    return ('…' if head else '') + text + ('…' if tail else '')
+
+
+class TextIndex:
+    """
+    directory：索引文件所在目录，每个分区一个 <分区>.db
+    root_of(partition)：分区对应的文件根目录（路径都相对于它，用 / 分隔）
+    partitions()：后台核对时要检查的分区；默认为本进程启动以来用到过的分区
+    """
+
+    def __init__(self, directory, root_of, partitions=None, extensions=TEXT_EXTENSIONS,
+                 crawl_interval=CRAWL_INTERVAL):
+        self.directory = directory
+        self.root_of = root_of
+        self.partitions = partitions or (lambda: list(self._seen))
+        self.extensions = {x.lower() for x in extensions}
+        self.crawl_interval = crawl_interval
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._queue = queue.Queue()
+        self._pid = None
+        self.indexed = self.removed = self.crawls = 0
+        self.last_crawl = None
+
+    # —— 连接 / 后台线程 ——
+
+    def _db_path(self, partition):
+        raw = str(partition) or 'default'
+        name = re.sub(r'[^0-9A-Za-z_.-]', '_', raw)
+        if name != raw:  # 清洗过的名字可能撞车，加上原名的哈希
+            name += '-' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.directory, name + '.db')
+
+    def _conn(self, partition):
+        loc = self._local
+        if getattr(loc, 'pid', None) != os.getpid():
+            loc.conns, loc.pid = {}, os.getpid()
+        conn = loc.conns.get(partition)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path(partition), timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            loc.conns[partition] = conn
+        self._seen.add(partition)
+        self._ensure_worker()
+        return conn
+
+    def _ensure_worker(self):
+        # 后台线程在第一次使用时启动（服务器 fork 出 worker 之后）
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+        threading.Thread(target=self._run, name='textsearch', daemon=True).start()
+
+    def _run(self):
+        next_crawl = time.monotonic()
+        while True:
+            try:
+                partition, rel = self._queue.get(timeout=max(0, next_crawl - time.monotonic()))
+            except queue.Empty:
+                for partition in self.partitions():
+                    try:
+                        self.crawl(partition)
+                    except (OSError, sqlite3.Error):
+                        pass
+                next_crawl = time.monotonic() + self.crawl_interval
+                continue
+            try:
+                self._index(self._conn(partition), self.root_of(partition), rel)
+            except (OSError, sqlite3.Error):
+                pass
+
+    # —— 写索引 ——
+
+    def indexable(self, name):
+        return name.rsplit('.', 1)[-1].lower() in self.extensions if '.' in name else False
+
+    def _delete(self, conn, rel, recursive=False):
+        where = 'path = ?' + (" OR path LIKE ? ESCAPE '\\'" if recursive else '')
+        args = (rel, _like_prefix(rel)) if recursive else (rel,)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM body WHERE rowid IN (SELECT id FROM docs WHERE %s)' % where, args)
+            n = conn.execute('DELETE FROM docs WHERE %s' % where, args).rowcount
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self.removed += n
+
+    def _index(self, conn, root, rel):
+        """（重新）索引一个文件；文件已不存在或不再是文本文件时从索引中删除。"""
+        full = os.path.join(root, rel)
+        try:
+            st = os.stat(full)
+        except FileNotFoundError:
+            st = None
+        if st is None or not os.path.isfile(full) or not self.indexable(rel):
+            self._delete(conn, rel)
+            return
+        row = conn.execute('SELECT id, size, mtime FROM docs WHERE path=?', (rel,)).fetchone()
+        if row is not None and (row[1], row[2]) == (st.st_size, st.st_mtime):
+            return
+        with open(full, 'rb') as f:
+            data = f.read(MAX_BYTES)
+        if b'\0' in data[:8192]:  # 扩展名是文本但内容是二进制
+            self._delete(conn, rel)
+            return
+        text = data.decode('utf-8', errors='replace')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 拿到写锁后再查一次：后台线程和请求线程可能同时在索引同一个文件
+            row = conn.execute('SELECT id, size, mtime FROM docs WHERE path=?', (rel,)).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM body WHERE rowid=?', (row[0],))
+                conn.execute('UPDATE docs SET size=?, mtime=? WHERE id=?',
+                             (st.st_size, st.st_mtime, row[0]))
+                doc_id = row[0]
+            else:
+                doc_id = conn.execute('INSERT INTO docs(path, size, mtime) VALUES(?,?,?)',
+                                      (rel, st.st_size, st.st_mtime)).lastrowid
+            conn.execute('INSERT INTO body(rowid, text) VALUES(?,?)', (doc_id, text))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self.indexed += 1
+
+    def update(self, partition, rel):
+        """文件新建 / 改写后调用：放进队列，由后台线程读取并索引。"""
+        if self.indexable(rel):
+            self._conn(partition)
+            self._queue.put((partition, rel))
+
+    def remove(self, partition, rel, recursive=False):
+        """删除文件（recursive=True：删除目录及其下所有文件）后调用。"""
+        try:
+            self._delete(self._conn(partition), rel, recursive)
+        except sqlite3.Error:
+            pass  # 文件已经删掉了，索引留到下次核对时清理
+
+    def rename(self, partition, old, new):
+        """重命名 / 移动文件或目录后调用：只改索引里的路径，不重新读文件。"""
+        try:
+            self._rename(self._conn(partition), old, new)
+        except sqlite3.Error:
+            pass  # 留到下次核对时按磁盘修正
+        # 扩展名可能变了（a.txt → a.bak），交给后台重新判断
+        self._queue.put((partition, new))
+
+    def _rename(self, conn, old, new):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 目标位置残留的旧记录先清掉，避免路径唯一约束冲突
+            for where, args in (('path = ?', (new,)),
+                                ("path LIKE ? ESCAPE '\\'", (_like_prefix(new),))):
+                conn.execute('DELETE FROM body WHERE rowid IN (SELECT id FROM docs WHERE %s)'
+                             % where, args)
+                conn.execute('DELETE FROM docs WHERE %s' % where, args)
+            conn.execute("UPDATE docs SET path = ? || substr(path, ?) "
+                         "WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                         (new, len(old) + 1, old, _like_prefix(old)))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def crawl(self, partition):
+        """对照磁盘核对一个分区：索引新增 / 变化的文本文件，删除已不存在的。"""
+        root = self.root_of(partition)
+        conn = self._conn(partition)
+        known = {r[0]: (r[1], r[2]) for r in conn.execute('SELECT path, size, mtime FROM docs')}
+        seen = set()
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                entries = list(listing.scan_dir(os.path.join(root, rel_dir)))
+            except OSError:
+                continue
+            for e in entries:
+                rel = rel_dir + '/' + e.name if rel_dir else e.name
+                if e.is_dir:
+                    stack.append(rel)
+                elif self.indexable(e.name):
+                    seen.add(rel)
+                    if known.get(rel) != (e.size, e.mtime):
+                        self._index(conn, root, rel)
+        for rel in known.keys() - seen:
+            self._delete(conn, rel)
+        self.crawls += 1
+        self.last_crawl = time.time()
+
+    # —— 查询 ——
+
+    def search(self, partition, q, limit=PAGE_SIZE, offset=0, prefix=''):
+        """
+        按相关度（bm25）返回 (结果列表, 是否还有下一页)。
+        prefix 为子目录时只在该目录下查找。关键词不合法时抛 ValueError。
+        """
+        fts, short = build_query(q)
+        if fts is None:
+            return self._scan(partition, short, limit, offset, prefix)
+        sql = ("SELECT d.path, d.size, d.mtime, snippet(body, 0, ?, ?, '…', 64), body.rank "
+               "FROM body JOIN docs d ON d.id = body.rowid WHERE body MATCH ?")
+        args = [_MARK_START, _MARK_END, fts]
+        for t in short:
+            sql += " AND body.text LIKE ? ESCAPE '\\'"
+            args.append(_like_term(t))
+        if prefix:
+            # 'dir/' <= path < 'dir0'（'0' 紧跟在 '/' 之后），可以走 path 上的索引
+            sql += ' AND d.path >= ? AND d.path < ?'
+            args += [prefix + '/', prefix + '0']
+        sql += ' ORDER BY body.rank LIMIT ? OFFSET ?'
+        args += [limit + 1, offset]
+        rows = self._conn(partition).execute(sql, args).fetchall()
+        items = [{
+            'path': path,
+            'size': size,
+            'mtime': int(mtime),
+            'snippet': html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'),
+            'score': round(-rank, 3),
+        } for path, size, mtime, snippet, rank in rows[:limit]]
+        return items, len(rows) > limit
+
+    def _scan(self, partition, terms, limit, offset, prefix):
+        # 关键词都不足 3 个字符：沿 mtime 索引取最近的 SHORT_SCAN_DOCS 个文件，逐个 LIKE
+        where, args = '', [terms[0]]
+        if prefix:
+            where, args = ' WHERE path >= ? AND path < ?', args + [prefix + '/', prefix + '0']
+        sql = ("SELECT path, size, mtime, s, substr(text, s, 96), length(text) FROM ("
+               "SELECT d.path, d.size, d.mtime, b.text, max(1, instr(lower(b.text), lower(?)) - 32) AS s"
+               " FROM (SELECT id, path, size, mtime FROM docs%s ORDER BY mtime DESC LIMIT ?) d"
+               " JOIN body b ON b.rowid = d.id WHERE %s ORDER BY d.mtime DESC LIMIT ? OFFSET ?)"
+               % (where, ' AND '.join(["b.text LIKE ? ESCAPE '\\'"] * len(terms))))
+        args += [SHORT_SCAN_DOCS] + [_like_term(t) for t in terms] + [limit + 1, offset]
+        rows = self._conn(partition).execute(sql, args).fetchall()
+        items = [{
+            'path': path,
+            'size': size,
+            'mtime': int(mtime),
+            'snippet': html.escape(_mark_excerpt(text, terms, start > 1, start + len(text) <= length))
+                       .replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'),
+            'score': 0,
+        } for path, size, mtime, start, text, length in rows[:limit]]
+        return items, len(rows) > limit
+
+    def stats(self):
+        return {
+            'tokenizer': TOKENIZER,
+            'queued': self._queue.qsize(),
+            'indexed': self.indexed,
+            'removed': self.removed,
+            'crawls': self.crawls,
+            'last_crawl': self.last_crawl,
+        }
+
+
+def create_blueprint(index, partition=lambda: '', guard=None, url_prefix='/api/search'):
+    """
+    生成 /api/search 接口的 Blueprint。
+    - partition()：当前请求对应的分区（如当前用户 id），只在该分区的索引里查找
+    - guard：视图装饰器（如 login_required）
+    """
+    bp = Blueprint('textsearch', __name__, url_prefix=url_prefix)
+    wrap = guard or (lambda f: f)
+
+    @bp.route('', methods=['GET'])
+    @wrap
+    def search():
+        q = request.args.get('q', '').strip()
+        page = max(1, request.args.get('page', 1, type=int))
+        limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE))
+        prefix = request.args.get('path', '').strip('/')
+        try:
+            items, more = index.search(partition(), q, limit, (page - 1) * limit, prefix)
+        except ValueError as e:
+            return jsonify({'ok': False, 'error': str(e)}), 400
+        return jsonify({'ok': True, 'q': q, 'page': page, 'items': items,
+                        'next_page': page + 1 if more else None})
+
+    return bp
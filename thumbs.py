@@ -0,0 +1,221 @@
+"""
+thumbs.py — 缩略图 / 视频封面帧的生成与磁盘缓存。
+
+- 图片：用 Pillow（可选依赖）缩放，输出 WebP；Pillow 不支持 WebP 时输出 JPEG
+- 视频：PATH 上有 ffmpeg 时抽取一帧作为封面（JPEG）
+- 生成在后台线程池中进行，同一文件的并发请求只生成一次
+- 缓存文件名由 源路径 + mtime + 大小 + 尺寸 的哈希决定，源文件改动后自然失效
+- 缓存目录总大小超过上限时按最近使用时间（LRU）淘汰
+
+依赖缺失时 get() 返回 None，由调用方回退到原文件或不显示封面。
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow 为可选依赖
+    Image = None
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+
+# 缩略图最大宽高
+THUMB_SIZE = (320, 320)
+
+# 缓存目录上限；淘汰到上限的 90% 为止
+MAX_BYTES = 512 * 1024 * 1024
+
+# 请求线程等待生成结果的最长时间（秒）
+WAIT_TIMEOUT = 15
+
+# 视频封面取第几秒的画面
+POSTER_AT = 1
+
+if Image is not None and features.check("webp"):
+    IMAGE_EXT, IMAGE_FORMAT = ".webp", "WEBP"
+else:
+    IMAGE_EXT, IMAGE_FORMAT = ".jpg", "JPEG"
+
+MIMETYPES = {".webp": "image/webp", ".jpg": "image/jpeg"}
+
+
+def can_thumbnail(mime):
+    if mime.startswith("image/"):
+        return Image is not None
+    if mime.startswith("video/"):
+        return FFMPEG is not None
+    return False
+
+
+def probe_size(path, mime):
+    """返回 (宽, 高)；图片只读文件头，视频用 ffprobe；无法获取时为 (None, None)。"""
+    try:
+        if mime.startswith("image/") and Image is not None:
+            with Image.open(path) as im:
+                return im.size
+        if mime.startswith("video/") and FFPROBE is not None:
+            out = subprocess.run(
+                [FFPROBE, "-v", "error", "-select_streams", "v:0",
+                 "-show_entries", "stream=width,height", "-of", "csv=p=0", path],
+                stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=30).stdout
+            w, h = out.strip().split(",")[:2]
+            return int(w), int(h)
+    except Exception:
+        pass
+    return None, None
+
+
+def _render_image(src, dest, size):
+    with Image.open(src) as im:
+        # JPEG 可在解码阶段直接按比例缩小，大幅减少解码量
+        im.draft("RGB", size)
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail(size)
+        if IMAGE_FORMAT == "JPEG" and im.mode != "RGB":
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+        im.save(dest, IMAGE_FORMAT, quality=80)
+
+
+def _render_poster(src, dest, size):
+    scale = "scale=w=%d:h=%d:force_original_aspect_ratio=decrease" % size
+    # 先取第 POSTER_AT 秒；视频太短取不到时退回第一帧
+    for seek in (["-ss", str(POSTER_AT)], []):
+        subprocess.run(
+            [FFMPEG, "-v", "error", "-y"] + seek +
+            ["-i", src, "-frames:v", "1", "-vf", scale, "-f", "image2", dest],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, timeout=60)
+        if os.path.getsize(dest) > 0:
+            return
+    raise OSError("ffmpeg 未能抽取封面帧")
+
+
+class ThumbnailCache:
+    def __init__(self, root, size=THUMB_SIZE, max_bytes=MAX_BYTES, workers=None):
+        self.root = root
+        self.size = tuple(size)
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                        thread_name_prefix="thumbs")
+        self._lock = threading.Lock()
+        self._pending = {}    # 缓存路径 -> Future
+        self._failed = set()  # 生成失败过的缓存路径，避免反复重试
+        self._total = sum(size for _, size, _ in self._scan())
+
+    def _scan(self):
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith(".tmp-"):  # 正在生成的临时文件
+                    continue
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                yield p, st.st_size, st.st_mtime
+
+    def cache_path(self, src, st, mime):
+        ext = IMAGE_EXT if mime.startswith("image/") else ".jpg"
+        key = "%s\0%d\0%d\0%dx%d" % (os.path.abspath(src), st.st_mtime_ns,
+                                      st.st_size, self.size[0], self.size[1])
+        h = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, h[:2], h + ext)
+
+    @staticmethod
+    def mimetype(path):
+        return MIMETYPES[os.path.splitext(path)[1]]
+
+    def _submit(self, src, mime):
+        """返回 (缓存路径, Future 或 None)；已缓存时 Future 为 None。"""
+        st = os.stat(src)
+        dest = self.cache_path(src, st, mime)
+        if os.path.exists(dest):
+            # 命中：刷新 mtime 作为 LRU 的使用时间
+            try:
+                os.utime(dest)
+            except OSError:
+                pass
+            return dest, None
+        with self._lock:
+            if dest in self._failed:
+                raise OSError("缩略图生成失败过：%s" % src)
+            fut = self._pending.get(dest)
+            if fut is None:
+                fut = self._pool.submit(self._generate, src, dest, mime)
+                self._pending[dest] = fut
+        return dest, fut
+
+    def _generate(self, src, dest, mime):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".tmp-",
+                                   suffix=os.path.splitext(dest)[1])
+        os.close(fd)
+        try:
+            if mime.startswith("image/"):
+                _render_image(src, tmp, self.size)
+            else:
+                _render_poster(src, tmp, self.size)
+            os.replace(tmp, dest)
+        except Exception:
+            with self._lock:
+                self._failed.add(dest)
+            raise
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            with self._lock:
+                self._pending.pop(dest, None)
+        with self._lock:
+            self._total += os.path.getsize(dest)
+            over = self._total > self.max_bytes
+        if over:
+            self.evict(keep=dest)
+
+    def get(self, src, mime, timeout=WAIT_TIMEOUT):
+        """返回缩略图文件路径；无法生成或超时返回 None。"""
+        if not can_thumbnail(mime):
+            return None
+        try:
+            dest, fut = self._submit(src, mime)
+            if fut is not None:
+                fut.result(timeout)
+        except Exception:
+            # 超时 / 图片损坏 / 格式不支持等
+            return None
+        return dest
+
+    def prefetch(self, src, mime):
+        """上传完成后提前在后台生成，不等待结果。"""
+        if can_thumbnail(mime):
+            try:
+                self._submit(src, mime)
+            except OSError:
+                pass
+
+    def evict(self, keep=None):
+        """按最近使用时间淘汰，直到总大小降到上限的 90%；keep 为刚生成、不淘汰的文件。"""
+        files = sorted(self._scan(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 9 // 10
+        for path, size, _ in files:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._total = total
@@ -1,7 +1,12 @@
 import os
 import sqlite3
 from functools import wraps
-from flask import Flask, request, redirect, url_for, session, g, send_from_directory, render_template_string, jsonify
+from flask import Flask, request, redirect, url_for, session, render_template, jsonify
+from jinja2 import DictLoader
+
+import dbpool
+import listing
+import serving
 
 # Flask setup
 app = Flask(__name__)
@@ -14,19 +19,11 @@ DB_PATH = os.path.join(BASE_DIR, 'app.db')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # ----- Database -----
+# 每个进程一个连接池（WAL、busy_timeout、语句缓存），请求结束时自动归还
+db_pool = dbpool.ConnectionPool(DB_PATH, app)
+
 def get_db():
-    db = getattr(g, '_db', None)
-    if not db:
-        db = sqlite3.connect(DB_PATH)
-        db.row_factory = sqlite3.Row
-        g._db = db
-    return db
-
-@app.teardown_appcontext
-def close_db(error):
-    db = getattr(g, '_db', None)
-    if db:
-        db.close()
+    return db_pool.get()
 
 def init_db():
     db = get_db()
@@ -41,7 +38,8 @@ def init_db():
     """)
     db.commit()
 
-init_db()
+with app.app_context():
+    init_db()
 
 # ----- Auth -----
 def login_required(f):
@@ -102,17 +100,17 @@ TEMPLATE = """
     <thead><tr><th>Name</th><th>Type</th><th>Actions</th></tr></thead>
     <tbody id="fileList">
       {% for e in entries %}
-      <tr data-name="{{ e.name }}" data-isdir="{{ e.isdir }}">
+      <tr data-name="{{ e.name }}" data-isdir="{{ e.is_dir }}">
         <td>
-          {% if e.isdir %}
+          {% if e.is_dir %}
             📁 <a href="{{ url_for('index', subpath=(cur_path + '/' + e.name).lstrip('/')) }}">{{ e.name }}</a>
           {% else %}
             📄 {{ e.name }}
           {% endif %}
         </td>
-        <td>{{ 'Folder' if e.isdir else 'File' }}</td>
+        <td>{{ 'Folder' if e.is_dir else 'File' }}</td>
         <td>
-          {% if not e.isdir %}
+          {% if not e.is_dir %}
             <a href="{{ url_for('download', subpath=cur_path, filename=e.name) }}" class="btn btn-sm btn-outline-primary">Download</a>
             {% if e.name.lower().endswith(('.mp4','.webm')) %}
               <button class="btn btn-sm btn-outline-success play-video">Play Video</button>
@@ -244,6 +242,9 @@ $(document).on("click", ".play-audio", function(){
 </html>
 """
 
+# 模板只在第一次使用时编译一次，之后由 jinja 环境缓存
+app.jinja_loader = DictLoader({'index.html': TEMPLATE})
+
 # ----- Routes -----
 @app.route('/register', methods=['GET','POST'])
 def register():
@@ -292,10 +293,8 @@ def logout():
 @login_required
 def index(subpath):
     base = safe_path(subpath)
-    items = []
-    for name in sorted(os.listdir(base)):
-        items.append({'name': name, 'isdir': os.path.isdir(os.path.join(base, name))})
-    return render_template_string(TEMPLATE, entries=items, cur_path=subpath, username=session['username'])
+    items = listing.cache.list_dir(base, stat=False)
+    return render_template('index.html', entries=items, cur_path=subpath, username=session['username'])
 
 @app.route('/upload', methods=['POST'])
 @login_required
@@ -306,6 +305,7 @@ def upload_file():
     if not f:
         return "No file", 400
     f.save(os.path.join(dest, f.filename))
+    listing.cache.invalidate(dest)
     return "OK"
 
 @app.route('/mkdir', methods=['POST'])
@@ -317,6 +317,7 @@ def make_folder():
     if not name:
         return "Name required", 400
     os.makedirs(os.path.join(dest, name), exist_ok=False)
+    listing.cache.invalidate(dest)
     return "OK"
 
 @app.route('/rename', methods=['POST'])
@@ -329,6 +330,7 @@ def rename_item():
     if not os.path.exists(old):
         return "Not found", 404
     os.rename(old, new)
+    listing.cache.touch(old, new)
     return "OK"
 
 @app.route('/delete', methods=['POST'])
@@ -341,19 +343,25 @@ def delete_item():
         os.rmdir(target)
     else:
         os.remove(target)
+    listing.cache.touch(target)
     return "OK"
 
+@app.route('/cache-stats')
+@login_required
+def cache_stats():
+    return jsonify(listing.cache.stats())
+
 @app.route('/download/<path:subpath>/<path:filename>')
 @login_required
 def download(subpath, filename):
     d = safe_path(subpath)
-    return send_from_directory(d, filename, as_attachment=True)
+    return serving.send_from(d, filename, as_attachment=True)
 
 @app.route('/media/<path:subpath>/<path:filename>')
 @login_required
 def media(subpath, filename):
     d = safe_path(subpath)
-    return send_from_directory(d, filename)
+    return serving.send_from(d, filename)
 
 @app.route('/edit', methods=['GET','POST'])
 @login_required
@@ -370,6 +378,7 @@ def edit_file():
     fn = data.get('file')
     try:
         open(os.path.join(p, fn), 'w', encoding='utf-8').write(data.get('content',''))
+        listing.cache.invalidate(p)
         return "OK"
     except:
         return "Write error", 500
@@ -2,14 +2,15 @@ pip install flask flask-login
 python app.py
 
 import os
+import json
+import base64
 import sqlite3
-import hashlib
-import mimetypes
+import click
 from math import ceil
 from datetime import datetime
 from flask import (
-    Flask, g, render_template, request,
-    redirect, url_for, flash, send_from_directory,
+    Flask, render_template, request,
+    redirect, url_for, flash,
     abort, jsonify
 )
 from flask_login import (
@@ -19,13 +20,27 @@ from flask_login import (
 from werkzeug.utils import secure_filename, safe_join
 from jinja2 import DictLoader
 
+import cache
+import dbpool
+import listing
+import passwords
+import resumable
+import serving
+import thumbs
+
 # ====== 配置 ======
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DATABASE = os.path.join(BASE_DIR, 'app.db')
 UPLOAD_ROOT = os.path.join(BASE_DIR, 'uploads')
+RESUMABLE_ROOT = os.path.join(BASE_DIR, '.resumable')  # 分片上传暂存区
+THUMB_ROOT = os.path.join(BASE_DIR, '.thumbs')          # 缩略图缓存
+THUMB_MAX_BYTES = int(os.environ.get('THUMB_MAX_BYTES', 512 * 1024 * 1024))
+CACHE_DB = os.path.join(BASE_DIR, 'cache.db')          # 多 worker 共享缓存
+USER_CACHE_TTL = 300                                    # 登录用户身份缓存（秒）
 ALLOWED_EXT = {'png','jpg','jpeg','gif','mp4','mov','avi','mkv'}
 MAX_CONTENT_LENGTH = 200 * 1024 * 1024  # 200MB
 PER_PAGE = 5
+MAX_PER_PAGE = 100  # /api/user/<id>/media 单页上限
 
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
 
@@ -143,22 +158,40 @@ TEMPLATES = {
 {% block title %}我的面板{% endblock %}
 {% block body %}
 <h2>你好，{{ current_user.username }}</h2>
-<form method="post" enctype="multipart/form-data" class="mb-4">
+<form method="post" enctype="multipart/form-data" class="mb-4" id="upload-form">
   <div class="input-group">
     <input type="file" name="file" class="form-control" required>
     <button class="btn btn-success">上传</button>
   </div>
+  <div class="form-text" id="upload-progress"></div>
 </form>
-<h3>我的文件 (第 {{ page }}/{{ total_pages }} 页)</h3>
+<script src="{{ url_for('resumable.client_js') }}"></script>
+<script>
+// 大文件改走分片断点续传，不受单请求 200MB 上限限制
+document.getElementById('upload-form').addEventListener('submit', function(e){
+  const f = this.file.files[0];
+  if(!f || f.size <= 8 * 1024 * 1024) return;
+  e.preventDefault();
+  const bar = document.getElementById('upload-progress');
+  resumableUpload(f, '', {parallel: 4, onProgress: (done, total) =>
+      bar.textContent = '已上传 ' + Math.floor(done * 100 / total) + '%'})
+    .then(() => location.reload())
+    .catch(err => bar.textContent = '上传失败：' + err + '（重新选择同一文件可继续）');
+});
+</script>
+<h3>我的文件 (第 {{ page }} 页)</h3>
 <div class="row">
   {% for fn, mime, ts in files %}
   <div class="col-md-4 mb-4">
     <div class="card">
       {% if mime.startswith('image') %}
-        <img src="{{ url_for('uploaded_file', user_id=current_user.id, filename=fn) }}"
-             class="card-img-top">
+        <a href="{{ url_for('uploaded_file', user_id=current_user.id, filename=fn) }}" target="_blank">
+          <img src="{{ url_for('thumb', user_id=current_user.id, filename=fn) }}"
+               class="card-img-top" loading="lazy">
+        </a>
       {% elif mime.startswith('video') %}
-        <video class="w-100" controls>
+        <video class="w-100" controls preload="none"
+               poster="{{ url_for('thumb', user_id=current_user.id, filename=fn) }}">
           <source src="{{ url_for('uploaded_file', user_id=current_user.id, filename=fn) }}"
                   type="{{ mime }}">
         </video>
@@ -173,14 +206,14 @@ TEMPLATES = {
 </div>
 <nav>
   <ul class="pagination">
-    {% if page>1 %}
+    {% if has_prev %}
     <li class="page-item">
-      <a class="page-link" href="{{ url_for('dashboard',page=page-1) }}">上一页</a>
+      <a class="page-link" href="{{ url_for('dashboard',page=page-1,cursor=prev_cursor) }}">上一页</a>
     </li>
     {% endif %}
-    {% if page<total_pages %}
+    {% if has_next %}
     <li class="page-item">
-      <a class="page-link" href="{{ url_for('dashboard',page=page+1) }}">下一页</a>
+      <a class="page-link" href="{{ url_for('dashboard',page=page+1,cursor=next_cursor) }}">下一页</a>
     </li>
     {% endif %}
   </ul>
@@ -207,16 +240,19 @@ TEMPLATES = {
 {% block title %}用户：{{ profile_user.username }}{% endblock %}
 {% block body %}
 <h2>用户：{{ profile_user.username }}</h2>
-<h3>文件列表 (第 {{ page }}/{{ total_pages }} 页)</h3>
+<h3>文件列表 (第 {{ page }} 页)</h3>
 <div class="row">
   {% for fn, mime, ts in files %}
   <div class="col-md-4 mb-4">
     <div class="card">
       {% if mime.startswith('image') %}
-        <img src="{{ url_for('uploaded_file', user_id=profile_user.id, filename=fn) }}"
-             class="card-img-top">
+        <a href="{{ url_for('uploaded_file', user_id=profile_user.id, filename=fn) }}" target="_blank">
+          <img src="{{ url_for('thumb', user_id=profile_user.id, filename=fn) }}"
+               class="card-img-top" loading="lazy">
+        </a>
       {% elif mime.startswith('video') %}
-        <video class="w-100" controls>
+        <video class="w-100" controls preload="none"
+               poster="{{ url_for('thumb', user_id=profile_user.id, filename=fn) }}">
           <source src="{{ url_for('uploaded_file', user_id=profile_user.id, filename=fn) }}"
                   type="{{ mime }}">
         </video>
@@ -231,18 +267,18 @@ TEMPLATES = {
 </div>
 <nav>
   <ul class="pagination">
-    {% if page>1 %}
+    {% if has_prev %}
     <li class="page-item">
       <a class="page-link"
-         href="{{ url_for('profile',user_id=profile_user.id,page=page-1) }}">
+         href="{{ url_for('profile',user_id=profile_user.id,page=page-1,cursor=prev_cursor) }}">
         上一页
       </a>
     </li>
     {% endif %}
-    {% if page<total_pages %}
+    {% if has_next %}
     <li class="page-item">
       <a class="page-link"
-         href="{{ url_for('profile',user_id=profile_user.id,page=page+1) }}">
+         href="{{ url_for('profile',user_id=profile_user.id,page=page+1,cursor=next_cursor) }}">
         下一页
       </a>
     </li>
@@ -260,27 +296,22 @@ login.login_view = 'login_view'
 
 # ====== 用户模型 ======
 class User(UserMixin):
-    def __init__(self, uid, username, pwd_hash):
+    # 只带身份，不带密码哈希：User 会进共享缓存，哈希用到时再查库
+    def __init__(self, uid, username):
         self.id = uid
         self.username = username
-        self.pwd_hash = pwd_hash
 
     def check_password(self, pwd):
-        return hashlib.sha256(pwd.encode()).hexdigest() == self.pwd_hash
+        row = get_db().execute('SELECT pwd_hash FROM user WHERE id=?', (self.id,)).fetchone()
+        return bool(row) and hasher.verify(row['pwd_hash'], pwd)
 
 # ====== 数据库操作 ======
+# 每个进程一个连接池（WAL、busy_timeout、语句缓存），请求结束时自动归还
+db_pool = dbpool.ConnectionPool(DATABASE, app, detect_types=sqlite3.PARSE_DECLTYPES,
+                                foreign_keys=True)
+
 def get_db():
-    if not hasattr(g, 'db'):
-        conn = sqlite3.connect(app.config['DATABASE'], detect_types=sqlite3.PARSE_DECLTYPES)
-        conn.row_factory = sqlite3.Row
-        conn.execute('PRAGMA foreign_keys = ON;')
-        g.db = conn
-    return g.db
-
-@app.teardown_appcontext
-def close_db(exc):
-    if hasattr(g, 'db'):
-        g.db.close()
+    return db_pool.get()
 
 def init_db():
     schema = """
@@ -289,23 +320,61 @@ def init_db():
       username TEXT UNIQUE NOT NULL,
       pwd_hash TEXT NOT NULL
     );
+    -- 媒体目录：列表 / 分页直接查表，不再每次扫描用户目录
+    CREATE TABLE IF NOT EXISTS media (
+      user_id  INTEGER NOT NULL,
+      filename TEXT NOT NULL,
+      kind     TEXT NOT NULL,          -- image / video / other（MIME 大类）
+      mime     TEXT NOT NULL,
+      size     INTEGER NOT NULL,
+      mtime    REAL NOT NULL,
+      width    INTEGER,
+      height   INTEGER,
+      PRIMARY KEY (user_id, filename)
+    );
+    CREATE INDEX IF NOT EXISTS idx_media_user_mtime
+      ON media(user_id, mtime, filename);
+    CREATE INDEX IF NOT EXISTS idx_media_user_kind_mtime
+      ON media(user_id, kind, mtime, filename);
     """
     db = get_db()
+    fresh = db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='media'").fetchone() is None
     db.executescript(schema)
     db.commit()
+    if fresh:
+        # 首次建表：把已有的上传文件导入目录
+        reconcile_media()
 
 @app.before_first_request
 def setup():
     init_db()
 
+# 画廊一页会触发几十个缩略图 / 视频 Range 请求，每个都要 load_user，先查缓存
+user_cache = cache.from_env(CACHE_DB, ttl=USER_CACHE_TTL)
+
+def _user_key(uid):
+    # v2：旧格式的缓存项里带着密码哈希，换个键让它们直接作废
+    return 'gallery.user.v2:%s' % uid
+
+def forget_user(uid):
+    """修改密码 / 删除用户后调用，所有 worker 立即丢弃该用户的缓存身份"""
+    user_cache.invalidate(_user_key(uid))
+
+def _fetch_user(uid):
+    row = get_db().execute('SELECT id, username FROM user WHERE id=?', (uid,)).fetchone()
+    return tuple(row) if row else None
+
 @login.user_loader
 def load_user(user_id):
-    row = get_db().execute('SELECT * FROM user WHERE id=?', (user_id,)).fetchone()
-    return User(row['id'], row['username'], row['pwd_hash']) if row else None
+    row = user_cache.get_or_load(_user_key(user_id), lambda: _fetch_user(user_id))
+    return User(*row) if row else None
 
 # ====== 工具函数 ======
+# 密码哈希方案由 PASSWORD_SCHEME / PASSWORD_COST 配置；旧版的无盐 SHA-256 在登录时自动升级
+hasher = passwords.PasswordHasher.from_config(app.config)
+
 def hash_pwd(pwd):
-    return hashlib.sha256(pwd.encode()).hexdigest()
+    return hasher.generate(pwd)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXT
@@ -315,25 +384,147 @@ def get_user_folder(uid):
     os.makedirs(path, exist_ok=True)
     return path
 
-def list_files(uid):
-    folder = get_user_folder(uid)
-    entries = []
-    for fn in os.listdir(folder):
-        full = os.path.join(folder, fn)
-        if os.path.isfile(full):
-            mime = mimetypes.guess_type(fn)[0] or 'application/octet-stream'
-            ts = datetime.fromtimestamp(os.path.getmtime(full))\
-                   .strftime('%Y-%m-%d %H:%M:%S')
-            entries.append((fn, mime, ts))
-    entries.sort(key=lambda x: x[2], reverse=True)
-    return entries
-
-def paginate_list(items, page, per_page=PER_PAGE):
-    total = len(items)
-    total_pages = max(1, ceil(total / per_page))
-    page = max(1, min(page, total_pages))
-    start = (page - 1) * per_page
-    return items[start:start+per_page], total_pages
+# 分片断点续传：文件落到当前用户目录
+def resumable_target(path, filename):
+    if not allowed_file(filename):
+        raise ValueError('请选择合法的文件（图片/视频）')
+    return os.path.join(get_user_folder(current_user.id), secure_filename(filename))
+
+# 缩略图：后台线程池生成，磁盘缓存按 LRU 淘汰
+thumbnails = thumbs.ThumbnailCache(THUMB_ROOT, max_bytes=THUMB_MAX_BYTES)
+
+app.register_blueprint(resumable.create_blueprint(
+    resumable.ResumableStore(RESUMABLE_ROOT), resumable_target,
+    guard=login_required, owner=lambda: current_user.id,
+    on_complete=lambda dest: (catalog_file(current_user.id, dest),
+                              thumbnails.prefetch(dest, listing.guess_mime(dest)))))
+
+# ====== 媒体目录 ======
+def media_kind(mime):
+    kind = mime.split('/', 1)[0]
+    return kind if kind in ('image', 'video') else 'other'
+
+def catalog_file(uid, path, commit=True):
+    """上传完成 / 对账发现新文件时写入（或更新）media 表。"""
+    st = os.stat(path)
+    name = os.path.basename(path)
+    mime = listing.guess_mime(name)
+    width, height = thumbs.probe_size(path, mime)
+    db = get_db()
+    db.execute('INSERT OR REPLACE INTO media'
+               '(user_id, filename, kind, mime, size, mtime, width, height) '
+               'VALUES(?,?,?,?,?,?,?,?)',
+               (uid, name, media_kind(mime), mime, st.st_size, st.st_mtime, width, height))
+    if commit:
+        db.commit()
+
+def reconcile_media():
+    """以磁盘为准修正 media 表：补录新增 / 改动的文件，删除已不存在的记录。"""
+    db = get_db()
+    root = app.config['UPLOAD_ROOT']
+    stats = {'added': 0, 'updated': 0, 'removed': 0}
+    uids = {int(e.name) for e in listing.scan_dir(root, stat=False)
+            if e.is_dir and e.name.isdigit()}
+    uids.update(r[0] for r in db.execute('SELECT DISTINCT user_id FROM media'))
+    for uid in sorted(uids):
+        folder = os.path.join(root, str(uid))
+        on_disk = ({e.name: e for e in listing.scan_dir(folder, files_only=True)}
+                   if os.path.isdir(folder) else {})
+        known = {r['filename']: r for r in db.execute(
+            'SELECT filename, size, mtime FROM media WHERE user_id=?', (uid,))}
+        for name, e in on_disk.items():
+            r = known.get(name)
+            if r is None or r['size'] != e.size or r['mtime'] != e.mtime:
+                catalog_file(uid, os.path.join(folder, name), commit=False)
+                stats['added' if r is None else 'updated'] += 1
+        for name in known.keys() - on_disk.keys():
+            db.execute('DELETE FROM media WHERE user_id=? AND filename=?', (uid, name))
+            stats['removed'] += 1
+    db.commit()
+    return stats
+
+def encode_cursor(row, direction):
+    """
+    把 (方向, mtime, filename) 编码成不透明的游标字符串。
+    direction 为 'after'（取排在 row 之后的一页）或 'before'（之前的一页）。
+    """
+    raw = json.dumps([direction, row['mtime'], row['filename']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """返回 (after, before)，其中之一为排序键 (mtime, filename)；无效游标返回 (None, None)。"""
+    if not cursor:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, mtime, filename = json.loads(raw.decode('utf-8'))
+        key = (float(mtime), str(filename))
+    except (ValueError, TypeError):
+        return None, None
+    if direction == 'after':
+        return key, None
+    if direction == 'before':
+        return None, key
+    return None, None
+
+def count_media(uid, kind=None):
+    if kind:
+        return get_db().execute('SELECT COUNT(*) FROM media WHERE user_id=? AND kind=?',
+                                (uid, kind)).fetchone()[0]
+    return get_db().execute('SELECT COUNT(*) FROM media WHERE user_id=?',
+                            (uid,)).fetchone()[0]
+
+def media_page(uid, kind=None, limit=PER_PAGE, after=None, before=None, offset=0):
+    """
+    按 (mtime, filename) 倒序取一页。
+    after / before 为相邻页边界行的排序键：走 (user_id[, kind], mtime, filename) 索引
+    的范围扫描（keyset），代价只与页大小有关；都不给时才用 OFFSET（直接跳页）。
+    """
+    where, args = ['user_id=?'], [uid]
+    if kind:
+        where.append('kind=?')
+        args.append(kind)
+    order = 'DESC'
+    if after:
+        where.append('(mtime, filename) < (?, ?)')
+        args += list(after)
+        offset = 0
+    elif before:
+        where.append('(mtime, filename) > (?, ?)')
+        args += list(before)
+        order, offset = 'ASC', 0
+    rows = get_db().execute(
+        'SELECT filename, mime, size, mtime, width, height FROM media '
+        'WHERE %s ORDER BY mtime %s, filename %s LIMIT ? OFFSET ?'
+        % (' AND '.join(where), order, order),
+        args + [limit, offset]).fetchall()
+    if before:
+        rows.reverse()
+    return rows
+
+def format_ts(mtime):
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+def gallery_page(uid, page):
+    """
+    dashboard / profile 共用：上一页 / 下一页链接带游标，翻页不做 OFFSET 扫描。
+    不统计总数（COUNT(*) 要扫该用户的全部行）：多取一条判断是否还有下一页。
+    """
+    page = max(1, page)
+    after, before = decode_cursor(request.args.get('cursor'))
+    rows = media_page(uid, limit=PER_PAGE + 1, after=after, before=before,
+                      offset=(page - 1) * PER_PAGE)
+    more = len(rows) > PER_PAGE
+    if before:
+        rows = rows[1:] if more else rows
+        has_next, has_prev = True, more
+    else:
+        rows = rows[:PER_PAGE]
+        has_next, has_prev = more, page > 1
+    files = [(r['filename'], r['mime'], format_ts(r['mtime'])) for r in rows]
+    return dict(files=files, page=page, has_next=has_next, has_prev=has_prev,
+                next_cursor=encode_cursor(rows[-1], 'after') if rows else None,
+                prev_cursor=encode_cursor(rows[0], 'before') if rows else None)
 
 # ====== 路由：Web 前端 ======
 @app.route('/')
@@ -364,9 +555,15 @@ def login_view():
     if request.method == 'POST':
         u = request.form.get('username','').strip()
         p = request.form.get('password','')
-        row = get_db().execute('SELECT * FROM user WHERE username=?', (u,)).fetchone()
-        if row and hash_pwd(p) == row['pwd_hash']:
-            login_user(User(row['id'], row['username'], row['pwd_hash']))
+        db = get_db()
+        row = db.execute('SELECT * FROM user WHERE username=?', (u,)).fetchone()
+        ok, new_hash = hasher.check(row['pwd_hash'], p) if row else (False, None)
+        if ok:
+            if new_hash:
+                db.execute('UPDATE user SET pwd_hash=? WHERE id=?', (new_hash, row['id']))
+                db.commit()
+                forget_user(row['id'])
+            login_user(User(row['id'], row['username']))
             return redirect(url_for('dashboard'))
         flash('用户名或密码错误')
     return render_template('login.html')
@@ -384,15 +581,15 @@ def dashboard():
         f = request.files.get('file')
         if f and allowed_file(f.filename):
             fn = secure_filename(f.filename)
-            f.save(os.path.join(get_user_folder(current_user.id), fn))
+            dest = os.path.join(get_user_folder(current_user.id), fn)
+            f.save(dest)
+            catalog_file(current_user.id, dest)
+            thumbnails.prefetch(dest, listing.guess_mime(fn))
             flash('上传成功')
             return redirect(url_for('dashboard'))
         flash('请选择合法的文件（图片/视频）')
     page = request.args.get('page', 1, type=int)
-    allf = list_files(current_user.id)
-    files, total_pages = paginate_list(allf, page)
-    return render_template('dashboard.html',
-                           files=files, page=page, total_pages=total_pages)
+    return render_template('dashboard.html', **gallery_page(current_user.id, page))
 
 @app.route('/search', methods=['GET','POST'])
 @login_required
@@ -413,50 +610,106 @@ def profile(user_id):
         flash('用户不存在')
         return redirect(url_for('search'))
     page = request.args.get('page', 1, type=int)
-    allf = list_files(user_id)
-    files, total_pages = paginate_list(allf, page)
     return render_template('profile.html',
-                           profile_user=row,
-                           files=files, page=page, total_pages=total_pages)
+                           profile_user=row, **gallery_page(user_id, page))
 
 # ====== 路由：安全文件访问 ======
 @app.route('/uploads/<int:user_id>/<path:filename>')
 def uploaded_file(user_id, filename):
     folder = get_user_folder(user_id)
     full = safe_join(folder, filename)
+    if not full:
+        abort(404)
+    # 该路由本身不要求登录，允许共享缓存
+    return serving.send_path(full, private=False)
+
+@app.route('/thumb/<int:user_id>/<path:filename>')
+def thumb(user_id, filename):
+    full = safe_join(get_user_folder(user_id), filename)
     if not full or not os.path.isfile(full):
         abort(404)
-    return send_from_directory(folder, filename)
+    mime = listing.guess_mime(full)
+    out = thumbnails.get(full, mime)
+    if out is None:
+        # 无法生成（缺少 Pillow / ffmpeg 或文件损坏）：图片回退原图，视频不显示封面
+        if mime.startswith('image'):
+            return redirect(url_for('uploaded_file', user_id=user_id, filename=filename))
+        abort(404)
+    return serving.send_path(out, mimetype=thumbnails.mimetype(out), private=False)
+
+@app.route('/cache-stats')
+@login_required
+def cache_stats():
+    # users.misses 为 load_user 实际查库次数，hits 为省下的查询
+    return jsonify(users=user_cache.stats())
 
 # ====== 路由：公开 API ======
 @app.route('/api/user/<int:user_id>/media', methods=['GET'])
 def api_user_media(user_id):
-    if not get_db().execute('SELECT 1 FROM user WHERE id=?', (user_id,)).fetchone():
+    """
+    两种分页方式：
+      ?page=N&per_page=M          页码分页（兼容旧客户端，深页需要 OFFSET 扫描）
+      ?cursor=&per_page=M         游标分页：首页传空 cursor，之后传响应里的 next / prev；
+                                  按 (mtime, filename) 定位，代价与页码无关，
+                                  翻页期间有新上传也不会重复或漏掉条目
+    per_page 最大为 MAX_PER_PAGE。
+    """
+    if load_user(user_id) is None:
         return jsonify({"error":"User not found"}), 404
-    page     = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
     mtype    = request.args.get('type', 'all').lower()
+    kind = mtype if mtype in ('image','video') else None
 
-    allf = list_files(user_id)
-    if mtype in ('image','video'):
-        allf = [f for f in allf if f[1].startswith(mtype)]
-    total = len(allf)
+    def serialize(rows):
+        items = []
+        for r in rows:
+            fn = r['filename']
+            items.append({
+              "filename": fn,
+              "mime": r['mime'],
+              "timestamp": format_ts(r['mtime']),
+              "size": r['size'],
+              "width": r['width'],
+              "height": r['height'],
+              "url": url_for('uploaded_file',
+                             user_id=user_id,
+                             filename=fn,
+                             _external=True),
+              "thumbnail": url_for('thumb',
+                                   user_id=user_id,
+                                   filename=fn,
+                                   _external=True)
+            })
+        return items
+
+    if 'cursor' in request.args:
+        cursor = request.args.get('cursor')
+        after, before = decode_cursor(cursor)
+        if cursor and not (after or before):
+            return jsonify({"error":"Invalid cursor"}), 400
+        # 多取一条判断该方向上是否还有下一页
+        rows = media_page(user_id, kind, limit=per_page + 1, after=after, before=before)
+        more = len(rows) > per_page
+        if before:
+            rows = rows[1:] if more else rows
+            has_next, has_prev = True, more
+        else:
+            rows = rows[:per_page]
+            has_next, has_prev = more, after is not None
+        return jsonify({
+          "user_id": user_id,
+          "per_page": per_page,
+          "next": encode_cursor(rows[-1], 'after') if rows and has_next else None,
+          "prev": encode_cursor(rows[0], 'before') if rows and has_prev else None,
+          "items": serialize(rows)
+        })
+
+    page = request.args.get('page', 1, type=int)
+    total = count_media(user_id, kind)
     total_pages = max(1, ceil(total / per_page))
     page = max(1, min(page, total_pages))
-    start = (page-1)*per_page
-    slice_ = allf[start:start+per_page]
-
-    items = []
-    for fn, mime, ts in slice_:
-        items.append({
-          "filename": fn,
-          "mime": mime,
-          "timestamp": ts,
-          "url": url_for('uploaded_file',
-                         user_id=user_id,
-                         filename=fn,
-                         _external=True)
-        })
+    rows = media_page(user_id, kind, limit=per_page, offset=(page-1)*per_page)
 
     return jsonify({
       "user_id": user_id,
@@ -464,9 +717,18 @@ def api_user_media(user_id):
       "per_page": per_page,
       "total": total,
       "total_pages": total_pages,
-      "items": items
+      "items": serialize(rows)
     })
 
+# ====== 命令行 ======
+# 文件在应用之外被增删改后，重新对账 media 表：
+#   FLASK_APP=图文.py flask reconcile-media
+@app.cli.command('reconcile-media')
+def reconcile_media_command():
+    init_db()
+    stats = reconcile_media()
+    click.echo('added={added} updated={updated} removed={removed}'.format(**stats))
+
 # ====== 启动 ======
 if __name__ == '__main__':
     app.run(debug=True)